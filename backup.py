@@ -9,8 +9,17 @@ import datetime
 import threading
 import time
 import json
+import gzip
+import hashlib
+import sqlite3
+import contextlib
 from pathlib import Path
 
+from db import event_partition_dir, log_archive_dir, reset_log_search
+
+# Serializa cópias, envio de alterações e restaurações sobre o mesmo banco
+_operation_lock = threading.RLock()
+
 class BackupManager:
     def __init__(self, db_file="ponto.db", backup_dir="backups"):
         """
@@ -53,10 +62,12 @@ class BackupManager:
             }
     
     def _save_metadata(self, metadata):
-        """Salva o arquivo de metadados"""
+        """Salva o arquivo de metadados (gravação atômica via arquivo temporário)"""
         try:
-            with open(self.backup_metadata, 'w', encoding='utf-8') as f:
+            tmp_path = self.backup_metadata + ".tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
                 json.dump(metadata, f, indent=2, ensure_ascii=False)
+            os.replace(tmp_path, self.backup_metadata)
         except Exception as e:
             print(f"Erro ao salvar metadados de backup: {e}")
     
@@ -93,6 +104,17 @@ class BackupManager:
         except Exception as e:
             return False, f"Erro ao verificar arquivo: {str(e)}"
     
+    def _read_wal_seq(self, backup_path):
+        """Retorna a última sequência de alterações contida no backup (para PITR)"""
+        try:
+            conn = sqlite3.connect(backup_path)
+            try:
+                return WalArchiver.read_high_water(conn)
+            finally:
+                conn.close()
+        except sqlite3.Error:
+            return None
+    
     def create_backup(self, backup_type='daily'):
         """
         Cria um backup do banco de dados
@@ -111,48 +133,66 @@ class BackupManager:
         backup_path = os.path.join(self.backup_dir, backup_filename)
         
         try:
-            # Fechar qualquer conexão aberta para garantir flush
-            import sqlite3
-            try:
-                conn = sqlite3.connect(self.db_file)
-                conn.execute("PRAGMA wal_checkpoint(RESTART)")
-                conn.close()
-            except:
-                pass  # Se falhar, continua mesmo assim
-            
-            # Aguardar um pouco para garantir flush
-            import time
-            time.sleep(0.5)
+            started = time.perf_counter()
             
-            # Copiar arquivo com shutil.copy2 para preservar metadados
-            shutil.copy2(self.db_file, backup_path)
-            
-            # Aguardar outro pouco para garantir que arquivo foi escrito
-            time.sleep(0.3)
+            # Cópia consistente pela API de backup (inclui o WAL, sem checkpoint
+            # bloqueante); a sonda mede quanto um registro de ponto esperaria
+            with _operation_lock, WriterStallProbe(self.db_file) as probe:
+                pages = self._copy_database(self.db_file, backup_path, pages=-1)
+            copy_s = time.perf_counter() - started
             
             # Verificar integridade
+            verify_started = time.perf_counter()
             valid, msg = self._verify_backup_integrity(backup_path)
+            verify_s = time.perf_counter() - verify_started
             if not valid:
                 print(f"⚠️  Aviso: {msg}, mas backup será mantido")
                 # Não remover arquivo mesmo com aviso, pois pode ser válido
             
-            # Atualizar metadados
-            metadata = self._load_metadata()
-            backup_info = {
-                'filename': backup_filename,
-                'type': backup_type,
-                'timestamp': datetime.datetime.now().isoformat(),
-                'size_bytes': os.path.getsize(backup_path)
-            }
-            metadata['backups'].append(backup_info)
-            metadata['last_backup'] = datetime.datetime.now().isoformat()
+            # Partições de eventos e de logs: copiadas uma única vez (somente leitura)
+            partitions_copied = self._backup_event_partitions()
+            log_partitions_copied = self._backup_log_partitions()
             
-            if backup_type == 'weekly':
-                metadata['last_weekly_backup'] = datetime.datetime.now().isoformat()
+            backup_bytes = os.path.getsize(backup_path)
+            metrics = {
+                'duration_s': round(time.perf_counter() - started, 3),
+                'copy_s': round(copy_s, 3),
+                'verify_s': round(verify_s, 3),
+                'bytes': backup_bytes,
+                'mb_per_s': _throughput(backup_bytes, copy_s),
+                'pages': pages,
+                'writer_stall_ms': probe.max_stall_ms,
+                'writer_probes': len(probe.samples),
+                'event_partitions_copied': partitions_copied,
+                'log_partitions_copied': log_partitions_copied
+            }
             
-            self._save_metadata(metadata)
+            # Atualizar metadados
+            with _operation_lock:
+                metadata = self._load_metadata()
+                backup_info = {
+                    'filename': backup_filename,
+                    'type': backup_type,
+                    'timestamp': datetime.datetime.now().isoformat(),
+                    'size_bytes': backup_bytes,
+                    'wal_seq': self._read_wal_seq(backup_path),
+                    'metrics': metrics
+                }
+                metadata['backups'].append(backup_info)
+                metadata['last_backup'] = datetime.datetime.now().isoformat()
+                
+                if backup_type == 'weekly':
+                    metadata['last_weekly_backup'] = datetime.datetime.now().isoformat()
+                
+                # Última execução por tipo (sobrevive à limpeza do catálogo)
+                metadata.setdefault('last_runs', {})[backup_type] = backup_info['timestamp']
+                
+                self._append_run(metadata, 'backup', metrics, backup_type=backup_type)
+                self._save_metadata(metadata)
             
-            print(f"✓ Backup criado com sucesso: {backup_filename}")
+            print(f"✓ Backup criado com sucesso: {backup_filename} "
+                  f"({metrics['duration_s']}s, {metrics['mb_per_s']} MB/s, "
+                  f"pausa de escrita {metrics['writer_stall_ms']} ms)")
             return True, backup_path, f"Backup {backup_type} criado: {backup_filename}"
             
         except Exception as e:
@@ -165,65 +205,261 @@ class BackupManager:
                     pass
             return False, None, f"Erro ao criar backup: {str(e)}"
     
-    def cleanup_old_backups(self, keep_daily=14, keep_weekly=12):
+    def _backup_event_partitions(self):
+        """
+        Copia para backups/arquivo/ as partições de eventos ainda sem cópia
+        (as cópias são mantidas mesmo que o ano seja removido do banco)
+        Retorna: número de partições copiadas
+        """
+        return self._backup_partitions(
+            'SELECT ano, arquivo, checksum FROM particoes_eventos',
+            event_partition_dir(self.db_file), os.path.join(self.backup_dir, "arquivo"),
+            'event_partitions', 'eventos', prune=False)
+    
+    def _backup_log_partitions(self):
+        """
+        Copia para backups/arquivo/logs/ as partições mensais de logs ainda sem
+        cópia (as já descartadas pela retenção saem do backup)
+        Retorna: número de partições copiadas
+        """
+        return self._backup_partitions(
+            'SELECT mes, arquivo, checksum FROM particoes_logs WHERE arquivo IS NOT NULL',
+            log_archive_dir(self.db_file), os.path.join(self.backup_dir, "arquivo", "logs"),
+            'log_partitions', 'logs')
+    
+    def _backup_partitions(self, query, source_dir, dest_dir, metadata_key, label, prune=True):
         """
-        Remove backups antigos mantendo apenas os mais recentes
+        Copia para dest_dir as partições registradas (query retorna chave,
+        arquivo e checksum) ainda sem cópia
         
-        Parâmetros:
-        - keep_daily: número de backups diários a manter
-        - keep_weekly: número de backups semanais a manter
+        As partições não mudam depois de criadas, então cada uma é copiada
+        (e conferida) uma única vez, e não a cada backup diário. Com prune,
+        cópias de partições que saíram do registro são removidas.
+        Retorna: número de partições copiadas
+        """
+        try:
+            conn = sqlite3.connect(self.db_file)
+            try:
+                partitions = conn.execute(query).fetchall()
+            finally:
+                conn.close()
+        except sqlite3.Error:
+            return 0  # banco sem partições
         
-        Retorna: número de backups removidos
+        os.makedirs(dest_dir, exist_ok=True)
+        
+        with _operation_lock:
+            metadata = self._load_metadata()
+            copies = metadata.setdefault(metadata_key, {})
+            copied = 0
+            registered = set()
+            
+            for key, filename, checksum in partitions:
+                registered.add(str(key))
+                dst = os.path.join(dest_dir, filename)
+                entry = copies.get(str(key))
+                if entry and entry.get('checksum') == checksum and os.path.exists(dst):
+                    continue
+                src = os.path.join(source_dir, filename)
+                try:
+                    tmp = dst + ".tmp"
+                    shutil.copyfile(src, tmp)
+                    digest = _file_sha256(tmp)
+                    if digest != _file_sha256(src):
+                        os.remove(tmp)
+                        print(f"⚠️  Cópia da partição {filename} divergente; nova tentativa no próximo backup")
+                        continue
+                    os.replace(tmp, dst)
+                except OSError as e:
+                    print(f"Erro ao copiar partição {filename}: {e}")
+                    continue
+                copies[str(key)] = {
+                    'filename': filename,
+                    'checksum': checksum,
+                    'sha256': digest,
+                    'size_bytes': os.path.getsize(dst),
+                    'copied_at': datetime.datetime.now().isoformat()
+                }
+                copied += 1
+            
+            for key in [k for k in copies if prune and k not in registered]:
+                try:
+                    os.remove(os.path.join(dest_dir, copies[key]['filename']))
+                except FileNotFoundError:
+                    pass
+                except OSError as e:
+                    print(f"Erro ao remover cópia da partição {copies[key]['filename']}: {e}")
+                    continue
+                del copies[key]
+            
+            self._save_metadata(metadata)
+        
+        if copied:
+            print(f"✓ {copied} partição(ões) de {label} copiada(s) para {dest_dir}")
+        return copied
+    
+    # Número máximo de execuções mantidas no histórico de métricas
+    MAX_RUN_HISTORY = 200
+    
+    def _append_run(self, metadata, operation, metrics, **extra):
+        """Registra as métricas de uma execução no histórico do catálogo"""
+        run = {'operation': operation, 'timestamp': datetime.datetime.now().isoformat()}
+        run.update(extra)
+        run.update(metrics)
+        runs = metadata.setdefault('runs', [])
+        runs.append(run)
+        del runs[:-self.MAX_RUN_HISTORY]
+    
+    def record_run(self, operation, metrics, **extra):
+        """Grava no catálogo as métricas de uma operação (limpeza, restauração, ...)"""
+        with _operation_lock:
+            metadata = self._load_metadata()
+            self._append_run(metadata, operation, metrics, **extra)
+            self._save_metadata(metadata)
+    
+    def get_run_metrics(self, operation=None, limit=20):
+        """Retorna as métricas das últimas execuções (mais recentes primeiro)"""
+        runs = self._load_metadata().get('runs', [])
+        if operation:
+            runs = [r for r in runs if r.get('operation') == operation]
+        return list(reversed(runs[-limit:]))
+    
+    def get_retention_policy(self):
+        """Retorna a política de retenção configurada (persistida no catálogo)"""
+        data = self._load_metadata().get('retention_policy')
+        if data:
+            return RetentionPolicy.from_dict(data)
+        return DEFAULT_RETENTION_POLICY
+    
+    def set_retention_policy(self, policy):
+        """Persiste a política de retenção no catálogo de backups"""
+        with _operation_lock:
+            metadata = self._load_metadata()
+            metadata['retention_policy'] = policy.to_dict()
+            self._save_metadata(metadata)
+    
+    def plan_retention(self, policy=None):
         """
-        metadata = self._load_metadata()
-        backups = metadata.get('backups', [])
+        Simula a retenção (dry-run): retorna o plano sem remover nenhum arquivo
+        """
+        if policy is None:
+            policy = self.get_retention_policy()
+        return policy.plan(self._load_metadata().get('backups', []))
+    
+    def apply_retention(self, policy=None, background=False, on_done=None, plan=None):
+        """
+        Aplica a política de retenção
         
-        if not backups:
-            return 0
+        O catálogo é atualizado primeiro (sob o lock de operações) e os
+        arquivos são removidos depois, opcionalmente em segundo plano.
         
-        # Separar por tipo
-        daily_backups = [b for b in backups if b['type'] == 'daily']
-        weekly_backups = [b for b in backups if b['type'] == 'weekly']
+        Parâmetros:
+        - policy: RetentionPolicy (padrão: política configurada)
+        - background: se True, remove os arquivos em thread separada
+        - on_done: callback opcional chamado com o número de backups removidos
+        - plan: plano já exibido ao usuário (plan_retention); quando informado,
+          remove exatamente esses backups, sem recalcular a política (backups
+          que já saíram do catálogo são ignorados)
         
-        removed_count = 0
+        Retorna: plano aplicado (dict de plan_retention); em modo síncrono
+        inclui 'removed' com o número de arquivos removidos
+        """
+        if policy is None and plan is None:
+            policy = self.get_retention_policy()
         
-        # Remover backups diários antigos
-        if len(daily_backups) > keep_daily:
-            # Ordenar por timestamp (mais recentes primeiro)
-            daily_backups.sort(key=lambda x: x['timestamp'], reverse=True)
-            
-            # Remover os mais antigos
-            for backup in daily_backups[keep_daily:]:
-                backup_path = os.path.join(self.backup_dir, backup['filename'])
-                try:
-                    if os.path.exists(backup_path):
-                        os.remove(backup_path)
-                        removed_count += 1
-                        print(f"✓ Backup removido: {backup['filename']}")
-                except Exception as e:
-                    print(f"Erro ao remover backup {backup['filename']}: {e}")
+        with _operation_lock:
+            metadata = self._load_metadata()
+            if plan is None:
+                plan = policy.plan(metadata.get('backups', []))
+            else:
+                cataloged = {b['filename'] for b in metadata.get('backups', [])}
+                plan = dict(plan, delete=[b for b in plan['delete'] if b['filename'] in cataloged])
+            doomed = {b['filename'] for b in plan['delete']}
+            if doomed:
+                metadata['backups'] = [b for b in metadata.get('backups', [])
+                                       if b['filename'] not in doomed]
+                self._save_metadata(metadata)
         
-        # Remover backups semanais antigos
-        if len(weekly_backups) > keep_weekly:
-            weekly_backups.sort(key=lambda x: x['timestamp'], reverse=True)
-            
-            for backup in weekly_backups[keep_weekly:]:
+        def remove_files():
+            started = time.perf_counter()
+            removed = 0
+            freed = 0
+            for backup in plan['delete']:
                 backup_path = os.path.join(self.backup_dir, backup['filename'])
                 try:
                     if os.path.exists(backup_path):
+                        size = os.path.getsize(backup_path)
                         os.remove(backup_path)
-                        removed_count += 1
-                        print(f"✓ Backup removido: {backup['filename']}")
+                        removed += 1
+                        freed += size
+                        print(f"✓ Backup removido: {backup['filename']} ({', '.join(backup['reasons'])})")
                 except Exception as e:
                     print(f"Erro ao remover backup {backup['filename']}: {e}")
+            if plan['delete']:
+                self.record_run('cleanup', {
+                    'duration_s': round(time.perf_counter() - started, 3),
+                    'bytes': freed,
+                    'files': removed
+                })
+            if on_done:
+                on_done(removed)
+            return removed
         
-        # Atualizar metadados removendo referências
-        metadata['backups'] = [b for b in backups 
-                               if (b['type'] == 'daily' and b in daily_backups[:keep_daily]) or
-                                  (b['type'] == 'weekly' and b in weekly_backups[:keep_weekly])]
-        self._save_metadata(metadata)
+        if background:
+            threading.Thread(daemon=True, target=remove_files).start()
+        else:
+            plan['removed'] = remove_files()
+        return plan
+    
+    def cleanup_old_backups(self, keep_daily=None, keep_weekly=None, policy=None):
+        """
+        Remove backups antigos segundo a política de retenção
+        
+        Parâmetros:
+        - keep_daily: número de dias mantidos (sobrescreve a política)
+        - keep_weekly: número de semanas mantidas (sobrescreve a política)
+        - policy: RetentionPolicy completa (padrão: política configurada)
         
-        return removed_count
+        Retorna: número de backups removidos
+        """
+        if policy is None:
+            policy = self.get_retention_policy()
+            if keep_daily is not None or keep_weekly is not None:
+                data = policy.to_dict()
+                if keep_daily is not None:
+                    data['daily'] = keep_daily
+                if keep_weekly is not None:
+                    data['weekly'] = keep_weekly
+                policy = RetentionPolicy.from_dict(data)
+        
+        return self.apply_retention(policy)['removed']
+    
+    def get_last_backup_time(self, backup_type):
+        """
+        Retorna o datetime do último backup bem-sucedido do tipo informado,
+        consultando o catálogo persistido (ou None se nunca houve backup)
+        """
+        metadata = self._load_metadata()
+        candidates = []
+        
+        last_run = metadata.get('last_runs', {}).get(backup_type)
+        if last_run:
+            candidates.append(last_run)
+        
+        # Compatibilidade com catálogos gravados antes de 'last_runs'
+        if backup_type == 'weekly' and metadata.get('last_weekly_backup'):
+            candidates.append(metadata['last_weekly_backup'])
+        candidates.extend(b['timestamp'] for b in metadata.get('backups', [])
+                          if b.get('type') == backup_type)
+        
+        parsed = []
+        for value in candidates:
+            try:
+                parsed.append(datetime.datetime.fromisoformat(value))
+            except (TypeError, ValueError):
+                continue
+        
+        return max(parsed) if parsed else None
     
     def get_backup_info(self):
         """Retorna informações sobre os backups existentes"""
@@ -234,7 +470,8 @@ class BackupManager:
             'total_backups': len(backups),
             'last_backup': metadata.get('last_backup'),
             'last_weekly_backup': metadata.get('last_weekly_backup'),
-            'backups': []
+            'backups': [],
+            'runs': self.get_run_metrics()
         }
         
         for backup in sorted(backups, key=lambda x: x['timestamp'], reverse=True):
@@ -243,17 +480,94 @@ class BackupManager:
                 'filename': backup['filename'],
                 'type': backup['type'],
                 'timestamp': backup['timestamp'],
-                'size_mb': round(size_mb, 2)
+                'size_mb': round(size_mb, 2),
+                'metrics': backup.get('metrics')
             })
         
         return info
     
-    def restore_backup(self, backup_filename):
+    def _copy_database(self, src_path, dst_path, pages=1024):
+        """
+        Copia um banco SQLite consistente usando a API de backup do SQLite
+        (funciona com o banco em uso e inclui o conteúdo ainda no WAL).
+        A cópia é gravada em modo de journal DELETE para ser um arquivo único.
+        Retorna: número de páginas copiadas
+        """
+        src = sqlite3.connect(src_path, timeout=10)
+        try:
+            dst = sqlite3.connect(dst_path)
+            try:
+                src.backup(dst, pages=pages)
+                dst.execute("PRAGMA journal_mode=DELETE")
+                return dst.execute("PRAGMA page_count").fetchone()[0]
+            finally:
+                dst.close()
+        finally:
+            src.close()
+    
+    def _check_database_image(self, path):
+        """
+        Executa PRAGMA integrity_check em um arquivo de banco
+        Retorna: (válido: bool, mensagem: str)
         """
-        Restaura um backup específico
+        try:
+            conn = sqlite3.connect(f"file:{Path(path).as_posix()}?mode=ro", uri=True)
+            try:
+                result = conn.execute("PRAGMA integrity_check").fetchone()[0]
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            return False, f"Erro ao verificar imagem restaurada: {str(e)}"
+        
+        if result != 'ok':
+            return False, f"Imagem restaurada corrompida: {result}"
+        return True, "Imagem íntegra"
+    
+    def _remove_wal_files(self):
+        """Remove arquivos -wal/-shm remanescentes do banco ativo"""
+        for suffix in ("-wal", "-shm"):
+            path = self.db_file + suffix
+            if os.path.exists(path):
+                os.remove(path)
+    
+    @staticmethod
+    def _carry_change_capture(image_path, high_water):
+        """
+        Mantém o arquivamento contínuo (PITR) na imagem a restaurar: o backup
+        pode ser anterior aos gatilhos de captura ou à numeração atual, então
+        os gatilhos são reinstalados e a sequência continua depois de
+        high_water (tudo até ele já foi enviado ao arquivo de lotes)
+        """
+        conn = sqlite3.connect(image_path)
+        try:
+            table = WalArchiver.CHANGES_TABLE
+            seq = max(high_water, WalArchiver.read_high_water(conn))
+            WalArchiver.install_change_capture(conn)
+            conn.execute(f'DELETE FROM {table}')
+            conn.execute('DELETE FROM sqlite_sequence WHERE name=?', (table,))
+            conn.execute('INSERT INTO sqlite_sequence (name, seq) VALUES (?, ?)', (table, seq))
+            conn.commit()
+        finally:
+            conn.close()
+    
+    def restore_backup(self, backup_filename, quiesce=None):
+        """
+        Restaura um backup específico sem reiniciar a aplicação
+        
+        Etapas:
+        1. Grava a imagem restaurada em arquivo temporário via API de backup
+        2. Verifica a integridade da imagem temporária
+        3. Drena as conexões (quiesce), salva o banco atual e faz checkpoint do WAL;
+           com o arquivamento contínuo ativo, envia as alterações pendentes e
+           reinstala a captura na imagem
+        4. Troca o arquivo com rename atômico e remove os arquivos -wal/-shm
+        5. Libera novamente as conexões; com o arquivamento ativo, registra o
+           início da nova linha do tempo e cria um backup completo dela
         
         Parâmetros:
         - backup_filename: nome do arquivo de backup a restaurar
+        - quiesce: fábrica de context manager que drena as conexões da
+          aplicação durante a troca (ex: db.quiesced)
         
         Retorna: (sucesso: bool, mensagem: str)
         """
@@ -267,40 +581,424 @@ class BackupManager:
         if not valid:
             return False, f"Backup inválido: {msg}"
         
+        db_dir = os.path.dirname(os.path.abspath(self.db_file))
+        tmp_path = os.path.join(db_dir, os.path.basename(self.db_file) + ".restore-tmp")
+        
+        high_water = None
         try:
-            # Criar backup do banco atual antes de restaurar
-            if os.path.exists(self.db_file):
-                timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-                old_db_backup = f"ponto_old_{timestamp}.db"
-                old_db_path = os.path.join(self.backup_dir, old_db_backup)
-                shutil.copy2(self.db_file, old_db_path)
-                print(f"✓ Backup do banco atual criado: {old_db_backup}")
+            started = time.perf_counter()
+            
+            # Preparar a imagem fora da janela de indisponibilidade
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            pages = self._copy_database(backup_path, tmp_path)
+            image_bytes = os.path.getsize(tmp_path)
+            
+            valid, msg = self._check_database_image(tmp_path)
+            if not valid:
+                os.remove(tmp_path)
+                return False, msg
+            
+            prepare_s = time.perf_counter() - started
+            
+            with (quiesce() if quiesce else contextlib.nullcontext()):
+                downtime_started = time.perf_counter()
+                with _operation_lock:
+                    if os.path.exists(self.db_file):
+                        # Criar backup do banco atual antes de restaurar
+                        timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+                        old_db_backup = f"ponto_old_{timestamp}.db"
+                        old_db_path = os.path.join(self.backup_dir, old_db_backup)
+                        self._copy_database(self.db_file, old_db_path)
+                        print(f"✓ Backup do banco atual criado: {old_db_backup}")
+                        
+                        conn = sqlite3.connect(self.db_file, timeout=10)
+                        try:
+                            if WalArchiver._has_change_capture(conn):
+                                # Alterações ainda não enviadas só existem no banco atual
+                                WalArchiver(self).ship_changes()
+                                high_water = WalArchiver.read_high_water(conn)
+                            # Esvaziar o WAL: frames antigos não podem ser aplicados à nova imagem
+                            conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+                        finally:
+                            conn.close()
+                        if high_water is not None:
+                            self._carry_change_capture(tmp_path, high_water)
+                    
+                    self._remove_wal_files()
+                    os.replace(tmp_path, self.db_file)
+                    _fsync_dir(db_dir)
+                    
+                    if high_water is not None:
+                        # Lotes até high_water são da linha do tempo abandonada:
+                        # nenhum backup anterior a este ponto pode ser usado no PITR
+                        metadata = self._load_metadata()
+                        metadata.setdefault('restores', []).append({
+                            'timestamp': datetime.datetime.now().isoformat(),
+                            'wal_seq': high_water,
+                            'filename': backup_filename
+                        })
+                        self._save_metadata(metadata)
+                downtime_s = time.perf_counter() - downtime_started
             
-            # Restaurar o backup
-            shutil.copy2(backup_path, self.db_file)
+            if high_water is not None:
+                # Base para o PITR da nova linha do tempo
+                success, _, base_msg = self.create_backup('restore')
+                if not success:
+                    print(f"⚠️  Backup pós-restauração não criado: {base_msg}")
+            
+            self.record_run('restore', {
+                'duration_s': round(time.perf_counter() - started, 3),
+                'prepare_s': round(prepare_s, 3),
+                'downtime_s': round(downtime_s, 3),
+                'bytes': image_bytes,
+                'mb_per_s': _throughput(image_bytes, prepare_s),
+                'pages': pages
+            }, filename=backup_filename)
             
             print(f"✓ Banco de dados restaurado de: {backup_filename}")
             return True, f"Banco de dados restaurado com sucesso de {backup_filename}"
             
+        except TimeoutError as e:
+            return False, f"Não foi possível restaurar: {str(e)}"
         except Exception as e:
             return False, f"Erro ao restaurar backup: {str(e)}"
+        finally:
+            for leftover in (tmp_path, tmp_path + "-wal", tmp_path + "-shm", tmp_path + "-journal"):
+                if os.path.exists(leftover):
+                    try:
+                        os.remove(leftover)
+                    except OSError:
+                        pass
+
+
+class WriterStallProbe:
+    """
+    Mede o impacto de uma operação sobre os registros de ponto concorrentes
+    
+    Enquanto ativa, tenta adquirir o lock de escrita do banco (BEGIN
+    IMMEDIATE + ROLLBACK, sem gravar nada) no início e a cada interval
+    segundos e registra a espera. max_stall_ms é o maior tempo que um
+    escritor teria ficado bloqueado. O intervalo é longo de propósito: a
+    própria sonda disputa o lock com os registros de ponto que ela mede.
+    """
+    
+    def __init__(self, db_file, interval=1.0):
+        self.db_file = db_file
+        self.interval = interval
+        self.samples = []
+        self._stop_event = threading.Event()
+        self._thread = None
+    
+    def __enter__(self):
+        self._thread = threading.Thread(daemon=True, target=self._run)
+        self._thread.start()
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        self._stop_event.set()
+        self._thread.join(timeout=5)
+        return False
+    
+    def _run(self):
+        try:
+            conn = sqlite3.connect(self.db_file, timeout=30, isolation_level=None)
+        except sqlite3.Error:
+            return
+        try:
+            while True:
+                t0 = time.perf_counter()
+                try:
+                    conn.execute("BEGIN IMMEDIATE")
+                    conn.execute("ROLLBACK")
+                except sqlite3.Error:
+                    pass
+                self.samples.append(time.perf_counter() - t0)
+                if self._stop_event.wait(self.interval):
+                    break
+        finally:
+            conn.close()
+    
+    @property
+    def max_stall_ms(self):
+        return round(max(self.samples) * 1000, 1) if self.samples else 0.0
+    
+    @property
+    def total_stall_ms(self):
+        return round(sum(self.samples) * 1000, 1)
+
+
+def _file_sha256(path):
+    """SHA-256 do conteúdo de um arquivo"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _throughput(num_bytes, seconds):
+    """MB/s de uma transferência (None se a duração for desprezível)"""
+    if seconds <= 0:
+        return None
+    return round(num_bytes / (1024 * 1024) / seconds, 2)
+
+
+class RetentionPolicy:
+    """
+    Política de retenção avô-pai-filho (GFS) com limite total de espaço
+    
+    Cada nível mantém o backup mais recente de cada período distinto
+    (hora, dia, semana ISO, mês, ano) até o número configurado de períodos.
+    Um backup é mantido se qualquer nível o selecionar. Se o total mantido
+    ultrapassar max_total_bytes, os backups mais antigos são descartados
+    (preservando sempre os min_keep mais recentes).
+    """
+    
+    TIERS = ('hourly', 'daily', 'weekly', 'monthly', 'yearly')
+    
+    def __init__(self, hourly=0, daily=14, weekly=12, monthly=12, yearly=5,
+                 max_total_bytes=None, min_keep=1):
+        """
+        Parâmetros:
+        - hourly, daily, weekly, monthly, yearly: número de períodos mantidos por nível
+        - max_total_bytes: orçamento total de espaço em bytes (None = sem limite)
+        - min_keep: backups mais recentes que nunca são removidos
+        """
+        self.hourly = hourly
+        self.daily = daily
+        self.weekly = weekly
+        self.monthly = monthly
+        self.yearly = yearly
+        self.max_total_bytes = max_total_bytes
+        self.min_keep = min_keep
+    
+    @staticmethod
+    def _period_key(tier, ts):
+        if tier == 'hourly':
+            return (ts.year, ts.month, ts.day, ts.hour)
+        if tier == 'daily':
+            return (ts.year, ts.month, ts.day)
+        if tier == 'weekly':
+            iso = ts.isocalendar()
+            return (iso[0], iso[1])
+        if tier == 'monthly':
+            return (ts.year, ts.month)
+        return (ts.year,)
+    
+    def to_dict(self):
+        return {
+            'hourly': self.hourly, 'daily': self.daily, 'weekly': self.weekly,
+            'monthly': self.monthly, 'yearly': self.yearly,
+            'max_total_bytes': self.max_total_bytes, 'min_keep': self.min_keep
+        }
+    
+    @classmethod
+    def from_dict(cls, data):
+        fields = ('hourly', 'daily', 'weekly', 'monthly', 'yearly', 'max_total_bytes', 'min_keep')
+        return cls(**{k: data[k] for k in fields if k in data})
+    
+    def plan(self, backups):
+        """
+        Calcula o plano de retenção sem remover nada (dry-run)
+        
+        Parâmetros:
+        - backups: entradas do catálogo (filename, timestamp, size_bytes, ...)
+        
+        Retorna: dict com 'keep' e 'delete' (listas de entradas com 'reasons'),
+        'kept_bytes' e 'freed_bytes'
+        """
+        entries = []
+        for b in backups:
+            try:
+                ts = datetime.datetime.fromisoformat(b['timestamp'])
+            except (KeyError, TypeError, ValueError):
+                continue
+            entries.append((ts, b))
+        entries.sort(key=lambda e: e[0], reverse=True)
+        
+        reasons = {id(b): [] for _, b in entries}
+        
+        for tier in self.TIERS:
+            limit = getattr(self, tier)
+            if not limit:
+                continue
+            seen = set()
+            for ts, b in entries:
+                key = self._period_key(tier, ts)
+                if key in seen:
+                    continue
+                if len(seen) >= limit:
+                    break
+                seen.add(key)
+                reasons[id(b)].append(tier)
+        
+        for _, b in entries[:self.min_keep]:
+            if not reasons[id(b)]:
+                reasons[id(b)].append('recente')
+        
+        keep = [b for _, b in entries if reasons[id(b)]]
+        delete = [dict(b, reasons=['fora da política']) for _, b in entries if not reasons[id(b)]]
+        
+        # Orçamento de espaço: descartar os mais antigos além dos min_keep recentes
+        kept_bytes = sum(b.get('size_bytes', 0) for b in keep)
+        if self.max_total_bytes is not None:
+            protected = {id(b) for _, b in entries[:self.min_keep]}
+            for b in reversed(list(keep)):
+                if kept_bytes <= self.max_total_bytes:
+                    break
+                if id(b) in protected:
+                    continue
+                keep.remove(b)
+                kept_bytes -= b.get('size_bytes', 0)
+                delete.append(dict(b, reasons=['limite de espaço']))
+        
+        return {
+            'keep': [dict(b, reasons=reasons[id(b)]) for b in keep],
+            'delete': delete,
+            'kept_bytes': kept_bytes,
+            'freed_bytes': sum(b.get('size_bytes', 0) for b in delete)
+        }
+
+
+DEFAULT_RETENTION_POLICY = RetentionPolicy()
+
+
+class BackupWindow:
+    """
+    Janela de agendamento no estilo cron para um tipo de backup
+    
+    Exemplos:
+    - BackupWindow('daily', hour=0, minute=0): todo dia às 00:00
+    - BackupWindow('weekly', hour=0, minute=0, weekdays=[0]): segunda-feira às 00:00
+    - BackupWindow.from_cron('weekly', '0 0 * * 1'): idem, em notação cron
+    """
+    
+    # Limite de busca por ocorrências (cobre janelas mensais e anuais)
+    MAX_LOOKUP_DAYS = 400
+    
+    def __init__(self, backup_type, hour=0, minute=0, weekdays=None, days=None):
+        """
+        Parâmetros:
+        - backup_type: tipo de backup gerado pela janela ('daily', 'weekly', ...)
+        - hour, minute: horário de disparo
+        - weekdays: dias da semana permitidos (0=segunda ... 6=domingo) ou None para todos
+        - days: dias do mês permitidos (1-31) ou None para todos
+        
+        Com weekdays e days informados, basta um dos dois coincidir (como no cron)
+        """
+        self.backup_type = backup_type
+        self.hour = hour
+        self.minute = minute
+        self.weekdays = set(weekdays) if weekdays is not None else None
+        self.days = set(days) if days is not None else None
+    
+    @classmethod
+    def from_cron(cls, backup_type, expression):
+        """
+        Cria uma janela a partir de uma expressão cron simplificada
+        'minuto hora dia_do_mes mes dia_da_semana' (mês deve ser '*',
+        dia da semana no padrão cron: 0=domingo); com dia do mês e dia da
+        semana restritos, vale a regra do cron: dispara se qualquer um coincidir
+        """
+        fields = expression.split()
+        if len(fields) != 5:
+            raise ValueError(f"Expressão cron inválida: {expression}")
+        
+        minute, hour, dom, month, dow = fields
+        if month != '*':
+            raise ValueError("Filtro por mês não suportado nas janelas de backup")
+        
+        def parse_list(field):
+            if field == '*':
+                return None
+            return [int(v) for v in field.split(',')]
+        
+        cron_weekdays = parse_list(dow)
+        weekdays = None
+        if cron_weekdays is not None:
+            # Cron: 0/7=domingo, 1=segunda | Python: 0=segunda, 6=domingo
+            weekdays = [(d - 1) % 7 for d in cron_weekdays]
+        
+        return cls(backup_type, hour=int(hour), minute=int(minute),
+                   weekdays=weekdays, days=parse_list(dom))
+    
+    def _matches(self, day):
+        if self.weekdays is not None and self.days is not None:
+            return day.weekday() in self.weekdays or day.day in self.days
+        if self.weekdays is not None and day.weekday() not in self.weekdays:
+            return False
+        if self.days is not None and day.day not in self.days:
+            return False
+        return True
+    
+    def _slot(self, day):
+        return datetime.datetime.combine(day, datetime.time(self.hour, self.minute))
+    
+    def previous_slot(self, now):
+        """Retorna a ocorrência mais recente da janela que seja <= now"""
+        for offset in range(self.MAX_LOOKUP_DAYS):
+            day = now.date() - datetime.timedelta(days=offset)
+            if self._matches(day):
+                slot = self._slot(day)
+                if slot <= now:
+                    return slot
+        return None
+    
+    def next_slot(self, now):
+        """Retorna a próxima ocorrência da janela estritamente após now"""
+        for offset in range(self.MAX_LOOKUP_DAYS):
+            day = now.date() + datetime.timedelta(days=offset)
+            if self._matches(day):
+                slot = self._slot(day)
+                if slot > now:
+                    return slot
+        return None
+    
+    def __repr__(self):
+        return (f"BackupWindow({self.backup_type!r}, hour={self.hour}, minute={self.minute}, "
+                f"weekdays={self.weekdays}, days={self.days})")
+
+
+# Janelas padrão: diário à meia-noite e semanal na segunda-feira à meia-noite
+DEFAULT_BACKUP_WINDOWS = [
+    BackupWindow('daily', hour=0, minute=0),
+    BackupWindow('weekly', hour=0, minute=0, weekdays=[0]),
+]
 
 
 class BackupScheduler:
-    """Agendador de backups automáticos"""
+    """
+    Agendador de backups automáticos orientado a eventos
+    
+    O próximo horário devido é calculado a partir do catálogo persistido
+    (backup_metadata.json), então reiniciar a aplicação não gera uma nova
+    cópia completa se o backup da janela atual já existe. Janelas perdidas
+    (aplicação desligada) são recuperadas uma única vez.
+    """
     
-    def __init__(self, backup_manager, check_interval=3600):
+    def __init__(self, backup_manager, check_interval=3600, windows=None, retry_interval=300,
+                 start_delay=0):
         """
         Inicializa o agendador
         
         Parâmetros:
         - backup_manager: instância de BackupManager
-        - check_interval: intervalo de verificação em segundos (padrão: 1 hora)
+        - check_interval: espera máxima entre reavaliações em segundos (padrão: 1 hora),
+          protege contra ajustes no relógio do sistema
+        - windows: lista de BackupWindow (padrão: DEFAULT_BACKUP_WINDOWS)
+        - retry_interval: espera em segundos antes de tentar de novo um backup que falhou
+        - start_delay: espera em segundos antes da primeira verificação, para que
+          um backup atrasado não dispute o disco com a inicialização da aplicação
         """
         self.backup_manager = backup_manager
         self.check_interval = check_interval
+        self.windows = list(windows) if windows is not None else list(DEFAULT_BACKUP_WINDOWS)
+        self.retry_interval = retry_interval
+        self.start_delay = start_delay
         self.running = False
         self.thread = None
+        self._stop_event = threading.Event()
     
     def start(self):
         """Inicia o agendador de backups em thread separada"""
@@ -309,51 +1007,564 @@ class BackupScheduler:
             return
         
         self.running = True
+        self._stop_event.clear()
         self.thread = threading.Thread(daemon=True, target=self._scheduler_loop)
         self.thread.start()
         print("✓ Agendador de backups iniciado")
     
     def stop(self):
-        """Para o agendador de backups"""
+        """Para o agendador de backups (acorda a thread imediatamente)"""
         self.running = False
+        self._stop_event.set()
         if self.thread:
             self.thread.join(timeout=5)
         print("✓ Agendador de backups parado")
     
+    def get_due_windows(self, now=None):
+        """
+        Retorna as janelas cujo backup está pendente: a ocorrência mais recente
+        da janela é posterior ao último backup registrado no catálogo
+        """
+        if now is None:
+            now = datetime.datetime.now()
+        
+        due = []
+        for window in self.windows:
+            slot = window.previous_slot(now)
+            if slot is None:
+                continue
+            last_run = self.backup_manager.get_last_backup_time(window.backup_type)
+            if last_run is None or last_run < slot:
+                due.append(window)
+        return due
+    
+    def get_next_due_time(self, now=None):
+        """Retorna o próximo horário em que alguma janela dispara"""
+        if now is None:
+            now = datetime.datetime.now()
+        
+        slots = [w.next_slot(now) for w in self.windows]
+        slots = [s for s in slots if s is not None]
+        return min(slots) if slots else None
+    
+    def _run_due_backups(self):
+        """
+        Executa os backups pendentes (uma única vez por tipo, mesmo que várias
+        ocorrências tenham sido perdidas) e retorna quantos segundos aguardar
+        """
+        now = datetime.datetime.now()
+        created = False
+        failed = False
+        done_types = set()
+        
+        for window in self.get_due_windows(now):
+            if window.backup_type in done_types:
+                continue
+            done_types.add(window.backup_type)
+            
+            success, _, msg = self.backup_manager.create_backup(window.backup_type)
+            print(f"[BACKUP {window.backup_type.upper()}] {msg}")
+            if success:
+                created = True
+            else:
+                failed = True
+        
+        # Limpeza apenas quando um novo backup foi gerado
+        if created:
+            self.backup_manager.cleanup_old_backups()
+        
+        now = datetime.datetime.now()
+        wait = self.check_interval
+        
+        next_due = self.get_next_due_time(now)
+        if next_due is not None:
+            wait = min(wait, (next_due - now).total_seconds())
+        if failed:
+            wait = min(wait, self.retry_interval)
+        
+        return max(wait, 1)
+    
     def _scheduler_loop(self):
-        """Loop principal do agendador"""
-        last_daily_backup = None
-        last_weekly_backup = None
+        """Loop principal do agendador: dorme no Event até o próximo horário devido"""
+        if self.start_delay:
+            self._stop_event.wait(self.start_delay)
         
-        while self.running:
+        while not self._stop_event.is_set():
             try:
-                now = datetime.datetime.now()
-                
-                # Backup diário (a cada 24 horas)
-                if last_daily_backup is None or \
-                   (now - last_daily_backup).total_seconds() >= 86400:
-                    success, _, msg = self.backup_manager.create_backup('daily')
-                    if success:
-                        last_daily_backup = now
-                    print(f"[BACKUP DIÁRIO] {msg}")
-                
-                # Backup semanal (segunda-feira à meia-noite)
-                if now.weekday() == 0 and \
-                   (last_weekly_backup is None or 
-                    (now - last_weekly_backup).days >= 7):
-                    success, _, msg = self.backup_manager.create_backup('weekly')
-                    if success:
-                        last_weekly_backup = now
-                    print(f"[BACKUP SEMANAL] {msg}")
-                
-                # Limpeza de backups antigos
-                self.backup_manager.cleanup_old_backups()
-                
+                wait = self._run_due_backups()
             except Exception as e:
                 print(f"Erro no agendador de backups: {e}")
+                wait = self.retry_interval
+            
+            self._stop_event.wait(wait)
+
+
+class WalArchiver:
+    """
+    Arquivamento contínuo de alterações para recuperação em ponto no tempo (PITR)
+    
+    Gatilhos SQLite capturam cada INSERT/UPDATE/DELETE das tabelas de dados
+    na tabela _wal_changes (com número de sequência e horário do commit).
+    Periodicamente os lotes confirmados são gravados de forma durável em
+    backups/wal/ e só então removidos do banco, seguidos de um checkpoint
+    do WAL. Assim nenhuma alteração é descartada antes de estar arquivada.
+    
+    A restauração parte do último backup completo anterior ao horário
+    desejado e reaplica os lotes arquivados até esse horário.
+    """
+    
+    CHANGES_TABLE = '_wal_changes'
+    CAPTURED_TABLES = ('funcionarios', 'eventos', 'feriados', 'folgas', 'usuarios', 'logs',
+                       'particoes_eventos', 'particoes_logs')
+    BATCH_PREFIX = 'changes_'
+    BATCH_SUFFIX = '.jsonl.gz'
+    
+    def __init__(self, backup_manager, interval=60, batch_size=5000):
+        """
+        Parâmetros:
+        - backup_manager: instância de BackupManager (define banco e diretório)
+        - interval: intervalo em segundos entre envios de lotes
+        - batch_size: número máximo de alterações por arquivo de lote
+        """
+        self.backup_manager = backup_manager
+        self.db_file = backup_manager.db_file
+        self.wal_dir = os.path.join(backup_manager.backup_dir, "wal")
+        self.interval = interval
+        self.batch_size = batch_size
+        self.running = False
+        self.thread = None
+        self._stop_event = threading.Event()
+        
+        os.makedirs(self.wal_dir, exist_ok=True)
+    
+    # --- Captura de alterações ---
+    def _connect(self):
+        conn = sqlite3.connect(self.db_file, timeout=10)
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+    
+    @classmethod
+    def install_change_capture(cls, conn):
+        """Cria (ou recria) a tabela de alterações e os gatilhos de captura"""
+        conn.execute(f'''
+            CREATE TABLE IF NOT EXISTS {cls.CHANGES_TABLE} (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                ts TEXT NOT NULL,
+                tabela TEXT NOT NULL,
+                op TEXT NOT NULL,
+                row_id INTEGER NOT NULL,
+                dados TEXT
+            )
+        ''')
+        
+        now_sql = "strftime('%Y-%m-%dT%H:%M:%f', 'now', 'localtime')"
+        
+        for table in cls.CAPTURED_TABLES:
+            columns = [row[1] for row in conn.execute(f'PRAGMA table_info({table})')]
+            if not columns:
+                continue
+            
+            # Recriar para acompanhar colunas adicionadas ao esquema
+            for suffix in ('ins', 'upd', 'del'):
+                conn.execute(f'DROP TRIGGER IF EXISTS _wal_{table}_{suffix}')
+            
+            new_json = "json_object(" + ", ".join(f"'{c}', NEW.{c}" for c in columns) + ")"
+            
+            conn.execute(f'''
+                CREATE TRIGGER _wal_{table}_ins AFTER INSERT ON {table} BEGIN
+                    INSERT INTO {cls.CHANGES_TABLE} (ts, tabela, op, row_id, dados)
+                    VALUES ({now_sql}, '{table}', 'I', NEW.rowid, {new_json});
+                END
+            ''')
+            conn.execute(f'''
+                CREATE TRIGGER _wal_{table}_upd AFTER UPDATE ON {table} BEGIN
+                    INSERT INTO {cls.CHANGES_TABLE} (ts, tabela, op, row_id, dados)
+                    VALUES ({now_sql}, '{table}', 'U', NEW.rowid, {new_json});
+                END
+            ''')
+            conn.execute(f'''
+                CREATE TRIGGER _wal_{table}_del AFTER DELETE ON {table} BEGIN
+                    INSERT INTO {cls.CHANGES_TABLE} (ts, tabela, op, row_id, dados)
+                    VALUES ({now_sql}, '{table}', 'D', OLD.rowid, NULL);
+                END
+            ''')
+        
+        conn.commit()
+    
+    @classmethod
+    def remove_change_capture(cls, conn):
+        """Remove os gatilhos de captura (desativa o modo de arquivamento)"""
+        for table in cls.CAPTURED_TABLES:
+            for suffix in ('ins', 'upd', 'del'):
+                conn.execute(f'DROP TRIGGER IF EXISTS _wal_{table}_{suffix}')
+        conn.commit()
+    
+    @classmethod
+    def _has_change_capture(cls, conn):
+        """True se o banco já tinha a captura de alterações instalada"""
+        return conn.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name=?",
+                            (cls.CHANGES_TABLE,)).fetchone() is not None
+    
+    @classmethod
+    def read_high_water(cls, conn):
+        """Retorna o maior número de sequência já gerado no banco (0 se nenhum)"""
+        try:
+            row = conn.execute('SELECT seq FROM sqlite_sequence WHERE name=?',
+                               (cls.CHANGES_TABLE,)).fetchone()
+        except sqlite3.Error:
+            return 0
+        return row[0] if row else 0
+    
+    # --- Arquivos de lote ---
+    def _batch_files(self):
+        """Lista (primeiro_seq, ultimo_seq, caminho) dos lotes arquivados, em ordem"""
+        batches = []
+        for name in os.listdir(self.wal_dir):
+            if not (name.startswith(self.BATCH_PREFIX) and name.endswith(self.BATCH_SUFFIX)):
+                continue
+            core = name[len(self.BATCH_PREFIX):-len(self.BATCH_SUFFIX)]
+            try:
+                first, last = (int(v) for v in core.split('_'))
+            except ValueError:
+                continue
+            batches.append((first, last, os.path.join(self.wal_dir, name)))
+        batches.sort()
+        return batches
+    
+    def _write_batch(self, rows):
+        """Grava um lote de forma durável (arquivo temporário + fsync + rename)"""
+        first, last = rows[0][0], rows[-1][0]
+        name = f"{self.BATCH_PREFIX}{first:012d}_{last:012d}{self.BATCH_SUFFIX}"
+        final_path = os.path.join(self.wal_dir, name)
+        tmp_path = final_path + ".tmp"
+        
+        with open(tmp_path, 'wb') as raw:
+            with gzip.GzipFile(fileobj=raw, mode='wb') as gz:
+                for seq, ts, tabela, op, row_id, dados in rows:
+                    record = {'seq': seq, 'ts': ts, 'tabela': tabela, 'op': op,
+                              'row_id': row_id, 'dados': dados}
+                    gz.write((json.dumps(record, ensure_ascii=False) + "\n").encode('utf-8'))
+            raw.flush()
+            os.fsync(raw.fileno())
+        
+        os.replace(tmp_path, final_path)
+        _fsync_dir(self.wal_dir)
+        return final_path
+    
+    @staticmethod
+    def _read_batch(path):
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+    
+    def _supersede_diverged_batches(self, high_water):
+        """
+        Se o banco foi restaurado para um ponto anterior, lotes com sequência
+        acima do que o banco conhece pertencem à linha do tempo abandonada e
+        são movidos para wal/superseded_<timestamp>/
+        """
+        diverged = [b for b in self._batch_files() if b[1] > high_water]
+        if not diverged:
+            return 0
+        
+        stamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+        target_dir = os.path.join(self.wal_dir, f"superseded_{stamp}")
+        os.makedirs(target_dir, exist_ok=True)
+        
+        for first, last, path in diverged:
+            if first <= high_water:
+                # Lote parcialmente conhecido: manter apenas a parte já aplicada
+                kept = [(r['seq'], r['ts'], r['tabela'], r['op'], r['row_id'], r['dados'])
+                        for r in self._read_batch(path) if r['seq'] <= high_water]
+                shutil.move(path, os.path.join(target_dir, os.path.basename(path)))
+                if kept:
+                    self._write_batch(kept)
+            else:
+                shutil.move(path, os.path.join(target_dir, os.path.basename(path)))
+        
+        print(f"⚠️  {len(diverged)} lote(s) de WAL de outra linha do tempo movidos para {target_dir}")
+        return len(diverged)
+    
+    # --- Envio ---
+    def ship_changes(self):
+        """
+        Envia para o diretório de arquivamento todas as alterações confirmadas
+        ainda não arquivadas. Retorna o número de alterações enviadas.
+        """
+        with _operation_lock:
+            conn = self._connect()
+            try:
+                high_water = self.read_high_water(conn)
+                self._supersede_diverged_batches(high_water)
+                
+                shipped = 0
+                while True:
+                    rows = conn.execute(f'''
+                        SELECT seq, ts, tabela, op, row_id, dados FROM {self.CHANGES_TABLE}
+                        ORDER BY seq LIMIT ?
+                    ''', (self.batch_size,)).fetchall()
+                    if not rows:
+                        break
+                    
+                    # Só remove do banco depois que o lote está gravado em disco
+                    self._write_batch(rows)
+                    conn.execute(f'DELETE FROM {self.CHANGES_TABLE} WHERE seq <= ?', (rows[-1][0],))
+                    conn.commit()
+                    shipped += len(rows)
+                    
+                    if len(rows) < self.batch_size:
+                        break
+                
+                if shipped:
+                    conn.execute("PRAGMA wal_checkpoint(PASSIVE)")
+                return shipped
+            finally:
+                conn.close()
+    
+    def prune_archive(self):
+        """
+        Remove lotes já contidos em todos os backups completos do catálogo
+        (não são mais necessários para nenhuma restauração)
+        """
+        backups = self.backup_manager._load_metadata().get('backups', [])
+        seqs = [b.get('wal_seq') for b in backups]
+        if not seqs or any(s is None for s in seqs):
+            return 0
+        
+        oldest_base = min(seqs)
+        removed = 0
+        for first, last, path in self._batch_files():
+            if last <= oldest_base:
+                try:
+                    os.remove(path)
+                    removed += 1
+                except OSError as e:
+                    print(f"Erro ao remover lote de WAL {path}: {e}")
+        return removed
+    
+    # --- Restauração ---
+    def restore_point_in_time(self, target_time, output_path=None):
+        """
+        Reconstrói o banco no estado de target_time: copia o último backup
+        completo anterior ao horário e reaplica os lotes arquivados até ele
+        
+        Parâmetros:
+        - target_time: datetime alvo da recuperação
+        - output_path: arquivo de saída (padrão: backups/ponto_pitr_<timestamp>.db)
+        
+        Retorna: (sucesso: bool, arquivo: str, mensagem: str)
+        """
+        # Garantir que as alterações mais recentes estejam arquivadas
+        try:
+            self.ship_changes()
+        except (sqlite3.Error, OSError) as e:
+            print(f"⚠️  Não foi possível enviar alterações pendentes antes da restauração: {e}")
+        
+        metadata = self.backup_manager._load_metadata()
+        
+        # Restaurações de backup iniciam uma nova linha do tempo: uma base
+        # anterior a elas reaplicaria lotes da linha abandonada
+        restores = []
+        for r in metadata.get('restores', []):
+            try:
+                restores.append((datetime.datetime.fromisoformat(r['timestamp']), r['wal_seq']))
+            except (KeyError, ValueError):
+                continue
+        boundary = max((ts for ts, _ in restores if ts <= target_time), default=None)
+        
+        candidates = []
+        for b in metadata.get('backups', []):
+            try:
+                ts = datetime.datetime.fromisoformat(b['timestamp'])
+            except (KeyError, ValueError):
+                continue
+            path = os.path.join(self.backup_manager.backup_dir, b['filename'])
+            if ts <= target_time and os.path.exists(path):
+                candidates.append((ts, path))
+        
+        if boundary is not None and candidates and all(ts < boundary for ts, _ in candidates):
+            return False, None, (
+                f"Nenhum backup completo entre a restauração de "
+                f"{boundary.isoformat(sep=' ', timespec='seconds')} e o horário solicitado: "
+                f"backups anteriores pertencem a outra linha do tempo")
+        candidates = [c for c in candidates if boundary is None or c[0] >= boundary]
+        
+        if not candidates:
+            return False, None, "Nenhum backup completo anterior ao horário solicitado"
+        
+        base_ts, base_path = max(candidates)
+        # Lotes depois da próxima restauração pertencem a outra linha do tempo
+        stop_seq = min((seq for ts, seq in restores if ts > base_ts), default=None)
+        
+        if output_path is None:
+            stamp = target_time.strftime("%Y%m%d_%H%M%S")
+            output_path = os.path.join(self.backup_manager.backup_dir, f"ponto_pitr_{stamp}.db")
+        tmp_path = output_path + ".tmp"
+        
+        try:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
             
-            # Aguardar o intervalo de verificação
-            time.sleep(self.check_interval)
+            src = sqlite3.connect(base_path)
+            if not self._has_change_capture(src):
+                src.close()
+                return False, None, (
+                    f"O backup {os.path.basename(base_path)} ({base_ts.isoformat(sep=' ', timespec='seconds')}) "
+                    f"é anterior à captura de alterações: o que mudou entre ele e o início do arquivamento "
+                    f"não está nos lotes. Escolha um horário posterior a um backup feito com o arquivamento ativo")
+            dst = sqlite3.connect(tmp_path)
+            src.backup(dst)
+            src.close()
+            
+            base_seq = self.read_high_water(dst)
+            
+            # Replay sem gatilhos de captura: as alterações já estão no arquivo
+            self.remove_change_capture(dst)
+            
+            applied = 0
+            last_seq = base_seq
+            last_ts = None
+            columns_cache = {}
+            done = False
+            missing = None
+            
+            for first, last, path in self._batch_files():
+                if last <= base_seq:
+                    continue
+                for record in self._read_batch(path):
+                    if record['seq'] <= base_seq:
+                        continue
+                    if stop_seq is not None and record['seq'] > stop_seq:
+                        done = True
+                        break
+                    if datetime.datetime.fromisoformat(record['ts']) > target_time:
+                        done = True
+                        break
+                    if record['seq'] != last_seq + 1:
+                        # Lote ausente (ou alterações nunca enviadas): o resultado ficaria incompleto
+                        missing = (last_seq + 1, record['seq'] - 1)
+                        done = True
+                        break
+                    self._apply_record(dst, record, columns_cache)
+                    applied += 1
+                    last_seq = record['seq']
+                    last_ts = record['ts']
+                if done:
+                    break
+            
+            if missing:
+                dst.close()
+                os.remove(tmp_path)
+                return False, None, (f"Alterações {missing[0]} a {missing[1]} não estão no arquivo de lotes; "
+                                     f"a restauração até o horário solicitado ficaria incompleta")
+            
+            # Logs reaplicados não passaram pelo índice de busca: reindexados
+            # aos poucos (db.index_old_logs) quando a imagem for usada
+            if applied:
+                reset_log_search(dst)
+            
+            # Reativar a captura e alinhar a sequência com o ponto restaurado
+            self.install_change_capture(dst)
+            dst.execute(f'DELETE FROM {self.CHANGES_TABLE}')
+            dst.execute('DELETE FROM sqlite_sequence WHERE name=?', (self.CHANGES_TABLE,))
+            dst.execute('INSERT INTO sqlite_sequence (name, seq) VALUES (?, ?)',
+                        (self.CHANGES_TABLE, last_seq))
+            dst.commit()
+            
+            ok = dst.execute('PRAGMA integrity_check').fetchone()[0] == 'ok'
+            dst.close()
+            
+            if not ok:
+                os.remove(tmp_path)
+                return False, None, "Imagem restaurada falhou na verificação de integridade"
+            
+            os.replace(tmp_path, output_path)
+            
+            msg = (f"Banco reconstruído até {target_time.isoformat(sep=' ', timespec='seconds')}: "
+                   f"base {os.path.basename(base_path)} ({base_ts.isoformat(timespec='seconds')}) "
+                   f"+ {applied} alteração(ões)"
+                   + (f", última em {last_ts[:19]}" if last_ts else ""))
+            print(f"✓ {msg}")
+            return True, output_path, msg
+            
+        except (sqlite3.Error, OSError, ValueError) as e:
+            if os.path.exists(tmp_path):
+                try:
+                    os.remove(tmp_path)
+                except OSError:
+                    pass
+            return False, None, f"Erro na restauração em ponto no tempo: {str(e)}"
+    
+    @staticmethod
+    def _apply_record(conn, record, columns_cache):
+        """Reaplica uma alteração capturada"""
+        table = record['tabela']
+        if record['op'] == 'D':
+            conn.execute(f'DELETE FROM {table} WHERE rowid=?', (record['row_id'],))
+            return
+        
+        data = json.loads(record['dados'])
+        if table not in columns_cache:
+            columns_cache[table] = {row[1] for row in conn.execute(f'PRAGMA table_info({table})')}
+        cols = [c for c in data if c in columns_cache[table]]
+        placeholders = ", ".join("?" for _ in cols)
+        conn.execute(f'INSERT OR REPLACE INTO {table} ({", ".join(cols)}) VALUES ({placeholders})',
+                     [data[c] for c in cols])
+    
+    # --- Thread de envio ---
+    def start(self):
+        """Ativa a captura de alterações e inicia o envio periódico"""
+        if self.running:
+            print("⚠️  Arquivamento de WAL já está em execução")
+            return
+        
+        conn = self._connect()
+        try:
+            self.install_change_capture(conn)
+        finally:
+            conn.close()
+        
+        self.running = True
+        self._stop_event.clear()
+        self.thread = threading.Thread(daemon=True, target=self._archiver_loop)
+        self.thread.start()
+        print("✓ Arquivamento contínuo de WAL iniciado")
+    
+    def stop(self):
+        """Para o envio periódico, enviando as alterações pendentes uma última vez"""
+        self.running = False
+        self._stop_event.set()
+        if self.thread:
+            self.thread.join(timeout=5)
+        try:
+            self.ship_changes()
+        except (sqlite3.Error, OSError) as e:
+            print(f"Erro ao enviar alterações finais: {e}")
+        print("✓ Arquivamento contínuo de WAL parado")
+    
+    def _archiver_loop(self):
+        while not self._stop_event.is_set():
+            try:
+                if self.ship_changes():
+                    self.prune_archive()
+            except Exception as e:
+                print(f"Erro no arquivamento de WAL: {e}")
+            self._stop_event.wait(self.interval)
+
+
+def _fsync_dir(path):
+    """Garante a durabilidade de um rename no diretório (não suportado no Windows)"""
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
 
 
 # Funções de conveniência
@@ -365,11 +1576,22 @@ def initialize_backup_system(db_file="ponto.db", backup_dir="backups"):
     return BackupManager(db_file, backup_dir)
 
 
-def start_automatic_backups(backup_manager, check_interval=3600):
+def start_automatic_backups(backup_manager, check_interval=3600, windows=None, start_delay=0):
     """
     Inicia backups automáticos
     Retorna: BackupScheduler
     """
-    scheduler = BackupScheduler(backup_manager, check_interval)
+    scheduler = BackupScheduler(backup_manager, check_interval, windows=windows,
+                                start_delay=start_delay)
     scheduler.start()
     return scheduler
+
+
+def start_wal_archiving(backup_manager, interval=60):
+    """
+    Inicia o arquivamento contínuo de alterações (PITR)
+    Retorna: WalArchiver
+    """
+    archiver = WalArchiver(backup_manager, interval=interval)
+    archiver.start()
+    return archiver
@@ -0,0 +1,238 @@
+"""
+Marc - Benchmark de Backup
+Mede backup, verificação, limpeza e restauração sobre bancos sintéticos
+enquanto uma carga simulada de registros de ponto é executada
+
+Uso:
+    python bench_backup.py --sizes 100,500,1000,5000 --workdir bench_data
+    python bench_backup.py --sizes 100 --rate 20 --json bench_result.json
+"""
+
+import argparse
+import datetime
+import json
+import os
+import random
+import shutil
+import sqlite3
+import threading
+import time
+
+import db
+from backup import BackupManager, RetentionPolicy
+
+EVENT_TYPES = ['entrada', 'inicio_descanso', 'fim_descanso', 'saida']
+
+
+def build_synthetic_db(path, target_mb, employees=500, seed=42):
+    """
+    Gera (ou reaproveita) um banco sintético com aproximadamente target_mb
+    de eventos e logs de auditoria
+    """
+    target_bytes = target_mb * 1024 * 1024
+    if os.path.exists(path) and os.path.getsize(path) >= target_bytes:
+        return path
+
+    db.DB_FILE = path
+    db.init_db()
+
+    rnd = random.Random(seed)
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA synchronous=OFF")
+    c = conn.cursor()
+
+    if c.execute('SELECT COUNT(*) FROM funcionarios').fetchone()[0] == 0:
+        c.executemany('INSERT INTO funcionarios (name) VALUES (?)',
+                      [(f"Funcionário {i:05d}",) for i in range(1, employees + 1)])
+        conn.commit()
+
+    start = datetime.datetime(2020, 1, 1, 8, 0)
+    batch = 20000
+    print(f"  Gerando banco sintético de {target_mb} MB em {path}...")
+
+    while os.path.getsize(path) < target_bytes:
+        events = []
+        logs = []
+        for _ in range(batch):
+            emp_id = rnd.randint(1, employees)
+            ts = start + datetime.timedelta(minutes=rnd.randint(0, 5 * 365 * 24 * 60))
+            tipo = rnd.choice(EVENT_TYPES)
+            events.append((emp_id, tipo, ts.isoformat()))
+            logs.append((ts.isoformat(), 'admin', f"Registrou {tipo} - Funcionário {emp_id:05d}", 'evento',
+                         f"Funcionário: Funcionário {emp_id:05d} (ID: {emp_id}), Tipo: {tipo}, "
+                         f"Timestamp: {ts.isoformat()}", None, 'sucesso'))
+        c.executemany('INSERT INTO eventos (funcionario_id, tipo, timestamp) VALUES (?,?,?)', events)
+        c.executemany('''
+            INSERT INTO logs (timestamp, usuario, acao, categoria, detalhes, ip_address, status)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', logs)
+        conn.commit()
+
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    conn.close()
+    return path
+
+
+class PunchLoad:
+    """Carga simulada: registros de ponto pelo mesmo caminho do db.py"""
+
+    def __init__(self, rate=10, employees=500, seed=7):
+        self.interval = 1.0 / rate if rate > 0 else None
+        self.employees = employees
+        self.rnd = random.Random(seed)
+        self.samples = []  # (instante, latência em segundos, sucesso)
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self.interval is None:
+            return self
+        self._thread = threading.Thread(daemon=True, target=self._run)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join(timeout=30)
+
+    def _run(self):
+        # Datas no futuro evitam colisão com a validação de duplicidade
+        base = datetime.datetime(2100, 1, 1, 8, 0)
+        while not self._stop_event.is_set():
+            emp_id = self.rnd.randint(1, self.employees)
+            ts = base + datetime.timedelta(days=self.rnd.randint(0, 36500),
+                                           minutes=self.rnd.randint(0, 600))
+            t0 = time.perf_counter()
+            ok, _ = db.record_event_db(emp_id, self.rnd.choice(EVENT_TYPES), ts, recorded_by='bench')
+            self.samples.append((t0, time.perf_counter() - t0, ok))
+            self._stop_event.wait(self.interval)
+
+    def window(self, t_start, t_end):
+        """Latências (ms) dos registros iniciados no intervalo"""
+        return [lat * 1000 for t0, lat, _ in self.samples if t_start <= t0 <= t_end]
+
+
+def _percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    k = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return round(ordered[k], 1)
+
+
+def _latency_stats(values):
+    return {
+        'punches': len(values),
+        'p50_ms': _percentile(values, 50),
+        'p95_ms': _percentile(values, 95),
+        'max_ms': round(max(values), 1) if values else None
+    }
+
+
+def _measure(load, fn):
+    t_start = time.perf_counter()
+    result = fn()
+    t_end = time.perf_counter()
+    return result, round(t_end - t_start, 3), _latency_stats(load.window(t_start, t_end))
+
+
+def run_scenario(size_mb, args):
+    """Executa backup, restauração e limpeza sobre um banco de size_mb"""
+    source = build_synthetic_db(os.path.join(args.workdir, f"synthetic_{size_mb}mb.db"), size_mb)
+
+    scenario_dir = os.path.join(args.workdir, f"run_{size_mb}mb")
+    shutil.rmtree(scenario_dir, ignore_errors=True)
+    os.makedirs(scenario_dir)
+    db_file = os.path.join(scenario_dir, "ponto.db")
+    shutil.copy2(source, db_file)
+
+    db.DB_FILE = db_file
+    manager = BackupManager(db_file=db_file, backup_dir=os.path.join(scenario_dir, "backups"))
+
+    load = PunchLoad(rate=args.rate).start()
+    try:
+        # Linha de base sem operações de backup
+        t_start = time.perf_counter()
+        time.sleep(args.baseline)
+        baseline = _latency_stats(load.window(t_start, time.perf_counter()))
+
+        (ok, backup_path, msg), backup_s, backup_load = _measure(
+            load, lambda: manager.create_backup('daily'))
+        if not ok:
+            raise RuntimeError(msg)
+        backup_metrics = manager.get_run_metrics('backup', limit=1)[0]
+
+        (ok, msg), restore_s, restore_load = _measure(
+            load, lambda: manager.restore_backup(os.path.basename(backup_path), quiesce=db.quiesced))
+        if not ok:
+            raise RuntimeError(msg)
+        restore_metrics = manager.get_run_metrics('restore', limit=1)[0]
+
+        # Segundo backup para que a limpeza tenha o que remover
+        manager.create_backup('daily')
+        purge_all = RetentionPolicy(hourly=0, daily=0, weekly=0, monthly=0, yearly=0, min_keep=1)
+        _, cleanup_s, cleanup_load = _measure(load, lambda: manager.cleanup_old_backups(policy=purge_all))
+    finally:
+        load.stop()
+
+    return {
+        'size_mb': size_mb,
+        'db_bytes': os.path.getsize(db_file),
+        'baseline': baseline,
+        'backup': {'elapsed_s': backup_s, 'metrics': backup_metrics, 'punch_latency': backup_load},
+        'restore': {'elapsed_s': restore_s, 'metrics': restore_metrics, 'punch_latency': restore_load},
+        'cleanup': {'elapsed_s': cleanup_s, 'punch_latency': cleanup_load}
+    }
+
+
+def print_report(results):
+    print()
+    print("=" * 100)
+    print(f"{'Tamanho':>8} {'Operação':<12} {'Duração':>9} {'MB/s':>8} {'Páginas':>10} "
+          f"{'Pausa esc.':>11} {'Ponto p50':>10} {'Ponto p95':>10} {'Ponto máx':>10}")
+    print("-" * 100)
+    for r in results:
+        base = r['baseline']
+        print(f"{r['size_mb']:>6}MB {'linha base':<12} {'-':>9} {'-':>8} {'-':>10} {'-':>11} "
+              f"{str(base['p50_ms']):>10} {str(base['p95_ms']):>10} {str(base['max_ms']):>10}")
+        for op in ('backup', 'restore', 'cleanup'):
+            data = r[op]
+            metrics = data.get('metrics', {})
+            lat = data['punch_latency']
+            stall = metrics.get('writer_stall_ms', metrics.get('downtime_s', '-'))
+            print(f"{r['size_mb']:>6}MB {op:<12} {data['elapsed_s']:>8}s {str(metrics.get('mb_per_s', '-')):>8} "
+                  f"{str(metrics.get('pages', '-')):>10} {str(stall):>11} "
+                  f"{str(lat['p50_ms']):>10} {str(lat['p95_ms']):>10} {str(lat['max_ms']):>10}")
+    print("=" * 100)
+    print("Pausa esc.: maior espera pelo lock de escrita (ms) no backup; indisponibilidade (s) na restauração")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark do sistema de backup do Marc")
+    parser.add_argument('--sizes', default='100,500,1000,5000',
+                        help='tamanhos dos bancos sintéticos em MB, separados por vírgula')
+    parser.add_argument('--workdir', default='bench_data', help='diretório de trabalho')
+    parser.add_argument('--rate', type=float, default=10, help='registros de ponto por segundo (0 = sem carga)')
+    parser.add_argument('--baseline', type=float, default=5, help='segundos de medição da linha de base')
+    parser.add_argument('--json', help='arquivo para salvar os resultados em JSON')
+    args = parser.parse_args()
+
+    os.makedirs(args.workdir, exist_ok=True)
+    sizes = [int(s) for s in args.sizes.split(',') if s.strip()]
+
+    results = []
+    for size_mb in sizes:
+        print(f"▶ Cenário {size_mb} MB")
+        results.append(run_scenario(size_mb, args))
+
+    print_report(results)
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+        print(f"✓ Resultados salvos em {args.json}")
+
+
+if __name__ == "__main__":
+    main()
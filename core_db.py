@@ -1,5 +1,6 @@
 import datetime
 import calendar
+import sqlite3
 from db import (
     add_employee_db, remove_employee_db, list_employees_db, 
     record_event_db, add_holiday_db, set_day_off_db,
@@ -7,19 +8,19 @@ from db import (
     get_employee_days_off
 )
 
-EVENT_TYPES = ['entrada', 'inicio_descanso', 'fim_descanso', 'saida']
+from session import current_user, set_default_user
+from punch_state import punch_states
 
-# Variável global para armazenar o usuário atual
-_current_user = 'system'
+EVENT_TYPES = ['entrada', 'inicio_descanso', 'fim_descanso', 'saida']
 
+# Compatibilidade: o usuário das ações vem do contexto de sessão (session.py)
 def set_current_user(username):
-    """Define o usuário atual para logs de auditoria"""
-    global _current_user
-    _current_user = username
+    """Define o usuário padrão do processo para logs de auditoria"""
+    set_default_user(username)
 
 def get_current_user():
-    """Retorna o usuário atual"""
-    return _current_user
+    """Retorna o usuário da sessão atual"""
+    return current_user()
 
 # --- Funções de funcionário ---
 def add_employee(name):
@@ -55,63 +56,69 @@ def get_employee_by_id(emp_id):
     return None
 
 # --- Funções de eventos ---
-def validate_event_sequence(emp_id, event_type, date_obj):
+def check_event_sequence(existing_events, event_type):
     """
-    Valida se a sequência de eventos está correta
+    Valida o evento contra os tipos já registrados no dia
     Ordem esperada: entrada -> inicio_descanso -> fim_descanso -> saida
     """
-    from db import connect
-    import sqlite3
+    if event_type == 'entrada':
+        if 'entrada' in existing_events:
+            return False, 'Entrada já registrada hoje'
+            
+    elif event_type == 'inicio_descanso':
+        if 'entrada' not in existing_events:
+            return False, 'Registre a entrada primeiro'
+        if 'inicio_descanso' in existing_events:
+            return False, 'Início de descanso já registrado'
+        if 'saida' in existing_events:
+            return False, 'Saída já registrada hoje'
+            
+    elif event_type == 'fim_descanso':
+        if 'inicio_descanso' not in existing_events:
+            return False, 'Registre o início do descanso primeiro'
+        if 'fim_descanso' in existing_events:
+            return False, 'Fim de descanso já registrado'
+        if 'saida' in existing_events:
+            return False, 'Saída já registrada hoje'
+            
+    elif event_type == 'saida':
+        if 'entrada' not in existing_events:
+            return False, 'Registre a entrada primeiro'
+        if 'saida' in existing_events:
+            return False, 'Saída já registrada hoje'
+        # Verificar se tem descanso aberto
+        if 'inicio_descanso' in existing_events and 'fim_descanso' not in existing_events:
+            return False, 'Finalize o descanso antes de registrar a saída'
+    
+    return True, 'OK'
+
+def validate_event_sequence(emp_id, event_type, date_obj):
+    """
+    Valida se a sequência de eventos está correta (consulta ao banco, sem gravar)
+    Ordem esperada: entrada -> inicio_descanso -> fim_descanso -> saida
     
+    record_event não usa esta função: a sequência é conferida dentro da
+    transação de escrita, com o estado do dia em cache (punch_state)
+    """
     try:
-        conn = connect()
-        c = conn.cursor()
-        c.execute('''
-            SELECT tipo FROM eventos 
-            WHERE funcionario_id=? AND DATE(timestamp)=?
-            ORDER BY timestamp
-        ''', (emp_id, date_obj.isoformat()))
-        
-        existing_events = [row[0] for row in c.fetchall()]
-        conn.close()
-        
-        # Regras de validação
-        if event_type == 'entrada':
-            if 'entrada' in existing_events:
-                return False, 'Entrada já registrada hoje'
-                
-        elif event_type == 'inicio_descanso':
-            if 'entrada' not in existing_events:
-                return False, 'Registre a entrada primeiro'
-            if 'inicio_descanso' in existing_events:
-                return False, 'Início de descanso já registrado'
-                
-        elif event_type == 'fim_descanso':
-            if 'inicio_descanso' not in existing_events:
-                return False, 'Registre o início do descanso primeiro'
-            if 'fim_descanso' in existing_events:
-                return False, 'Fim de descanso já registrado'
-                
-        elif event_type == 'saida':
-            if 'entrada' not in existing_events:
-                return False, 'Registre a entrada primeiro'
-            if 'saida' in existing_events:
-                return False, 'Saída já registrada hoje'
-            # Verificar se tem descanso aberto
-            if 'inicio_descanso' in existing_events and 'fim_descanso' not in existing_events:
-                return False, 'Finalize o descanso antes de registrar a saída'
-        
-        return True, 'OK'
+        existing_events = punch_states.load_day(emp_id, date_obj)
+        if existing_events is None:
+            return False, 'Funcionário não encontrado'
+        return check_event_sequence(existing_events, event_type)
         
     except sqlite3.Error as e:
         return False, f'Erro ao validar sequência: {str(e)}'
 
-def record_event(emp_id, event_type, timestamp=None):
-    """Registra evento de ponto para funcionário com validação"""
-    # Validar funcionário
-    if not employee_exists(emp_id):
-        return False, 'Funcionário não encontrado'
+def record_event(emp_id, event_type, timestamp=None, idempotency_key=None, raise_errors=False):
+    """
+    Registra evento de ponto para funcionário com validação
+    idempotency_key: chave do registro no spool (nova tentativa não duplica)
+    raise_errors: levanta sqlite3.Error em vez de retornar (False, mensagem)
     
+    Funcionário e sequência são conferidos uma única vez, na transação de
+    escrita: os tipos já registrados no dia vêm do cache (punch_state) quando
+    nenhum terminal alterou os eventos desde a última conferência
+    """
     # Validar tipo de evento
     if event_type not in EVENT_TYPES:
         return False, 'Tipo de evento inválido'
@@ -120,13 +127,18 @@ def record_event(emp_id, event_type, timestamp=None):
     if timestamp is None:
         timestamp = datetime.datetime.now()
     
-    # Validar sequência de eventos
-    valid, msg = validate_event_sequence(emp_id, event_type, timestamp.date())
-    if not valid:
-        return False, msg
-    
-    # Registrar evento
-    return record_event_db(emp_id, event_type, timestamp, recorded_by=get_current_user())
+    # Virada do dia: estado de todos os funcionários em uma única consulta
+    if punch_states.date != datetime.date.today():
+        try:
+            punch_states.reconcile()
+        except sqlite3.Error as e:
+            print(f"Erro ao carregar estado de ponto do dia: {e}")
+    
+    # Registro do spool já aplicado antes de uma falha: conferido na mesma
+    # transação (registros_aplicados), sem validar de novo
+    return record_event_db(emp_id, event_type, timestamp, recorded_by=get_current_user(),
+                           idempotency_key=idempotency_key, check_sequence=check_event_sequence,
+                           day_states=punch_states, raise_errors=raise_errors)
 
 def set_day_off(emp_id, date_obj):
     """Marca folga para funcionário"""
@@ -158,6 +170,12 @@ def get_timesheet(emp_id, year, month):
     holidays_raw = get_all_holidays()
     folgas_raw = get_employee_days_off(emp_id)
     
+    # Agrupar eventos por dia uma única vez
+    events_by_date = {}
+    for e in events_raw:
+        ts = datetime.datetime.fromisoformat(e[1])
+        events_by_date.setdefault(ts.date(), []).append({'type': e[0], 'ts': ts})
+    
     # Montar estrutura por dia
     _, ndays = calendar.monthrange(year, month)
     days = []
@@ -165,22 +183,14 @@ def get_timesheet(emp_id, year, month):
     for d in range(1, ndays + 1):
         dt = datetime.date(year, month, d)
         
-        # Filtrar eventos do dia
-        day_events = [
-            {
-                'type': e[0], 
-                'ts': datetime.datetime.fromisoformat(e[1])
-            } 
-            for e in events_raw 
-            if datetime.date.fromisoformat(e[1][:10]) == dt
-        ]
-        
         day = {
             'date': dt,
-            'events': day_events,
+            'events': events_by_date.get(dt, []),
             'holiday': dt in holidays_raw,
             'off': dt in folgas_raw
         }
+        # Duração calculada uma vez e reaproveitada pelo resumo e pela interface
+        day['duration'] = compute_work_duration(day)
         days.append(day)
     
     return days
@@ -237,8 +247,10 @@ def format_timedelta(td):
 
 def get_monthly_summary(emp_id, year, month):
     """Retorna resumo mensal: total de horas, dias trabalhados, etc."""
-    days = get_timesheet(emp_id, year, month)
-    
+    return summarize_timesheet(get_timesheet(emp_id, year, month))
+
+def summarize_timesheet(days):
+    """Calcula o resumo mensal a partir dos dias já retornados por get_timesheet"""
     total_hours = datetime.timedelta()
     worked_days = 0
     holidays = 0
@@ -252,7 +264,7 @@ def get_monthly_summary(emp_id, year, month):
             days_off += 1
             continue
         
-        duration = compute_work_duration(day)
+        duration = day['duration'] if 'duration' in day else compute_work_duration(day)
         if duration:
             total_hours += duration
             worked_days += 1
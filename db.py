@@ -1,21 +1,298 @@
+import os
+import re
+import random
 import sqlite3
 import datetime
+import threading
+import time
+import unicodedata
+import gzip
+import json
+import hashlib
+import base64
+import zlib
+import weakref
+from contextlib import contextmanager
+from pathlib import Path
 import bcrypt
 
+from session import current_user
+
 DB_FILE = "ponto.db"
 DB_TIMEOUT = 10  # Timeout de 10 segundos para operações
 
+# Custo do bcrypt (2^rounds iterações); ajustável por classe de hardware via
+# MARC_BCRYPT_ROUNDS. Hashes com custo diferente são refeitos no próximo login.
+BCRYPT_ROUNDS = int(os.environ.get('MARC_BCRYPT_ROUNDS', 12))
+
+# Escrita concorrente (vários terminais no mesmo ponto.db): tempo máximo para
+# obter o bloqueio de escrita e intervalos das novas tentativas
+WRITE_LOCK_BUDGET = float(os.environ.get('MARC_WRITE_LOCK_BUDGET', 15))
+WRITE_LOCK_POLL_MS = 50  # espera do próprio SQLite em cada tentativa
+WRITE_BACKOFF_BASE = 0.02
+WRITE_BACKOFF_MAX = 1.0
+
+# --- Controle de conexões (permite drenar o banco durante uma restauração) ---
+_conn_gate = threading.Condition()
+_connections_paused = False
+_open_connections = weakref.WeakSet()
+
+class _GatedConnection(sqlite3.Connection):
+    """Conexão que avisa o controle de conexões ao ser fechada"""
+    def close(self):
+        super().close()
+        with _conn_gate:
+            _open_connections.discard(self)
+            _conn_gate.notify_all()
+
 def connect():
     """Retorna uma conexão com o banco de dados"""
-    conn = sqlite3.connect(DB_FILE, timeout=DB_TIMEOUT)
+    with _conn_gate:
+        # Aguardar enquanto o banco está em manutenção (ex: restauração)
+        while _connections_paused:
+            _conn_gate.wait()
+        # URI: permite anexar as partições de eventos com mode=ro (ATTACH 'file:...')
+        conn = sqlite3.connect(Path(DB_FILE).absolute().as_uri(), uri=True,
+                               timeout=DB_TIMEOUT, factory=_GatedConnection)
+        _open_connections.add(conn)
+    register_log_functions(conn)
     # Habilitar timeout e retry automático
     conn.execute("PRAGMA journal_mode=WAL")  # Write-Ahead Logging para melhor concorrência
     return conn
 
+def pause_connections(timeout=DB_TIMEOUT):
+    """
+    Bloqueia a abertura de novas conexões e aguarda as abertas serem fechadas
+    Retorna: True se todas as conexões foram fechadas dentro do timeout
+    """
+    global _connections_paused
+    deadline = time.monotonic() + timeout
+    
+    with _conn_gate:
+        _connections_paused = True
+        while len(_open_connections) > 0:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            # Espera curta: conexões esquecidas somem do WeakSet sem notificar
+            _conn_gate.wait(min(remaining, 0.1))
+    return True
+
+def resume_connections():
+    """Libera novamente a abertura de conexões"""
+    global _connections_paused
+    with _conn_gate:
+        _connections_paused = False
+        _conn_gate.notify_all()
+
+@contextmanager
+def quiesced(timeout=DB_TIMEOUT):
+    """
+    Contexto em que nenhuma conexão do db.py está aberta
+    Levanta TimeoutError se as conexões não forem drenadas a tempo
+    """
+    drained = pause_connections(timeout)
+    try:
+        if not drained:
+            raise TimeoutError("Conexões com o banco ainda abertas após o tempo limite")
+        yield
+    finally:
+        resume_connections()
+
+# --- Transações de escrita com BEGIN IMMEDIATE ---
+class DatabaseBusyError(sqlite3.OperationalError):
+    """Bloqueio de escrita não obtido dentro do tempo limite"""
+
+
+class LockWaitStats:
+    """
+    Histograma do tempo de espera pelo bloqueio de escrita
+    
+    Cada chamada a connect_write() registra a espera total (todas as
+    tentativas), o número de novas tentativas e se o bloqueio foi obtido.
+    """
+    
+    # Limites superiores das faixas, em ms (a última faixa é aberta)
+    BUCKETS_MS = (1, 5, 10, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+    
+    def reset(self):
+        with self._lock:
+            self.counts = [0] * (len(self.BUCKETS_MS) + 1)
+            self.acquired = 0
+            self.failed = 0
+            self.retries = 0
+            self.total_ms = 0.0
+            self.max_ms = 0.0
+    
+    def record(self, wait_s, retries, acquired):
+        wait_ms = wait_s * 1000
+        index = next((i for i, limit in enumerate(self.BUCKETS_MS) if wait_ms <= limit),
+                     len(self.BUCKETS_MS))
+        with self._lock:
+            self.counts[index] += 1
+            self.retries += retries
+            self.total_ms += wait_ms
+            self.max_ms = max(self.max_ms, wait_ms)
+            if acquired:
+                self.acquired += 1
+            else:
+                self.failed += 1
+    
+    def snapshot(self):
+        """Cópia dos contadores: {'acquired', 'failed', 'retries', 'avg_ms', 'max_ms', 'histogram'}"""
+        with self._lock:
+            total = self.acquired + self.failed
+            labels = [f"<= {limit} ms" for limit in self.BUCKETS_MS] + [f"> {self.BUCKETS_MS[-1]} ms"]
+            return {
+                'acquired': self.acquired,
+                'failed': self.failed,
+                'retries': self.retries,
+                'avg_ms': self.total_ms / total if total else 0.0,
+                'max_ms': self.max_ms,
+                'histogram': list(zip(labels, self.counts))
+            }
+    
+    def merge(self, snapshot):
+        """Soma um snapshot (ex: de outro processo) a estes contadores"""
+        with self._lock:
+            for i, (_, count) in enumerate(snapshot['histogram']):
+                self.counts[i] += count
+            self.acquired += snapshot['acquired']
+            self.failed += snapshot['failed']
+            self.retries += snapshot['retries']
+            self.total_ms += snapshot['avg_ms'] * (snapshot['acquired'] + snapshot['failed'])
+            self.max_ms = max(self.max_ms, snapshot['max_ms'])
+
+
+lock_stats = LockWaitStats()
+
+def _is_busy(error):
+    message = str(error).lower()
+    return 'locked' in message or 'busy' in message
+
+def is_transient_error(error):
+    """
+    Falha passageira de acesso ao banco (bloqueio de outro terminal ou
+    DatabaseBusyError): a mesma operação pode ser repetida mais tarde
+    """
+    return isinstance(error, sqlite3.OperationalError) and (
+        isinstance(error, DatabaseBusyError) or _is_busy(error))
+
+def connect_write(budget=None):
+    """
+    Retorna uma conexão com a transação de escrita já iniciada (BEGIN IMMEDIATE)
+    
+    O bloqueio é obtido antes de qualquer leitura, então a transação nunca
+    precisa ser promovida no meio do caminho (o que falharia com "database is
+    locked" quando outro terminal grava ao mesmo tempo). Enquanto outro
+    terminal detém o bloqueio, tenta de novo com espera exponencial aleatória
+    até esgotar budget segundos (padrão WRITE_LOCK_BUDGET), e então levanta
+    DatabaseBusyError. O chamador faz commit() ou fecha a conexão (rollback).
+    """
+    conn = connect()
+    _begin_immediate(conn, budget)
+    return conn
+
+def _begin_immediate(conn, budget=None):
+    """Inicia BEGIN IMMEDIATE em uma conexão já aberta (ver connect_write)"""
+    budget = WRITE_LOCK_BUDGET if budget is None else budget
+    conn.execute(f"PRAGMA busy_timeout={WRITE_LOCK_POLL_MS}")
+    
+    start = time.monotonic()
+    retries = 0
+    while True:
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            break
+        except sqlite3.OperationalError as e:
+            elapsed = time.monotonic() - start
+            if not _is_busy(e) or elapsed >= budget:
+                conn.close()
+                if not _is_busy(e):
+                    raise
+                lock_stats.record(elapsed, retries, acquired=False)
+                raise DatabaseBusyError(
+                    f"Banco de dados ocupado por outro terminal há {elapsed:.1f}s; tente novamente"
+                ) from e
+            retries += 1
+            # Espera aleatória ("full jitter") para os terminais não tentarem juntos
+            delay = random.uniform(0, min(WRITE_BACKOFF_MAX, WRITE_BACKOFF_BASE * 2 ** retries))
+            time.sleep(min(delay, max(0.0, budget - elapsed)))
+    
+    lock_stats.record(time.monotonic() - start, retries, acquired=True)
+    # Commit e checkpoint voltam a usar a espera normal
+    conn.execute(f"PRAGMA busy_timeout={DB_TIMEOUT * 1000}")
+
+@contextmanager
+def write_transaction(budget=None):
+    """
+    Contexto com uma conexão de connect_write(): commit na saída normal
+    (inclusive return ou break no meio do bloco), rollback em exceção e
+    fechamento sempre
+    
+    O bloco contém apenas as instruções da transação: log_action (outra
+    transação de escrita) e _notify_event vêm depois dele. Uma exceção
+    libera o bloqueio antes de chegar ao tratamento do chamador, que pode
+    então registrar a falha sem esperar pelo próprio bloqueio.
+    """
+    conn = connect_write(budget)
+    try:
+        yield conn
+        conn.commit()
+    except BaseException:
+        # close() sozinho não libera o bloqueio enquanto um cursor mantém a
+        # instrução que falhou (a conexão só é fechada de fato depois)
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+def get_lock_stats():
+    """Estatísticas de espera pelo bloqueio de escrita deste processo"""
+    return lock_stats.snapshot()
+
+# --- Notificação de alterações de ponto (após o commit) ---
+_event_listeners = []
+
+def add_event_listener(callback):
+    """
+    Registra callback(acao, emp_id, tipo, timestamp) chamado após cada
+    alteração de ponto confirmada no banco
+    
+    acao: 'registro', 'ajuste', 'remocao' ou 'funcionario' (cadastro/remoção,
+    com tipo e timestamp None). O callback roda na thread que fez a gravação.
+    """
+    if callback not in _event_listeners:
+        _event_listeners.append(callback)
+
+def remove_event_listener(callback):
+    """Remove um callback registrado com add_event_listener"""
+    if callback in _event_listeners:
+        _event_listeners.remove(callback)
+
+def _notify_event(action, emp_id, event_type=None, timestamp=None):
+    for callback in list(_event_listeners):
+        try:
+            callback(action, emp_id, event_type, timestamp)
+        except Exception as e:
+            print(f"Erro ao notificar alteração de ponto: {e}")
+
 def init_db():
     """Inicializa o banco de dados com todas as tabelas necessárias"""
     conn = connect()
     c = conn.cursor()
+    
+    # Banco novo: páginas liberadas (ex: retenção de logs) voltam ao sistema
+    # aos poucos com PRAGMA incremental_vacuum. O modo só vale após um VACUUM
+    # (instantâneo com o banco vazio); bancos existentes são convertidos por
+    # incremental_vacuum(convert=True)
+    if c.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()[0] == 0:
+        c.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        c.execute("VACUUM")
 
     c.execute('''
         CREATE TABLE IF NOT EXISTS funcionarios (
@@ -39,6 +316,22 @@ def init_db():
         CREATE INDEX IF NOT EXISTS idx_eventos_func_data 
         ON eventos(funcionario_id, DATE(timestamp))
     ''')
+    
+    # Versão dos eventos: muda a cada alteração em eventos, de qualquer
+    # terminal (valida o cache de estado do dia em punch_state.py)
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS versao_eventos (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            versao INTEGER NOT NULL
+        )
+    ''')
+    c.execute('INSERT OR IGNORE INTO versao_eventos (id, versao) VALUES (1, 0)')
+    for suffix, operation in (('ins', 'INSERT'), ('upd', 'UPDATE'), ('del', 'DELETE')):
+        c.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS versao_eventos_{suffix} AFTER {operation} ON eventos BEGIN
+                UPDATE versao_eventos SET versao = versao + 1 WHERE id = 1;
+            END
+        ''')
 
     c.execute('''
         CREATE TABLE IF NOT EXISTS feriados (
@@ -93,6 +386,45 @@ def init_db():
         CREATE INDEX IF NOT EXISTS idx_logs_categoria 
         ON logs(categoria, timestamp DESC)
     ''')
+    
+    c.execute('''
+        CREATE INDEX IF NOT EXISTS idx_logs_usuario 
+        ON logs(usuario, timestamp DESC)
+    ''')
+    
+    _init_log_search(c)
+    
+    # Meses de logs particionados (ver purge_old_logs); arquivo NULL após a retenção
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS particoes_logs (
+            mes TEXT PRIMARY KEY,
+            arquivo TEXT,
+            registros INTEGER NOT NULL,
+            checksum TEXT NOT NULL,
+            criada_em TEXT NOT NULL,
+            descartada_em TEXT
+        )
+    ''')
+    
+    # Anos de eventos arquivados em arquivos próprios (ver archive_event_year)
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS particoes_eventos (
+            ano INTEGER PRIMARY KEY,
+            arquivo TEXT NOT NULL,
+            registros INTEGER NOT NULL,
+            checksum TEXT NOT NULL,
+            arquivado_em TEXT NOT NULL
+        )
+    ''')
+    
+    # Chaves dos registros já aplicados a partir do spool (idempotência)
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS registros_aplicados (
+            chave TEXT PRIMARY KEY,
+            evento_id INTEGER,
+            aplicado_em TEXT NOT NULL
+        )
+    ''')
 
     conn.commit()
     
@@ -101,6 +433,54 @@ def init_db():
     
     conn.close()
 
+# Índice de busca dos logs (também criado em cada partição mensal). Sem
+# conteúdo (content=''): o aplicativo indexa o texto já descompactado
+# (_index_logs), e nenhum gatilho ou visão do esquema depende de funções SQL
+# do Marc, então qualquer cliente SQLite continua gravando em logs
+LOG_FTS_SQL = '''
+    CREATE VIRTUAL TABLE logs_fts USING fts5(
+        acao, detalhes,
+        content='',
+        tokenize='unicode61 remove_diacritics 2'
+    )
+'''
+
+def _init_log_search(c):
+    """
+    Índice FTS5 de acao e detalhes dos logs, mantido por _insert_log e pela
+    retenção (_purge_partitioned_logs)
+    
+    Só os ids acima de busca_logs.pendente_ate estão indexados: em um banco
+    que já tinha logs, os anteriores são indexados aos poucos por
+    index_old_logs(), dos mais recentes para os mais antigos.
+    """
+    try:
+        row = c.execute("SELECT sql FROM sqlite_master WHERE name='logs_fts'").fetchone()
+        if row and "content=''" not in row[0]:
+            # Índice de versões anteriores (conteúdo externo mantido por
+            # gatilhos): recriado sem conteúdo e reindexado aos poucos
+            for trigger in ('logs_fts_ins', 'logs_fts_del', 'logs_fts_upd'):
+                c.execute(f'DROP TRIGGER IF EXISTS {trigger}')
+            c.execute('DROP TABLE logs_fts')
+            c.execute('DROP VIEW IF EXISTS logs_texto')
+            row = None
+        
+        if not row:
+            c.execute(LOG_FTS_SQL)
+            c.execute('''
+                CREATE TABLE IF NOT EXISTS busca_logs (
+                    id INTEGER PRIMARY KEY CHECK (id = 1),
+                    pendente_ate INTEGER NOT NULL
+                )
+            ''')
+            c.execute('''
+                INSERT OR REPLACE INTO busca_logs (id, pendente_ate)
+                SELECT 1, COALESCE(MAX(id), 0) FROM logs
+            ''')
+    except sqlite3.OperationalError as e:
+        # SQLite sem o módulo FTS5: o restante do sistema funciona sem a busca
+        print(f"⚠️  Busca textual nos logs indisponível: {e}")
+
 def _create_default_users(conn):
     """Cria usuários padrão (admin e funcionário) se não existirem"""
     c = conn.cursor()
@@ -112,7 +492,7 @@ def _create_default_users(conn):
     if count == 0:
         # Criar usuário admin
         admin_password = "admin123"
-        admin_hash = bcrypt.hashpw(admin_password.encode('utf-8'), bcrypt.gensalt())
+        admin_hash = hash_password(admin_password)
         
         c.execute('''
             INSERT INTO usuarios (username, password_hash, is_admin, created_at)
@@ -121,7 +501,7 @@ def _create_default_users(conn):
         
         # Criar usuário funcionário
         func_password = "func123"
-        func_hash = bcrypt.hashpw(func_password.encode('utf-8'), bcrypt.gensalt())
+        func_hash = hash_password(func_password)
         
         c.execute('''
             INSERT INTO usuarios (username, password_hash, is_admin, created_at)
@@ -145,24 +525,248 @@ def log_action(usuario, acao, categoria, detalhes=None, ip_address=None, status=
     - status: "sucesso" ou "falha"
     """
     try:
-        conn = connect()
-        c = conn.cursor()
-        
-        timestamp = datetime.datetime.now().isoformat()
-        
-        c.execute('''
-            INSERT INTO logs (timestamp, usuario, acao, categoria, detalhes, ip_address, status)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-        ''', (timestamp, usuario, acao, categoria, detalhes, ip_address, status))
-        
-        conn.commit()
-        conn.close()
+        with write_transaction() as conn:
+            _insert_log(conn.cursor(), usuario, acao, categoria, detalhes, ip_address, status)
         return True
         
     except sqlite3.Error as e:
         print(f"Erro ao registrar log: {e}")
         return False
 
+def _insert_log(c, usuario, acao, categoria, detalhes=None, ip_address=None, status='sucesso'):
+    """Insere um registro de auditoria (e o indexa para a busca) na transação do cursor informado (sem commit)"""
+    c.execute('''
+        INSERT INTO logs (timestamp, usuario, acao, categoria, detalhes, ip_address, status)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    ''', (datetime.datetime.now().isoformat(), usuario, acao, categoria, pack_details(detalhes),
+          ip_address, status))
+    if _indexed_after(c.connection) is not None:
+        c.connection.execute('INSERT INTO logs_fts (rowid, acao, detalhes) VALUES (?, ?, ?)',
+                             (c.lastrowid, acao, detalhes))
+
+def _indexed_after(conn):
+    """
+    Ids acima deste estão no índice de busca (busca_logs.pendente_ate);
+    None se o banco não tem o índice (SQLite sem FTS5)
+    """
+    if not conn.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='busca_logs'").fetchone():
+        return None
+    row = conn.execute('SELECT pendente_ate FROM busca_logs').fetchone()
+    return row[0] if row else None
+
+def _index_logs(conn, rows, delete=False):
+    """
+    Inclui no índice de busca (ou retira, com delete=True) as linhas
+    (id, acao, detalhes como gravados); o índice recebe o texto descompactado
+    e, sem conteúdo próprio, só retira uma linha com os mesmos valores indexados
+    """
+    if delete:
+        sql = "INSERT INTO logs_fts (logs_fts, rowid, acao, detalhes) VALUES ('delete', ?, ?, ?)"
+    else:
+        sql = 'INSERT INTO logs_fts (rowid, acao, detalhes) VALUES (?, ?, ?)'
+    conn.executemany(sql, ((log_id, acao, unpack_details(detalhes)) for log_id, acao, detalhes in rows))
+
+def reset_log_search(conn):
+    """
+    Esvazia o índice de busca de um banco cujos logs foram alterados por fora
+    do aplicativo (ex: restauração em ponto no tempo); os logs voltam a ser
+    indexados aos poucos por index_old_logs() (sem commit)
+    """
+    if _indexed_after(conn) is None:
+        return
+    conn.execute("INSERT INTO logs_fts (logs_fts) VALUES ('delete-all')")
+    conn.execute('UPDATE busca_logs SET pendente_ate = (SELECT COALESCE(MAX(id), 0) FROM logs)')
+
+# --- Compressão dos detalhes de logs ---
+# Detalhes grandes são gravados compactados (zlib + base85, continuam TEXT
+# para a captura de alterações em JSON) com um marcador no início. A leitura
+# é transparente: _log_row descompacta e o índice de busca recebe o texto
+# original (_index_logs).
+LOG_DETAILS_COMPRESS_MIN = int(os.environ.get('MARC_LOG_COMPRESS_MIN', 512))  # caracteres
+COMPRESSED_DETAILS_PREFIX = '\x01z1:'
+
+def pack_details(text):
+    """Compacta detalhes a partir de LOG_DETAILS_COMPRESS_MIN caracteres (se ficarem menores)"""
+    if not isinstance(text, str) or len(text) < LOG_DETAILS_COMPRESS_MIN:
+        return text
+    packed = COMPRESSED_DETAILS_PREFIX + base64.b85encode(zlib.compress(text.encode('utf-8'), 9)).decode('ascii')
+    return packed if len(packed) < len(text) else text
+
+def unpack_details(value):
+    """Texto original dos detalhes (valores sem o marcador são retornados como estão)"""
+    if isinstance(value, str) and value.startswith(COMPRESSED_DETAILS_PREFIX):
+        return zlib.decompress(base64.b85decode(value[len(COMPRESSED_DETAILS_PREFIX):])).decode('utf-8')
+    return value
+
+def register_log_functions(conn):
+    """
+    Registra log_detalhes() na conexão, para consultas que ordenam pelo texto
+    dos detalhes (nunca usada em visões ou gatilhos: o banco precisa
+    continuar gravável por outros clientes SQLite)
+    """
+    conn.create_function('log_detalhes', 1, unpack_details, deterministic=True)
+
+# Tamanho do trecho com os termos encontrados (em palavras)
+SEARCH_EXCERPT_WORDS = 12
+
+def _fold(text):
+    """Minúsculas e sem acentos, como o tokenizador do índice (remove_diacritics)"""
+    return ''.join(ch for ch in unicodedata.normalize('NFKD', text.lower()) if not unicodedata.combining(ch))
+
+def _search_excerpt(text, busca):
+    """
+    Trecho de text com os termos da busca entre [ ] (o snippet() do FTS5 não
+    funciona em um índice sem conteúdo, então o trecho é montado aqui)
+    """
+    if not text:
+        return text
+    exact, prefixes = set(), []
+    for phrase, word in re.findall(r'"([^"]*)"|(\S+)', busca or ''):
+        for term in re.findall(r'\w+', _fold(phrase or word)):
+            if phrase or term.isdigit():
+                exact.add(term)
+            else:
+                prefixes.append(term)
+    
+    words = list(re.finditer(r'\w+', text))
+    if not words:
+        return text
+    hits = set()
+    for i, word in enumerate(words):
+        folded = _fold(word.group())
+        if folded in exact or (prefixes and folded.startswith(tuple(prefixes))):
+            hits.add(i)
+    
+    first = min(hits) if hits else 0
+    start = max(0, min(first - 2, len(words) - SEARCH_EXCERPT_WORDS))
+    end = min(len(words), start + SEARCH_EXCERPT_WORDS)
+    parts = []
+    pos = words[start].start()
+    for i in range(start, end):
+        word = words[i]
+        parts.append(text[pos:word.start()])
+        parts.append(f'[{word.group()}]' if i in hits else word.group())
+        pos = word.end()
+    return ('…' if start > 0 else '') + ''.join(parts) + ('…' if end < len(words) else '')
+
+# Colunas aceitas na ordenação de logs (evita SQL arbitrário no ORDER BY)
+LOG_SORT_COLUMNS = ('timestamp', 'usuario', 'categoria', 'acao', 'status', 'detalhes')
+# Ordenação pela relevância da busca textual (bm25; ação pesa mais que detalhes)
+SORT_RELEVANCE = 'relevancia'
+LOG_SEARCH_WEIGHTS = (2.0, 1.0)
+
+def _fts_query(texto):
+    """
+    Converte o texto digitado em uma consulta FTS5 segura: "frases entre
+    aspas" exatas, números exatos e demais palavras como prefixo, todas
+    obrigatórias. Retorna None se não sobrar nenhum termo.
+    """
+    terms = []
+    for phrase, word in re.findall(r'"([^"]*)"|(\S+)', texto or ''):
+        if phrase.strip():
+            terms.append(f'"{phrase}"')
+        elif word:
+            word = word.replace('"', '')
+            terms.append(f'"{word}"' if word.isdigit() else f'"{word}"*')
+    return ' '.join(terms) or None
+
+def _logs_filter(categoria=None, usuario=None, data_inicio=None, data_fim=None, busca=None,
+                 schema='main'):
+    """
+    Monta a cláusula WHERE dos filtros de logs; retorna (sql, parâmetros)
+    schema: banco da tabela consultada (main ou uma partição mensal anexada)
+    """
+    query = ' WHERE 1=1'
+    params = []
+    
+    match = _fts_query(busca)
+    if match:
+        query += f' AND logs.id IN (SELECT rowid FROM {schema}.logs_fts WHERE logs_fts MATCH ?)'
+        params.append(match)
+    
+    if categoria:
+        query += ' AND categoria = ?'
+        params.append(categoria)
+    
+    if usuario:
+        query += ' AND usuario = ?'
+        params.append(usuario)
+    
+    if data_inicio:
+        if isinstance(data_inicio, datetime.date):
+            data_inicio = data_inicio.isoformat()
+        query += ' AND DATE(timestamp) >= ?'
+        params.append(data_inicio)
+    
+    if data_fim:
+        if isinstance(data_fim, datetime.date):
+            data_fim = data_fim.isoformat()
+        query += ' AND DATE(timestamp) <= ?'
+        params.append(data_fim)
+    
+    return query, params
+
+def _logs_unions(conn, select, leading_params=(), trailing_params=(), **filters):
+    """
+    Repete select (com {schema} e {where}) para cada fonte de logs do
+    período dos filtros, unidas por UNION ALL, um lote de fontes por vez
+    (ver _logs_source_batches)
+    leading_params: parâmetros de select anteriores ao {where}
+    trailing_params: parâmetros de select posteriores ao {where}
+    Gera: (sql, parâmetros) de cada lote; a consulta deve ser executada e
+    lida antes de pedir o próximo lote (as partições anexadas mudam)
+    """
+    for sources in _logs_source_batches(conn, filters.get('data_inicio'), filters.get('data_fim')):
+        parts = []
+        params = []
+        for schema, extra, extra_params in sources:
+            where, where_params = _logs_filter(**filters, schema=schema)
+            parts.append(select.format(schema=schema, where=where + extra))
+            params += list(leading_params) + where_params + extra_params + list(trailing_params)
+        yield ' UNION ALL '.join(parts), params
+
+def _sql_sort_value(value):
+    """Chave Python com a ordem do SQLite: NULL, números, texto e blobs"""
+    if value is None:
+        return (0, 0)
+    if isinstance(value, (int, float)):
+        return (1, value)
+    if isinstance(value, str):
+        return (2, value)  # ordem dos code points = ordem binária do UTF-8
+    return (3, bytes(value))
+
+def _keyset_condition(expr, value, row_id, descending, id_descending):
+    """
+    Condição das linhas posteriores a (value, row_id) na ordem por expr e id
+    (paginação por chave; NULL vem antes de qualquer valor na ordem
+    crescente, como no SQLite)
+    Retorna: (sql, parâmetros)
+    """
+    id_op = '<' if id_descending else '>'
+    if value is None:
+        if descending:
+            return f" AND ({expr} IS NULL AND logs.id {id_op} ?)", [row_id]
+        return f" AND ({expr} IS NOT NULL OR logs.id {id_op} ?)", [row_id]
+    op = '<' if descending else '>'
+    nulls_after = f" OR {expr} IS NULL" if descending else ""
+    return (f" AND ({expr} {op} ? OR ({expr} = ? AND logs.id {id_op} ?){nulls_after})",
+            [value, value, row_id])
+
+def _log_row(row):
+    log = {
+        'id': row[0],
+        'timestamp': row[1],
+        'usuario': row[2],
+        'acao': row[3],
+        'categoria': row[4],
+        'detalhes': unpack_details(row[5]),
+        'ip_address': row[6],
+        'status': row[7]
+    }
+    if len(row) > 8:
+        log['relevancia'] = row[8]  # bm25 (chave da paginação na busca por relevância)
+    return log
+
 def get_logs(limit=100, categoria=None, usuario=None, data_inicio=None, data_fim=None):
     """
     Recupera logs de auditoria com filtros opcionais
@@ -174,50 +778,91 @@ def get_logs(limit=100, categoria=None, usuario=None, data_inicio=None, data_fim
     - data_inicio: data inicial (datetime.date ou string ISO)
     - data_fim: data final (datetime.date ou string ISO)
     """
+    return get_logs_page(0, limit, categoria=categoria, usuario=usuario,
+                         data_inicio=data_inicio, data_fim=data_fim)
+
+def get_logs_page(offset, limit, categoria=None, usuario=None, data_inicio=None, data_fim=None,
+                  sort_by='timestamp', descending=True, busca=None, after=None, before=None):
+    """
+    Recupera uma página de logs com filtro e ordenação feitos no banco
+    
+    Parâmetros:
+    - offset, limit: posição e tamanho da página
+    - categoria, usuario, data_inicio, data_fim: filtros (como em get_logs)
+    - sort_by: coluna de LOG_SORT_COLUMNS ou SORT_RELEVANCE (requer busca)
+    - descending: ordem decrescente
+    - busca: texto procurado em acao e detalhes (ver _fts_query)
+    - after / before: (valor de sort_by, id) da linha imediatamente antes /
+      depois da página (paginação por chave, offset é ignorado): o banco
+      continua do índice em vez de percorrer e descartar offset linhas
+    """
+    if sort_by not in LOG_SORT_COLUMNS and sort_by != SORT_RELEVANCE:
+        raise ValueError(f"Coluna de ordenação inválida: {sort_by}")
+    
     try:
         conn = connect()
         c = conn.cursor()
         
-        query = 'SELECT * FROM logs WHERE 1=1'
-        params = []
-        
-        if categoria:
-            query += ' AND categoria = ?'
-            params.append(categoria)
-        
-        if usuario:
-            query += ' AND usuario = ?'
-            params.append(usuario)
-        
-        if data_inicio:
-            if isinstance(data_inicio, datetime.date):
-                data_inicio = data_inicio.isoformat()
-            query += ' AND DATE(timestamp) >= ?'
-            params.append(data_inicio)
-        
-        if data_fim:
-            if isinstance(data_fim, datetime.date):
-                data_fim = data_fim.isoformat()
-            query += ' AND DATE(timestamp) <= ?'
-            params.append(data_fim)
-        
-        query += ' ORDER BY timestamp DESC LIMIT ?'
-        params.append(limit)
-        
-        c.execute(query, params)
-        
-        logs = []
-        for row in c.fetchall():
-            logs.append({
-                'id': row[0],
-                'timestamp': row[1],
-                'usuario': row[2],
-                'acao': row[3],
-                'categoria': row[4],
-                'detalhes': row[5],
-                'ip_address': row[6],
-                'status': row[7]
-            })
+        filters = dict(categoria=categoria, usuario=usuario, data_inicio=data_inicio, data_fim=data_fim)
+        match = _fts_query(busca)
+        if sort_by == SORT_RELEVANCE and match:
+            # Junção com o índice de cada fonte para ordenar pelo bm25
+            weights = ', '.join(str(w) for w in LOG_SEARCH_WEIGHTS)
+            select = ("SELECT logs.*, {expr} AS relevancia "
+                      "FROM {schema}.logs_fts JOIN {schema}.logs "
+                      "ON logs.id = logs_fts.rowid AND logs_fts MATCH ?{where}")
+            expr, leading_params = f'bm25(logs_fts, {weights})', [match]
+            descending, id_descending = False, True  # mais relevante primeiro, depois mais recente
+            busca_filter = None  # já aplicada pela junção
+        else:
+            if sort_by == SORT_RELEVANCE:
+                # Busca sem termos: mais recentes primeiro (a chave recebida é de relevância)
+                sort_by, descending = 'timestamp', True
+                after = before = None
+            select = 'SELECT * FROM {schema}.logs{where}'
+            expr = sort_by
+            if sort_by == 'detalhes':
+                # Ordenar pelo texto (detalhes compactados começam pelo marcador)
+                select = ('SELECT id, timestamp, usuario, acao, categoria, {expr} AS detalhes, '
+                          'ip_address, status FROM {schema}.logs{where}')
+                expr = 'log_detalhes(detalhes)'
+            leading_params = []
+            id_descending = descending  # id desempata linhas iguais para que as páginas não se sobreponham
+            busca_filter = busca
+        
+        keyset, keyset_params = '', []
+        if after is not None or before is not None:
+            # Antes da página: percorrer na ordem inversa e desinverter no fim
+            reverse = after is None
+            value, row_id = after if after is not None else before
+            keyset, keyset_params = _keyset_condition(expr, value, row_id, descending != reverse,
+                                                      id_descending != reverse)
+            offset = 0
+        else:
+            reverse = False
+        
+        column = 'relevancia' if sort_by == SORT_RELEVANCE else sort_by
+        direction = 'DESC' if descending != reverse else 'ASC'
+        id_direction = 'DESC' if id_descending != reverse else 'ASC'
+        batches = _logs_unions(conn, select.replace('{expr}', expr) + keyset,
+                               leading_params=leading_params, trailing_params=keyset_params,
+                               busca=busca_filter, **filters)
+        rows = []
+        for batch, (union, params) in enumerate(batches):
+            # Cada lote traz suas primeiras offset + limit linhas; a página sai da junção
+            c.execute(f'{union} ORDER BY {column} {direction}, id {id_direction} LIMIT ?',
+                      params + [offset + limit])
+            rows += c.fetchall()
+        if batch:
+            index = 8 if column == 'relevancia' else LOG_COLUMNS.split(', ').index(column)
+            rows.sort(key=lambda row: row[0], reverse=id_direction == 'DESC')
+            rows.sort(key=lambda row: _sql_sort_value(row[index]), reverse=direction == 'DESC')
+        logs = [_log_row(row) for row in rows[offset:offset + limit]]
+        if reverse:
+            logs.reverse()
+        if sort_by == SORT_RELEVANCE:
+            for log in logs:
+                log['trecho'] = _search_excerpt(log['detalhes'], busca)  # trecho dos detalhes com os termos
         
         conn.close()
         return logs
@@ -226,6 +871,82 @@ def get_logs(limit=100, categoria=None, usuario=None, data_inicio=None, data_fim
         print(f"Erro ao buscar logs: {e}")
         return []
 
+def count_logs(categoria=None, usuario=None, data_inicio=None, data_fim=None, busca=None, **_sort):
+    """Retorna o número de logs que atendem aos filtros (sort_by/descending são ignorados)"""
+    try:
+        conn = connect()
+        c = conn.cursor()
+        
+        total = 0
+        for union, params in _logs_unions(conn, 'SELECT COUNT(*) AS n FROM {schema}.logs{where}',
+                                          categoria=categoria, usuario=usuario, busca=busca,
+                                          data_inicio=data_inicio, data_fim=data_fim):
+            c.execute(f'SELECT SUM(n) FROM ({union})', params)
+            total += c.fetchone()[0] or 0
+        
+        conn.close()
+        return total
+        
+    except sqlite3.Error as e:
+        print(f"Erro ao contar logs: {e}")
+        return 0
+
+def search_logs(texto, offset=0, limit=50, categoria=None, usuario=None, data_inicio=None, data_fim=None):
+    """
+    Busca textual nos logs (acao e detalhes), do mais relevante ao menos
+    relevante; cada resultado traz também 'trecho' (detalhes com os termos entre [ ])
+    
+    Exemplos: 'ajuste 42', '"esqueceu de registrar"', 'justif'
+    Retorna: (página de logs, total de resultados)
+    """
+    filters = dict(categoria=categoria, usuario=usuario, data_inicio=data_inicio, data_fim=data_fim)
+    logs = get_logs_page(offset, limit, sort_by=SORT_RELEVANCE, busca=texto, **filters)
+    return logs, count_logs(busca=texto, **filters)
+
+def log_search_pending():
+    """Número aproximado de logs antigos ainda não indexados para a busca"""
+    try:
+        conn = connect()
+        c = conn.cursor()
+        c.execute('SELECT pendente_ate FROM busca_logs')
+        row = c.fetchone()
+        pending = 0
+        if row and row[0]:
+            c.execute('SELECT COUNT(*) FROM logs WHERE id <= ?', (row[0],))
+            pending = c.fetchone()[0]
+        conn.close()
+        return pending
+    except sqlite3.Error as e:
+        print(f"Erro ao verificar índice de busca: {e}")
+        return 0
+
+def index_old_logs(batch_size=5000, cancel_event=None):
+    """
+    Indexa para a busca os logs anteriores à criação do índice, em lotes
+    curtos (dos mais recentes para os mais antigos)
+    Retorna: número de logs indexados
+    """
+    indexed = 0
+    try:
+        while cancel_event is None or not cancel_event.is_set():
+            with write_transaction() as conn:
+                c = conn.cursor()
+                row = c.execute('SELECT pendente_ate FROM busca_logs').fetchone()
+                if not row or row[0] <= 0:
+                    break
+                upper = row[0]
+                lower = max(0, upper - batch_size)
+                rows = c.execute('SELECT id, acao, detalhes FROM logs WHERE id > ? AND id <= ?',
+                                 (lower, upper)).fetchall()
+                _index_logs(conn, rows)
+                indexed += len(rows)
+                c.execute('UPDATE busca_logs SET pendente_ate=?', (lower,))
+    except sqlite3.Error as e:
+        print(f"Erro ao indexar logs para a busca: {e}")
+    if indexed:
+        print(f"✓ {indexed} logs indexados para a busca")
+    return indexed
+
 def get_logs_summary(data_inicio=None, data_fim=None):
     """
     Retorna resumo estatístico dos logs
@@ -234,31 +955,16 @@ def get_logs_summary(data_inicio=None, data_fim=None):
         conn = connect()
         c = conn.cursor()
         
-        query = 'SELECT categoria, status, COUNT(*) FROM logs WHERE 1=1'
-        params = []
-        
-        if data_inicio:
-            if isinstance(data_inicio, datetime.date):
-                data_inicio = data_inicio.isoformat()
-            query += ' AND DATE(timestamp) >= ?'
-            params.append(data_inicio)
-        
-        if data_fim:
-            if isinstance(data_fim, datetime.date):
-                data_fim = data_fim.isoformat()
-            query += ' AND DATE(timestamp) <= ?'
-            params.append(data_fim)
-        
-        query += ' GROUP BY categoria, status'
-        
-        c.execute(query, params)
-        
         summary = {}
-        for row in c.fetchall():
-            categoria, status, count = row
-            if categoria not in summary:
-                summary[categoria] = {'sucesso': 0, 'falha': 0}
-            summary[categoria][status] = count
+        for union, params in _logs_unions(
+                conn, 'SELECT categoria, status, COUNT(*) AS n FROM {schema}.logs{where} GROUP BY categoria, status',
+                data_inicio=data_inicio, data_fim=data_fim):
+            c.execute(f'SELECT categoria, status, SUM(n) FROM ({union}) GROUP BY categoria, status', params)
+            for row in c.fetchall():
+                categoria, status, count = row
+                if categoria not in summary:
+                    summary[categoria] = {'sucesso': 0, 'falha': 0}
+                summary[categoria][status] = summary[categoria].get(status, 0) + count
         
         conn.close()
         return summary
@@ -269,35 +975,545 @@ def get_logs_summary(data_inicio=None, data_fim=None):
 
 def clear_old_logs(days=90):
     """
-    Remove logs mais antigos que X dias (para manutenção)
-    Retorna: número de registros removidos
+    Arquiva e remove logs mais antigos que X dias (para manutenção)
+    Retorna: número de registros arquivados
+    """
+    return purge_old_logs(days)['archived']
+
+# --- Partições mensais e retenção de logs ---
+# A tabela logs guarda apenas os meses ainda não encerrados. Cada mês
+# encerrado vira uma partição somente leitura (arquivo/logs/logs_AAAA-MM.db,
+# com o próprio índice de busca), anexada apenas quando a consulta alcança o
+# mês. Na retenção a partição inteira vai para o arquivo compactado
+# (logs_AAAA-MM.jsonl.gz) e sai do registro, sem remoção linha a linha.
+LOG_RETENTION_DAYS = int(os.environ.get('MARC_LOG_RETENTION_DAYS', 90))
+LOG_ARCHIVE_DIR = os.environ.get('MARC_LOG_ARCHIVE_DIR')  # padrão: arquivo/logs/ ao lado do banco
+LOG_PURGE_BATCH = 500  # linhas por transação ao limpar meses já particionados
+LOG_PURGE_PAUSE_S = 0.05  # folga entre lotes para os terminais gravarem
+VACUUM_STEP_PAGES = 256  # páginas devolvidas por transação
+LOG_COLUMNS = 'id, timestamp, usuario, acao, categoria, detalhes, ip_address, status'
+
+def log_archive_dir(db_file=None):
+    """Diretório das partições e do arquivo compactado de logs (padrão DB_FILE)"""
+    return LOG_ARCHIVE_DIR or os.path.join(event_partition_dir(db_file), 'logs')
+
+def _iso(value):
+    return value.isoformat() if isinstance(value, datetime.date) else value
+
+def _month_start(month):
+    """'AAAA-MM' -> 'AAAA-MM-01'"""
+    return f"{month}-01"
+
+def _next_month(month):
+    year, number = int(month[:4]), int(month[5:7])
+    return f"{year + number // 12:04d}-{number % 12 + 1:02d}"
+
+def _hot_start(conn):
+    """Primeiro dia ainda guardado em main.logs (None se nenhum mês foi particionado)"""
+    row = conn.execute('SELECT MAX(mes) FROM particoes_logs').fetchone()
+    return _month_start(_next_month(row[0])) if row and row[0] else None
+
+def _logs_source_batches(conn, data_inicio=None, data_fim=None):
+    """
+    Fontes de logs do período em lotes: gera listas de (schema, filtro
+    extra, parâmetros)
+    
+    - main.logs, com os meses ainda não particionados (linhas de meses já
+      particionados, à espera da limpeza em lotes, ficam de fora pelo filtro)
+    - as partições ativas cujo mês intersecta o período, anexadas somente
+      leitura com o schema logs_AAAA_MM, no máximo MAX_ATTACHED_PARTITIONS
+      por lote: as do lote anterior são desanexadas antes do seguinte
+      (retenções longas ou consultas sem datas percorrem todos os meses)
+    """
+    partitions = conn.execute('SELECT mes, arquivo FROM particoes_logs ORDER BY mes DESC').fetchall()
+    if not partitions:
+        yield [('main', '', [])]
+        return
+    
+    data_inicio, data_fim = _iso(data_inicio), _iso(data_fim)
+    hot_start = _month_start(_next_month(partitions[0][0]))
+    sources = []
+    if not data_fim or data_fim >= hot_start:
+        sources.append(('main', ' AND timestamp >= ?', [hot_start]))
+    
+    selected = [(month, filename) for month, filename in partitions
+                if filename and (not data_inicio or month >= data_inicio[:7])
+                and (not data_fim or month <= data_fim[:7])]
+    if not selected:
+        # Período anterior às partições ativas: consulta válida e vazia
+        yield sources or [('main', ' AND 0', [])]
+        return
+    
+    attached = {row[1] for row in conn.execute('PRAGMA database_list')}
+    for start in range(0, len(selected), MAX_ATTACHED_PARTITIONS):
+        batch = selected[start:start + MAX_ATTACHED_PARTITIONS]
+        aliases = ['logs_' + month.replace('-', '_') for month, _ in batch]
+        for alias in attached - set(aliases):
+            if alias.startswith('logs_'):
+                conn.execute(f'DETACH DATABASE {alias}')
+                attached.discard(alias)
+        for (month, filename), alias in zip(batch, aliases):
+            if alias not in attached:
+                path = os.path.join(log_archive_dir(), filename)
+                if not os.path.exists(path):
+                    raise sqlite3.OperationalError(f"Partição de logs de {month} não encontrada: {path}")
+                conn.execute(f'ATTACH DATABASE ? AS {alias}', (_readonly_uri(path),))
+                attached.add(alias)
+            sources.append((alias, '', []))
+        yield sources
+        sources = []
+
+def _append_log_archive(directory, rows):
+    """
+    Acrescenta os logs aos arquivos compactados do mês de cada um (um membro
+    gzip por lote) e só retorna depois que estão em disco
+    Retorna: nomes dos arquivos alterados
     """
+    by_month = {}
+    for row in rows:
+        by_month.setdefault(row['timestamp'][:7], []).append(row)
+    
+    for month, month_rows in by_month.items():
+        lines = ''.join(json.dumps(row, ensure_ascii=False) + '\n' for row in month_rows)
+        with open(os.path.join(directory, f"logs_{month}.jsonl.gz"), 'ab') as f:
+            f.write(gzip.compress(lines.encode('utf-8')))
+            f.flush()
+            os.fsync(f.fileno())
+    return [f"logs_{month}.jsonl.gz" for month in by_month]
+
+def read_archived_logs(data_inicio=None, data_fim=None, directory=None):
+    """
+    Lê os logs arquivados (mais antigos primeiro), no formato de get_logs
+    
+    Linhas repetidas (lote arquivado de novo após uma queda) são descartadas
+    pelo id; um lote incompleto no fim do arquivo é ignorado.
+    """
+    directory = directory or log_archive_dir()
+    data_inicio, data_fim = _iso(data_inicio), _iso(data_fim)
+    if not os.path.isdir(directory):
+        return
+    
+    seen = set()
+    for name in sorted(os.listdir(directory)):
+        if not (name.startswith('logs_') and name.endswith('.jsonl.gz')):
+            continue
+        month = name[len('logs_'):-len('.jsonl.gz')]
+        if (data_inicio and month < data_inicio[:7]) or (data_fim and month > data_fim[:7]):
+            continue
+        try:
+            with gzip.open(os.path.join(directory, name), 'rt', encoding='utf-8') as f:
+                for line in f:
+                    row = json.loads(line)
+                    day = row['timestamp'][:10]
+                    if row['id'] in seen or (data_inicio and day < data_inicio) or (data_fim and day > data_fim):
+                        continue
+                    seen.add(row['id'])
+                    yield row
+        except (EOFError, gzip.BadGzipFile, ValueError):
+            # Queda durante a gravação do último lote: ele continua no banco
+            continue
+
+def _write_log_partition(path, rows):
+    """Cria o arquivo da partição mensal com as linhas e o índice de busca"""
+    dest = sqlite3.connect(path)
+    try:
+        # Modo rollback: o arquivo fica autocontido e pode ser aberto com mode=ro
+        dest.execute('PRAGMA journal_mode=DELETE')
+        dest.execute('''
+            CREATE TABLE logs (
+                id INTEGER PRIMARY KEY,
+                timestamp TEXT NOT NULL,
+                usuario TEXT NOT NULL,
+                acao TEXT NOT NULL,
+                categoria TEXT NOT NULL,
+                detalhes TEXT,
+                ip_address TEXT,
+                status TEXT
+            )
+        ''')
+        dest.executemany(f'INSERT INTO logs ({LOG_COLUMNS}) VALUES (?,?,?,?,?,?,?,?)', rows)
+        dest.execute('CREATE INDEX idx_logs_timestamp ON logs(timestamp DESC)')
+        dest.execute('CREATE INDEX idx_logs_categoria ON logs(categoria, timestamp DESC)')
+        dest.execute('CREATE INDEX idx_logs_usuario ON logs(usuario, timestamp DESC)')
+        try:
+            dest.execute(LOG_FTS_SQL)
+            _index_logs(dest, dest.execute('SELECT id, acao, detalhes FROM logs'))
+        except sqlite3.OperationalError as e:
+            print(f"⚠️  Partição de logs sem índice de busca: {e}")
+        dest.commit()
+    finally:
+        dest.close()
+
+def _read_log_rows(conn, table, start, end, batch_size):
+    """Lê os logs de table com start <= timestamp < end, em lotes de dicionários"""
+    c = conn.execute(f'SELECT {LOG_COLUMNS} FROM {table} WHERE timestamp >= ? AND timestamp < ? ORDER BY id',
+                     (start, end))
+    while True:
+        rows = c.fetchmany(batch_size)
+        if not rows:
+            return
+        yield [_log_row(row) for row in rows]
+
+def _close_log_month(month, expired, batch_size):
+    """
+    Tira um mês encerrado de main.logs: cria a partição (ou, se o mês já
+    venceu, grava direto no arquivo compactado) e registra o mês
+    
+    A cópia é feita sem bloquear os terminais; com o bloqueio de escrita,
+    confere quantidade e soma de verificação com main.logs e só então
+    registra o mês (a partir daí as consultas leem a cópia). As linhas em
+    main.logs são removidas depois, em lotes (_purge_partitioned_logs).
+    Retorna: (quantidade, arquivos alterados)
+    """
+    directory = log_archive_dir()
+    start, end = _month_start(month), _month_start(_next_month(month))
+    filename = f"logs_{month}.db"
+    path = os.path.join(directory, filename)
+    temp_path = path + '.part'
+    files = []
+    
+    conn = connect()
+    try:
+        if expired:
+            for rows in _read_log_rows(conn, 'logs', start, end, batch_size):
+                files = _append_log_archive(directory, rows)
+            copied = _range_checksum(conn, 'logs', LOG_COLUMNS, start, end)
+        else:
+            _remove_partition_file(temp_path)
+            rows = conn.execute(f'SELECT {LOG_COLUMNS} FROM logs WHERE timestamp >= ? AND timestamp < ? ORDER BY id',
+                                (start, end))
+            _write_log_partition(temp_path, rows)
+    finally:
+        conn.close()
+    
+    if not expired:
+        check = sqlite3.connect(_readonly_uri(temp_path), uri=True)
+        try:
+            copied = _range_checksum(check, 'logs', LOG_COLUMNS, start, end)
+        finally:
+            check.close()
+    
+    with write_transaction() as conn:
+        c = conn.cursor()
+        if c.execute('SELECT 1 FROM particoes_logs WHERE mes=?', (month,)).fetchone() or \
+                _range_checksum(conn, 'main.logs', LOG_COLUMNS, start, end) != copied:
+            # Outro terminal registrou o mês ou as linhas mudaram: tentar na próxima execução
+            if not expired:
+                _remove_partition_file(temp_path)
+            return 0, []
+        
+        now = datetime.datetime.now().isoformat()
+        if expired:
+            c.execute('''
+                INSERT INTO particoes_logs (mes, arquivo, registros, checksum, criada_em, descartada_em)
+                VALUES (?, NULL, ?, ?, ?, ?)
+            ''', (month, copied[0], copied[1], now, now))
+            _insert_log(c, 'system', f"Arquivou os logs de {month} (retenção)", "sistema",
+                        detalhes=f"Registros: {copied[0]}, SHA-256: {copied[1]}")
+        else:
+            # Sobra de uma tentativa interrompida (nunca registrada) é substituída
+            _remove_partition_file(path)
+            os.replace(temp_path, path)
+            os.chmod(path, 0o444)
+            files = [filename]
+            c.execute('''
+                INSERT INTO particoes_logs (mes, arquivo, registros, checksum, criada_em)
+                VALUES (?, ?, ?, ?, ?)
+            ''', (month, filename, copied[0], copied[1], now))
+            _insert_log(c, 'system', f"Criou a partição de logs de {month}", "sistema",
+                        detalhes=f"Arquivo: {filename}, Registros: {copied[0]}, SHA-256: {copied[1]}")
+    return copied[0], files
+
+def _drop_log_partition(month, filename, batch_size):
+    """
+    Partição vencida: grava as linhas no arquivo compactado e a retira do
+    registro (as consultas deixam de vê-la na hora); o arquivo é apagado depois
+    Retorna: (quantidade, arquivos alterados)
+    """
+    directory = log_archive_dir()
+    path = os.path.join(directory, filename)
+    start, end = _month_start(month), _month_start(_next_month(month))
+    files = []
+    count = 0
+    
+    source = sqlite3.connect(_readonly_uri(path), uri=True)
+    try:
+        for rows in _read_log_rows(source, 'logs', start, end, batch_size):
+            files = _append_log_archive(directory, rows)
+            count += len(rows)
+    finally:
+        source.close()
+    
+    with write_transaction() as conn:
+        c = conn.cursor()
+        c.execute('UPDATE particoes_logs SET arquivo=NULL, descartada_em=? WHERE mes=? AND arquivo IS NOT NULL',
+                  (datetime.datetime.now().isoformat(), month))
+        if c.rowcount:
+            _insert_log(c, 'system', f"Arquivou os logs de {month} (retenção)", "sistema",
+                        detalhes=f"Partição: {filename}, Registros: {count}, Arquivo: logs_{month}.jsonl.gz")
+    
+    try:
+        _remove_partition_file(path)
+    except OSError as e:
+        # Ainda anexada por outra conexão (Windows): apagada na próxima execução
+        print(f"Partição de logs {filename} será removida depois: {e}")
+    return count, files
+
+def _purge_partitioned_logs(batch_size, cancel_event=None, progress=None):
+    """
+    Remove de main.logs, em lotes curtos, as linhas dos meses já
+    particionados (que as consultas já ignoram)
+    Retorna: (linhas removidas, lotes)
+    """
+    removed = batches = 0
+    while cancel_event is None or not cancel_event.is_set():
+        with write_transaction() as conn:
+            c = conn.cursor()
+            hot_start = _hot_start(conn)
+            if hot_start is None:
+                break
+            rows = c.execute('SELECT id, acao, detalhes FROM logs WHERE timestamp < ? LIMIT ?',
+                             (hot_start, batch_size)).fetchall()
+            # O índice de busca só retira uma linha com o texto indexado (antes de removê-la)
+            indexed_after = _indexed_after(conn)
+            if indexed_after is not None:
+                _index_logs(conn, [row for row in rows if row[0] > indexed_after], delete=True)
+            c.executemany('DELETE FROM logs WHERE id=?', [(row[0],) for row in rows])
+            deleted = len(rows)
+        if not deleted:
+            break
+        removed += deleted
+        batches += 1
+        if progress:
+            progress(removed)
+        time.sleep(LOG_PURGE_PAUSE_S)
+    return removed, batches
+
+def list_log_partitions():
+    """Meses de logs particionados: lista de {'mes', 'arquivo', 'registros', 'criada_em', 'descartada_em'}"""
     try:
         conn = connect()
         c = conn.cursor()
-        
-        cutoff_date = (datetime.datetime.now() - datetime.timedelta(days=days)).isoformat()
-        
-        c.execute('SELECT COUNT(*) FROM logs WHERE timestamp < ?', (cutoff_date,))
-        count = c.fetchone()[0]
-        
-        c.execute('DELETE FROM logs WHERE timestamp < ?', (cutoff_date,))
-        
-        conn.commit()
+        c.execute('SELECT mes, arquivo, registros, criada_em, descartada_em FROM particoes_logs ORDER BY mes')
+        result = [{'mes': row[0], 'arquivo': row[1], 'registros': row[2],
+                   'criada_em': row[3], 'descartada_em': row[4]} for row in c.fetchall()]
         conn.close()
+        return result
+    except sqlite3.Error as e:
+        print(f"Erro ao listar partições de logs: {e}")
+        return []
+
+def purge_old_logs(days=None, batch_size=None, cancel_event=None, progress=None):
+    """
+    Retenção de logs por partição mensal
+    
+    1. Meses encerrados em main.logs viram partições (ou vão direto para o
+       arquivo compactado, se já vencidos)
+    2. Partições vencidas (mês inteiro com mais de days dias, padrão
+       LOG_RETENTION_DAYS) vão para o arquivo compactado e saem do registro:
+       as consultas deixam de vê-las sem nenhuma remoção linha a linha
+    3. As linhas dos meses particionados saem de main.logs em lotes curtos
+       e as páginas liberadas voltam ao sistema (incremental_vacuum)
+    
+    Parâmetros:
+    - cancel_event: threading.Event verificado entre as etapas e os lotes
+    - progress: callback(linhas removidas de main.logs) após cada lote
+    
+    Retorna: {'archived', 'partitions', 'dropped', 'removed', 'batches',
+              'files', 'freed_pages', 'duration_s', 'cancelled'}
+    """
+    days = LOG_RETENTION_DAYS if days is None else days
+    batch_size = batch_size or LOG_PURGE_BATCH
+    cutoff = (datetime.date.today() - datetime.timedelta(days=days)).isoformat()
+    current_month = datetime.date.today().strftime('%Y-%m')
+    started = time.monotonic()
+    result = {'archived': 0, 'partitions': [], 'dropped': [], 'removed': 0, 'batches': 0,
+              'files': [], 'freed_pages': 0, 'duration_s': 0.0, 'cancelled': False}
+    
+    def cancelled():
+        result['cancelled'] = cancel_event is not None and cancel_event.is_set()
+        return result['cancelled']
+    
+    def add_files(names):
+        result['files'] += [name for name in names if name not in result['files']]
+    
+    try:
+        os.makedirs(log_archive_dir(), exist_ok=True)
         
-        print(f"✓ {count} logs removidos (anteriores a {cutoff_date[:10]})")
-        return count
-        
+        # 1. Meses encerrados ainda em main.logs, do mais antigo ao mais recente
+        conn = connect()
+        try:
+            hot_start = _hot_start(conn) or ''
+            months = [row[0] for row in conn.execute(
+                'SELECT DISTINCT substr(timestamp, 1, 7) FROM logs WHERE timestamp >= ? AND timestamp < ? ORDER BY 1',
+                (hot_start, _month_start(current_month)))]
+        finally:
+            conn.close()
+        for month in months:
+            if cancelled():
+                break
+            expired = _month_start(_next_month(month)) <= cutoff
+            count, files = _close_log_month(month, expired, batch_size)
+            if not count:
+                break  # os meses seguintes dependem deste (ordem das partições)
+            add_files(files)
+            if expired:
+                result['archived'] += count
+                result['dropped'].append(month)
+            else:
+                result['partitions'].append(month)
+        
+        # 2. Partições vencidas
+        conn = connect()
+        try:
+            expired = conn.execute(
+                'SELECT mes, arquivo FROM particoes_logs WHERE arquivo IS NOT NULL ORDER BY mes').fetchall()
+        finally:
+            conn.close()
+        for month, filename in expired:
+            if _month_start(_next_month(month)) > cutoff or cancelled():
+                continue
+            count, files = _drop_log_partition(month, filename, batch_size)
+            add_files(files)
+            result['archived'] += count
+            result['dropped'].append(month)
+        
+        # 3. Limpeza de main.logs e devolução do espaço
+        if not cancelled():
+            result['removed'], result['batches'] = _purge_partitioned_logs(batch_size, cancel_event, progress)
+        if result['removed'] and not cancelled():
+            result['freed_pages'] = incremental_vacuum(cancel_event=cancel_event)
+        cancelled()
+    except (sqlite3.Error, OSError) as e:
+        print(f"Erro na retenção de logs: {e}")
+    
+    result['duration_s'] = round(time.monotonic() - started, 3)
+    if result['partitions'] or result['dropped'] or result['removed']:
+        log_action('system', f"Retenção de logs: {len(result['partitions'])} mês(es) particionado(s), "
+                             f"{result['archived']} registros arquivados",
+                   "sistema",
+                   detalhes=f"Partições criadas: {', '.join(result['partitions']) or '-'}, "
+                            f"Meses arquivados: {', '.join(result['dropped']) or '-'}, "
+                            f"Linhas limpas do banco: {result['removed']} em {result['batches']} lotes, "
+                            f"Arquivos: {', '.join(result['files']) or '-'}, "
+                            f"Páginas liberadas: {result['freed_pages']}, "
+                            f"Duração: {result['duration_s']}s"
+                            + (", Interrompida" if result['cancelled'] else ""))
+    print(f"✓ Retenção de logs: {len(result['partitions'])} partição(ões) criada(s), "
+          f"{result['archived']} logs arquivados (meses inteiros anteriores a {cutoff})")
+    return result
+
+def compress_old_logs(batch_size=None, cancel_event=None):
+    """
+    Compacta, em lotes curtos, os detalhes grandes gravados antes da
+    compressão (partições mensais já criadas são somente leitura e ficam
+    como estão); o espaço liberado volta ao disco (incremental_vacuum)
+    Retorna: {'compressed', 'bytes_before', 'bytes_after', 'freed_pages', 'duration_s'}
+    """
+    batch_size = batch_size or LOG_PURGE_BATCH
+    started = time.monotonic()
+    result = {'compressed': 0, 'bytes_before': 0, 'bytes_after': 0, 'freed_pages': 0, 'duration_s': 0.0}
+    last_id = 0
+    
+    try:
+        while cancel_event is None or not cancel_event.is_set():
+            with write_transaction() as conn:
+                c = conn.cursor()
+                rows = c.execute('''
+                    SELECT id, detalhes FROM logs
+                    WHERE id > ? AND length(detalhes) >= ? AND substr(detalhes, 1, ?) != ?
+                    ORDER BY id LIMIT ?
+                ''', (last_id, LOG_DETAILS_COMPRESS_MIN, len(COMPRESSED_DETAILS_PREFIX),
+                      COMPRESSED_DETAILS_PREFIX, batch_size)).fetchall()
+                if not rows:
+                    break
+                # O índice de busca guarda o texto original: nada a atualizar nele
+                for log_id, text in rows:
+                    packed = pack_details(text)
+                    if packed == text:
+                        continue  # não diminui (texto pouco repetitivo)
+                    c.execute('UPDATE logs SET detalhes=? WHERE id=?', (packed, log_id))
+                    result['compressed'] += 1
+                    result['bytes_before'] += len(text)
+                    result['bytes_after'] += len(packed)
+                last_id = rows[-1][0]
+            time.sleep(LOG_PURGE_PAUSE_S)
+        
+        if result['compressed'] and (cancel_event is None or not cancel_event.is_set()):
+            result['freed_pages'] = incremental_vacuum(cancel_event=cancel_event)
     except sqlite3.Error as e:
-        print(f"Erro ao limpar logs antigos: {e}")
-        return 0
+        print(f"Erro ao compactar detalhes de logs: {e}")
+    
+    result['duration_s'] = round(time.monotonic() - started, 3)
+    if result['compressed']:
+        log_action('system', f"Compactou os detalhes de {result['compressed']} logs", "sistema",
+                   detalhes=f"Antes: {result['bytes_before']} caracteres, Depois: {result['bytes_after']} caracteres, "
+                            f"Páginas liberadas: {result['freed_pages']}, Duração: {result['duration_s']}s")
+        print(f"✓ {result['compressed']} detalhes de logs compactados "
+              f"({result['bytes_before']} → {result['bytes_after']} caracteres)")
+    return result
+
+def incremental_vacuum(max_pages=None, convert=False, cancel_event=None):
+    """
+    Devolve ao sistema as páginas livres do banco, em transações curtas de
+    VACUUM_STEP_PAGES páginas
+    
+    Bancos criados antes do modo incremental precisam de um VACUUM completo
+    (bloqueia o banco durante a cópia): feito apenas com convert=True.
+    Retorna: número de páginas liberadas
+    """
+    conn = connect()
+    try:
+        mode = conn.execute('PRAGMA auto_vacuum').fetchone()[0]
+        if mode != 2:
+            if not convert:
+                return 0
+            before = conn.execute('PRAGMA page_count').fetchone()[0]
+            conn.execute('PRAGMA auto_vacuum=INCREMENTAL')
+            conn.execute('VACUUM')
+            freed = before - conn.execute('PRAGMA page_count').fetchone()[0]
+            print(f"✓ Banco convertido para vacuum incremental ({freed} páginas liberadas)")
+            return freed
+    finally:
+        conn.close()
+    
+    freed = 0
+    while max_pages is None or freed < max_pages:
+        if cancel_event is not None and cancel_event.is_set():
+            break
+        step = VACUUM_STEP_PAGES if max_pages is None else min(VACUUM_STEP_PAGES, max_pages - freed)
+        with write_transaction() as conn:
+            before = conn.execute('PRAGMA freelist_count').fetchone()[0]
+            if before == 0:
+                break
+            conn.execute(f'PRAGMA incremental_vacuum({step})').fetchall()
+            released = before - conn.execute('PRAGMA freelist_count').fetchone()[0]
+        if released <= 0:
+            break
+        freed += released
+    return freed
 
 # --- Funções de autenticação ---
+def hash_password(password, rounds=None):
+    """Gera o hash bcrypt da senha com o custo configurado"""
+    salt = bcrypt.gensalt(rounds=rounds or BCRYPT_ROUNDS)
+    return bcrypt.hashpw(password.encode('utf-8'), salt)
+
+def _hash_rounds(password_hash):
+    """Extrai o custo de um hash bcrypt ($2b$12$...); None se não reconhecido"""
+    try:
+        return int(password_hash.split('$')[2])
+    except (IndexError, ValueError):
+        return None
+
 def authenticate_user(username, password):
     """
     Autentica usuário verificando username e senha
     Retorna: (sucesso: bool, is_admin: bool, mensagem: str)
+    
+    O bcrypt roda sem conexão aberta; a atualização de last_login, o
+    rehash (quando BCRYPT_ROUNDS mudou) e o registro de auditoria são
+    gravados em uma única transação.
     """
     try:
         conn = connect()
@@ -310,9 +1526,9 @@ def authenticate_user(username, password):
         ''', (username,))
         
         result = c.fetchone()
+        conn.close()
         
         if not result:
-            conn.close()
             # Log de falha de autenticação
             log_action(username, "Tentativa de login - usuário não encontrado", "autenticacao", 
                       status='falha')
@@ -321,27 +1537,43 @@ def authenticate_user(username, password):
         user_id, password_hash, is_admin = result
         
         # Verificar senha usando bcrypt
-        if bcrypt.checkpw(password.encode('utf-8'), password_hash.encode('utf-8')):
+        if not bcrypt.checkpw(password.encode('utf-8'), password_hash.encode('utf-8')):
+            # Log de senha incorreta
+            log_action(username, "Tentativa de login - senha incorreta", "autenticacao",
+                      status='falha')
+            return False, False, "Senha incorreta"
+        
+        # Refazer o hash se o custo configurado mudou (a senha em claro só existe agora)
+        new_hash = None
+        if _hash_rounds(password_hash) != BCRYPT_ROUNDS:
+            new_hash = hash_password(password).decode('utf-8')
+        
+        with write_transaction() as conn:
+            c = conn.cursor()
+            
             # Atualizar último login
             c.execute('''
                 UPDATE usuarios 
                 SET last_login = ? 
                 WHERE id = ?
             ''', (datetime.datetime.now().isoformat(), user_id))
-            conn.commit()
-            conn.close()
             
-            # Log de login bem-sucedido
-            log_action(username, "Login realizado com sucesso", "autenticacao",
-                      detalhes=f"Tipo: {'Admin' if is_admin else 'Funcionário'}")
+            detalhes = f"Tipo: {'Admin' if is_admin else 'Funcionário'}"
+            if new_hash:
+                # Só substitui se a senha não foi alterada durante a verificação
+                c.execute('''
+                    UPDATE usuarios 
+                    SET password_hash = ? 
+                    WHERE id = ? AND password_hash = ?
+                ''', (new_hash, user_id, password_hash))
+                if c.rowcount:
+                    detalhes += f", Hash atualizado para custo {BCRYPT_ROUNDS}"
             
-            return True, bool(is_admin), "Login realizado com sucesso"
-        else:
-            conn.close()
-            # Log de senha incorreta
-            log_action(username, "Tentativa de login - senha incorreta", "autenticacao",
-                      status='falha')
-            return False, False, "Senha incorreta"
+            # Log de login bem-sucedido
+            _insert_log(c, username, "Login realizado com sucesso", "autenticacao",
+                        detalhes=detalhes)
+        
+        return True, bool(is_admin), "Login realizado com sucesso"
             
     except sqlite3.Error as e:
         print(f"Erro ao autenticar: {e}")
@@ -349,52 +1581,50 @@ def authenticate_user(username, password):
                   status='falha')
         return False, False, f"Erro no banco de dados: {str(e)}"
 
-def create_user(username, password, is_admin=False, created_by='system'):
+def create_user(username, password, is_admin=False, created_by=None):
     """
     Cria um novo usuário no sistema
     Retorna: (sucesso: bool, mensagem: str)
     """
+    created_by = created_by or current_user()
     if not username or not username.strip():
         return False, "Nome de usuário não pode estar vazio"
     
-    if not password or len(password) < 6:
-        return False, "Senha deve ter no mínimo 6 caracteres"
-    
-    try:
-        conn = connect()
-        c = conn.cursor()
-        
-        # Verificar se usuário já existe
-        c.execute('SELECT id FROM usuarios WHERE username = ?', (username,))
-        if c.fetchone():
-            conn.close()
-            log_action(created_by, f"Tentativa de criar usuário duplicado: {username}", "usuario",
-                      status='falha')
-            return False, "Nome de usuário já existe"
-        
-        # Criar hash da senha
-        password_hash = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt())
-        
-        # Inserir usuário
-        c.execute('''
-            INSERT INTO usuarios (username, password_hash, is_admin, created_at)
-            VALUES (?, ?, ?, ?)
-        ''', (username, password_hash.decode('utf-8'), int(is_admin), datetime.datetime.now().isoformat()))
-        
-        conn.commit()
-        conn.close()
-        
-        # Log de criação de usuário
-        log_action(created_by, f"Criou usuário: {username}", "usuario",
-                  detalhes=f"Tipo: {'Admin' if is_admin else 'Funcionário'}")
-        
-        return True, "Usuário criado com sucesso"
-        
+    if not password or len(password) < 6:
+        return False, "Senha deve ter no mínimo 6 caracteres"
+    
+    # Criar hash da senha (antes de obter o bloqueio de escrita)
+    password_hash = hash_password(password)
+    
+    try:
+        with write_transaction() as conn:
+            c = conn.cursor()
+            
+            # Verificar se usuário já existe
+            c.execute('SELECT id FROM usuarios WHERE username = ?', (username,))
+            duplicate = c.fetchone() is not None
+            
+            if not duplicate:
+                c.execute('''
+                    INSERT INTO usuarios (username, password_hash, is_admin, created_at)
+                    VALUES (?, ?, ?, ?)
+                ''', (username, password_hash.decode('utf-8'), int(is_admin), datetime.datetime.now().isoformat()))
     except sqlite3.Error as e:
         print(f"Erro ao criar usuário: {e}")
         log_action(created_by, f"Erro ao criar usuário {username}: {str(e)}", "usuario",
                   status='falha')
         return False, f"Erro no banco de dados: {str(e)}"
+    
+    if duplicate:
+        log_action(created_by, f"Tentativa de criar usuário duplicado: {username}", "usuario",
+                  status='falha')
+        return False, "Nome de usuário já existe"
+    
+    # Log de criação de usuário
+    log_action(created_by, f"Criou usuário: {username}", "usuario",
+              detalhes=f"Tipo: {'Admin' if is_admin else 'Funcionário'}")
+    
+    return True, "Usuário criado com sucesso"
 
 def change_password(username, old_password, new_password):
     """
@@ -416,45 +1646,46 @@ def change_password(username, old_password, new_password):
         ''', (username,))
         
         result = c.fetchone()
+        conn.close()
         
         if not result:
-            conn.close()
             log_action(username, "Tentativa de alterar senha - usuário não encontrado", "usuario",
                       status='falha')
             return False, "Usuário não encontrado"
         
         user_id, password_hash = result
         
-        # Verificar senha antiga
+        # Verificar senha antiga (sem conexão aberta)
         if not bcrypt.checkpw(old_password.encode('utf-8'), password_hash.encode('utf-8')):
-            conn.close()
             log_action(username, "Tentativa de alterar senha - senha atual incorreta", "usuario",
                       status='falha')
             return False, "Senha atual incorreta"
         
         # Criar hash da nova senha
-        new_password_hash = bcrypt.hashpw(new_password.encode('utf-8'), bcrypt.gensalt())
-        
-        # Atualizar senha
-        c.execute('''
-            UPDATE usuarios 
-            SET password_hash = ? 
-            WHERE id = ?
-        ''', (new_password_hash.decode('utf-8'), user_id))
-        
-        conn.commit()
-        conn.close()
-        
-        # Log de alteração de senha
-        log_action(username, "Alterou a própria senha", "usuario")
-        
-        return True, "Senha alterada com sucesso"
+        new_password_hash = hash_password(new_password)
         
+        # Atualizar senha (só se não foi alterada durante a verificação)
+        with write_transaction() as conn:
+            c = conn.cursor()
+            c.execute('''
+                UPDATE usuarios 
+                SET password_hash = ? 
+                WHERE id = ? AND password_hash = ?
+            ''', (new_password_hash.decode('utf-8'), user_id, password_hash))
+            changed = c.rowcount > 0
     except sqlite3.Error as e:
         print(f"Erro ao alterar senha: {e}")
         log_action(username, f"Erro ao alterar senha: {str(e)}", "usuario",
                   status='falha')
         return False, f"Erro no banco de dados: {str(e)}"
+    
+    if not changed:
+        return False, "Senha alterada por outro terminal; tente novamente"
+    
+    # Log de alteração de senha
+    log_action(username, "Alterou a própria senha", "usuario")
+    
+    return True, "Senha alterada com sucesso"
 
 def list_users():
     """Lista todos os usuários (sem mostrar senhas)"""
@@ -484,41 +1715,37 @@ def list_users():
         print(f"Erro ao listar usuários: {e}")
         return []
 
-def delete_user(username, deleted_by='admin'):
+def delete_user(username, deleted_by=None):
     """
     Remove um usuário do sistema
     Retorna: (sucesso: bool, mensagem: str)
     """
+    deleted_by = deleted_by or current_user()
     if username in ['admin', 'funcionario']:
         log_action(deleted_by, f"Tentativa de remover usuário padrão: {username}", "usuario",
                   status='falha')
         return False, "Não é permitido remover usuários padrão do sistema"
     
     try:
-        conn = connect()
-        c = conn.cursor()
-        
-        c.execute('DELETE FROM usuarios WHERE username = ?', (username,))
-        
-        if c.rowcount == 0:
-            conn.close()
-            log_action(deleted_by, f"Tentativa de remover usuário inexistente: {username}", "usuario",
-                      status='falha')
-            return False, "Usuário não encontrado"
-        
-        conn.commit()
-        conn.close()
-        
-        # Log de remoção de usuário
-        log_action(deleted_by, f"Removeu usuário: {username}", "usuario")
-        
-        return True, "Usuário removido com sucesso"
-        
+        with write_transaction() as conn:
+            c = conn.cursor()
+            c.execute('DELETE FROM usuarios WHERE username = ?', (username,))
+            removed = c.rowcount > 0
     except sqlite3.Error as e:
         print(f"Erro ao remover usuário: {e}")
         log_action(deleted_by, f"Erro ao remover usuário {username}: {str(e)}", "usuario",
                   status='falha')
         return False, f"Erro no banco de dados: {str(e)}"
+    
+    if not removed:
+        log_action(deleted_by, f"Tentativa de remover usuário inexistente: {username}", "usuario",
+                  status='falha')
+        return False, "Usuário não encontrado"
+    
+    # Log de remoção de usuário
+    log_action(deleted_by, f"Removeu usuário: {username}", "usuario")
+    
+    return True, "Usuário removido com sucesso"
 
 # --- Funções de validação ---
 def employee_exists(emp_id):
@@ -535,59 +1762,61 @@ def employee_exists(emp_id):
         return False
 
 # --- Funções de acesso ---
-def add_employee_db(name, created_by='system'):
+def add_employee_db(name, created_by=None):
     """Adiciona um funcionário ao banco"""
+    created_by = created_by or current_user()
     try:
-        conn = connect()
-        c = conn.cursor()
-        c.execute('INSERT INTO funcionarios (name) VALUES (?)', (name,))
-        emp_id = c.lastrowid
-        conn.commit()
-        conn.close()
-        
-        # Log de adição de funcionário
-        log_action(created_by, f"Adicionou funcionário: {name} (ID: {emp_id})", "funcionario",
-                  detalhes=f"ID: {emp_id}, Nome: {name}")
-        
-        return emp_id
+        with write_transaction() as conn:
+            c = conn.cursor()
+            c.execute('INSERT INTO funcionarios (name) VALUES (?)', (name,))
+            emp_id = c.lastrowid
     except sqlite3.Error as e:
         print(f"Erro ao adicionar funcionário: {e}")
         log_action(created_by, f"Erro ao adicionar funcionário {name}: {str(e)}", "funcionario",
                   status='falha')
         return None
+    
+    _notify_event('funcionario', emp_id)
+    
+    # Log de adição de funcionário
+    log_action(created_by, f"Adicionou funcionário: {name} (ID: {emp_id})", "funcionario",
+              detalhes=f"ID: {emp_id}, Nome: {name}")
+    
+    return emp_id
 
-def remove_employee_db(emp_id, deleted_by='system'):
+def remove_employee_db(emp_id, deleted_by=None):
     """Remove um funcionário e todos os seus registros relacionados"""
+    deleted_by = deleted_by or current_user()
     try:
-        conn = connect()
-        c = conn.cursor()
-        
-        # Buscar nome do funcionário antes de remover
-        c.execute('SELECT name FROM funcionarios WHERE id=?', (emp_id,))
-        result = c.fetchone()
-        emp_name = result[0] if result else 'Desconhecido'
-        
-        c.execute('DELETE FROM eventos WHERE funcionario_id=?', (emp_id,))
-        eventos_removidos = c.rowcount
-        
-        c.execute('DELETE FROM folgas WHERE funcionario_id=?', (emp_id,))
-        folgas_removidas = c.rowcount
-        
-        c.execute('DELETE FROM funcionarios WHERE id=?', (emp_id,))
-        
-        conn.commit()
-        conn.close()
-        
-        # Log de remoção de funcionário
-        log_action(deleted_by, f"Removeu funcionário: {emp_name} (ID: {emp_id})", "funcionario",
-                  detalhes=f"Eventos removidos: {eventos_removidos}, Folgas removidas: {folgas_removidas}")
-        
-        return True
+        with write_transaction() as conn:
+            c = conn.cursor()
+            
+            # Buscar nome do funcionário antes de remover
+            c.execute('SELECT name FROM funcionarios WHERE id=?', (emp_id,))
+            result = c.fetchone()
+            emp_name = result[0] if result else 'Desconhecido'
+            
+            # Partições arquivadas são somente leitura e seguem o prazo de guarda
+            c.execute('DELETE FROM eventos WHERE funcionario_id=?', (emp_id,))
+            eventos_removidos = c.rowcount
+            
+            c.execute('DELETE FROM folgas WHERE funcionario_id=?', (emp_id,))
+            folgas_removidas = c.rowcount
+            
+            c.execute('DELETE FROM funcionarios WHERE id=?', (emp_id,))
     except sqlite3.Error as e:
         print(f"Erro ao remover funcionário: {e}")
         log_action(deleted_by, f"Erro ao remover funcionário ID {emp_id}: {str(e)}", "funcionario",
                   status='falha')
         return False
+    
+    _notify_event('funcionario', emp_id)
+    
+    # Log de remoção de funcionário
+    log_action(deleted_by, f"Removeu funcionário: {emp_name} (ID: {emp_id})", "funcionario",
+              detalhes=f"Eventos removidos: {eventos_removidos}, Folgas removidas: {folgas_removidas}")
+    
+    return True
 
 def list_employees_db():
     """Lista todos os funcionários cadastrados"""
@@ -602,8 +1831,43 @@ def list_employees_db():
         print(f"Erro ao listar funcionários: {e}")
         return []
 
-def record_event_db(emp_id, event_type, timestamp=None, recorded_by='system'):
-    """Registra um evento de ponto para um funcionário"""
+def idempotency_key_applied(key):
+    """Verifica se o registro com esta chave (spool) já foi aplicado"""
+    try:
+        conn = connect()
+        c = conn.cursor()
+        c.execute('SELECT 1 FROM registros_aplicados WHERE chave=?', (key,))
+        applied = c.fetchone() is not None
+        conn.close()
+        return applied
+    except sqlite3.Error as e:
+        print(f"Erro ao verificar chave de registro: {e}")
+        return False
+
+def events_version(conn):
+    """Versão atual dos eventos (versao_eventos); None se o banco não tem a tabela"""
+    try:
+        row = conn.execute('SELECT versao FROM versao_eventos WHERE id = 1').fetchone()
+    except sqlite3.OperationalError:
+        return None
+    return row[0] if row else None
+
+def record_event_db(emp_id, event_type, timestamp=None, recorded_by=None, idempotency_key=None,
+                    check_sequence=None, day_states=None, raise_errors=False):
+    """
+    Registra um evento de ponto para um funcionário
+    
+    idempotency_key: chave única do registro (spool); gravada na mesma
+    transação do evento, para que uma nova tentativa não o duplique
+    check_sequence: função(tipos já registrados no dia, tipo) -> (válido, mensagem),
+    aplicada dentro da transação de escrita (definitiva mesmo com outros
+    terminais gravando no mesmo banco); sem ela, recusa apenas tipos repetidos
+    day_states: cache de estado do dia (punch_state.PunchStateCache); com a
+    versão dos eventos igual à do cache, os eventos do dia não são relidos
+    raise_errors: levanta sqlite3.Error em vez de retornar (False, mensagem)
+    (o spool classifica a falha pelo tipo da exceção e a registra)
+    """
+    recorded_by = recorded_by or current_user()
     if timestamp is None:
         timestamp = datetime.datetime.now()
     
@@ -611,60 +1875,113 @@ def record_event_db(emp_id, event_type, timestamp=None, recorded_by='system'):
     date_str = timestamp.date().isoformat()
     
     try:
-        conn = connect()
-        c = conn.cursor()
-        
-        # Buscar nome do funcionário
-        c.execute('SELECT name FROM funcionarios WHERE id=?', (emp_id,))
-        result = c.fetchone()
-        emp_name = result[0] if result else 'Desconhecido'
-        
-        # Verificar duplicidade
-        c.execute(
-            'SELECT id FROM eventos WHERE funcionario_id=? AND tipo=? AND DATE(timestamp)=?', 
-            (emp_id, event_type, date_str)
-        )
-        
-        if c.fetchone():
-            conn.close()
-            log_action(recorded_by, f"Tentativa de evento duplicado - {emp_name}: {event_type}", "evento",
-                      detalhes=f"Funcionário: {emp_name} (ID: {emp_id}), Tipo: {event_type}, Data: {date_str}",
-                      status='falha')
-            return False, 'Evento já registrado para este dia'
-        
-        # Inserir evento
-        c.execute(
-            'INSERT INTO eventos (funcionario_id, tipo, timestamp) VALUES (?,?,?)',
-            (emp_id, event_type, ts_str)
-        )
-        conn.commit()
-        conn.close()
-        
-        # Log de registro de evento
-        log_action(recorded_by, f"Registrou {event_type} - {emp_name}", "evento",
-                  detalhes=f"Funcionário: {emp_name} (ID: {emp_id}), Tipo: {event_type}, Timestamp: {ts_str}")
-        
-        return True, 'Evento registrado com sucesso'
-        
+        with write_transaction() as conn:
+            outcome, msg, emp_name, day_state = _insert_event(
+                conn.cursor(), emp_id, event_type, timestamp, idempotency_key, check_sequence, day_states)
     except sqlite3.Error as e:
+        if raise_errors:
+            raise
         log_action(recorded_by, f"Erro ao registrar evento: {str(e)}", "evento",
                   status='falha')
         return False, f'Erro no banco de dados: {str(e)}'
+    
+    if outcome == 'aplicado':
+        return True, msg
+    if outcome == 'arquivado':
+        log_action(recorded_by, f"Tentativa de registro em ano arquivado - {emp_name}: {event_type}", "evento",
+                  detalhes=f"Funcionário: {emp_name} (ID: {emp_id}), Tipo: {event_type}, Timestamp: {ts_str}",
+                  status='falha')
+    elif outcome in ('duplicado', 'sequencia'):
+        attempt = 'evento duplicado' if outcome == 'duplicado' else 'evento fora de sequência'
+        log_action(recorded_by, f"Tentativa de {attempt} - {emp_name}: {event_type}", "evento",
+                  detalhes=f"Funcionário: {emp_name} (ID: {emp_id}), Tipo: {event_type}, Data: {date_str}, "
+                           f"Motivo: {msg}",
+                  status='falha')
+    if outcome != 'registrado':
+        return False, msg
+    
+    if day_state is not None:
+        day_states.recorded(emp_id, timestamp.date(), *day_state)
+    _notify_event('registro', emp_id, event_type, timestamp)
+    
+    # Log de registro de evento
+    log_action(recorded_by, f"Registrou {event_type} - {emp_name}", "evento",
+              detalhes=f"Funcionário: {emp_name} (ID: {emp_id}), Tipo: {event_type}, Timestamp: {ts_str}")
+    
+    return True, msg
+
+def _insert_event(c, emp_id, event_type, timestamp, idempotency_key=None, check_sequence=None,
+                  day_states=None):
+    """
+    Grava o evento na transação do cursor informado (sem commit), depois de
+    conferir a chave do spool, o funcionário, o ano arquivado e a sequência
+    (tipos do dia vindos de day_states quando a versão confere, senão do banco)
+    Retorna: (resultado, mensagem, nome do funcionário, (versão, tipos) após o
+    registro para day_states ou None); resultado é 'registrado', 'aplicado'
+    (chave já gravada), 'recusado', 'arquivado', 'sequencia' ou 'duplicado'
+    """
+    if idempotency_key:
+        c.execute('SELECT 1 FROM registros_aplicados WHERE chave=?', (idempotency_key,))
+        if c.fetchone():
+            return 'aplicado', 'Registro já aplicado', None, None
+    
+    # Buscar nome do funcionário
+    c.execute('SELECT name FROM funcionarios WHERE id=?', (emp_id,))
+    result = c.fetchone()
+    emp_name = result[0] if result else 'Desconhecido'
+    if check_sequence and not result:
+        return 'recusado', 'Funcionário não encontrado', emp_name, None
+    
+    archived = _archived_year_message(c, timestamp.year)
+    if archived:
+        return 'arquivado', archived, emp_name, None
+    
+    # Tipos já registrados no dia: do cache, se nenhum terminal alterou os eventos desde então
+    date_obj = timestamp.date()
+    version = events_version(c.connection) if day_states is not None else None
+    existing = day_states.lookup(emp_id, date_obj, version) if version is not None else None
+    if existing is None:
+        c.execute('SELECT tipo FROM eventos WHERE funcionario_id=? AND DATE(timestamp)=?',
+                  (emp_id, date_obj.isoformat()))
+        existing = frozenset(row[0] for row in c.fetchall())
+        if version is not None:
+            day_states.loaded(emp_id, date_obj, version, existing)
+    
+    if event_type in existing:
+        # check_event_sequence também recusa tipos repetidos; a mensagem vem dela
+        msg = check_sequence(existing, event_type)[1] if check_sequence else 'Evento já registrado para este dia'
+        return 'duplicado', msg, emp_name, None
+    if check_sequence:
+        valid, msg = check_sequence(existing, event_type)
+        if not valid:
+            return 'sequencia', msg, emp_name, None
+    
+    # Inserir evento
+    c.execute(
+        'INSERT INTO eventos (funcionario_id, tipo, timestamp) VALUES (?,?,?)',
+        (emp_id, event_type, timestamp.isoformat())
+    )
+    if idempotency_key:
+        c.execute(
+            'INSERT INTO registros_aplicados (chave, evento_id, aplicado_em) VALUES (?,?,?)',
+            (idempotency_key, c.lastrowid, datetime.datetime.now().isoformat())
+        )
+    # O gatilho de versao_eventos incrementou a versão uma vez (só este registro na transação)
+    day_state = (version + 1, existing | {event_type}) if version is not None else None
+    return 'registrado', 'Evento registrado com sucesso', emp_name, day_state
 
-def add_holiday_db(date_obj, added_by='system'):
+def add_holiday_db(date_obj, added_by=None):
     """Adiciona um feriado ao banco"""
+    added_by = added_by or current_user()
     try:
-        conn = connect()
-        c = conn.cursor()
-        c.execute('INSERT OR IGNORE INTO feriados (data) VALUES (?)', (date_obj.isoformat(),))
-        
-        if c.rowcount > 0:
-            # Log apenas se realmente adicionou
-            log_action(added_by, f"Adicionou feriado: {date_obj.strftime('%d/%m/%Y')}", "feriado",
-                      detalhes=f"Data: {date_obj.isoformat()}")
-        
-        conn.commit()
-        conn.close()
+        with write_transaction() as conn:
+            c = conn.cursor()
+            c.execute('INSERT OR IGNORE INTO feriados (data) VALUES (?)', (date_obj.isoformat(),))
+        
+            if c.rowcount > 0:
+                # Log apenas se realmente adicionou (na mesma transação de escrita)
+                _insert_log(c, added_by, f"Adicionou feriado: {date_obj.strftime('%d/%m/%Y')}", "feriado",
+                            detalhes=f"Data: {date_obj.isoformat()}")
         return True
     except sqlite3.Error as e:
         print(f"Erro ao adicionar feriado: {e}")
@@ -672,43 +1989,42 @@ def add_holiday_db(date_obj, added_by='system'):
                   status='falha')
         return False
 
-def set_day_off_db(emp_id, date_obj, set_by='system'):
+def set_day_off_db(emp_id, date_obj, set_by=None):
     """Marca uma folga para um funcionário"""
+    set_by = set_by or current_user()
     try:
-        conn = connect()
-        c = conn.cursor()
-        
-        # Buscar nome do funcionário
-        c.execute('SELECT name FROM funcionarios WHERE id=?', (emp_id,))
-        result = c.fetchone()
-        emp_name = result[0] if result else 'Desconhecido'
-        
-        c.execute(
-            'INSERT OR REPLACE INTO folgas (funcionario_id, data) VALUES (?,?)',
-            (emp_id, date_obj.isoformat())
-        )
-        
-        conn.commit()
-        conn.close()
-        
-        # Log de folga
-        log_action(set_by, f"Marcou folga para {emp_name}", "folga",
-                  detalhes=f"Funcionário: {emp_name} (ID: {emp_id}), Data: {date_obj.strftime('%d/%m/%Y')}")
-        
-        return True
+        with write_transaction() as conn:
+            c = conn.cursor()
+            
+            # Buscar nome do funcionário
+            c.execute('SELECT name FROM funcionarios WHERE id=?', (emp_id,))
+            result = c.fetchone()
+            emp_name = result[0] if result else 'Desconhecido'
+            
+            c.execute(
+                'INSERT OR REPLACE INTO folgas (funcionario_id, data) VALUES (?,?)',
+                (emp_id, date_obj.isoformat())
+            )
     except sqlite3.Error as e:
         print(f"Erro ao adicionar folga: {e}")
         log_action(set_by, f"Erro ao marcar folga: {str(e)}", "folga",
                   status='falha')
         return False
+    
+    # Log de folga
+    log_action(set_by, f"Marcou folga para {emp_name}", "folga",
+              detalhes=f"Funcionário: {emp_name} (ID: {emp_id}), Data: {date_obj.strftime('%d/%m/%Y')}")
+    
+    return True
 
 def get_events_by_month(emp_id, year, month):
     """Retorna todos os eventos de um funcionário em um mês específico"""
     try:
         conn = connect()
         c = conn.cursor()
-        c.execute('''
-            SELECT tipo, timestamp FROM eventos 
+        source = _event_source(conn, datetime.date(year, month, 1), datetime.date(year, month, 1))
+        c.execute(f'''
+            SELECT tipo, timestamp FROM {source} 
             WHERE funcionario_id=? 
             AND strftime('%Y', timestamp)=? 
             AND strftime('%m', timestamp)=?
@@ -747,10 +2063,11 @@ def get_employee_days_off(emp_id):
         print(f"Erro ao buscar folgas: {e}")
         return []
 
-def adjust_event_db(emp_id, event_type, timestamp, justificativa, adjusted_by='admin'):
+def adjust_event_db(emp_id, event_type, timestamp, justificativa, adjusted_by=None):
     """
     Adiciona ou ajusta um evento de ponto com justificativa obrigatória
     """
+    adjusted_by = adjusted_by or current_user()
     if not justificativa or not justificativa.strip():
         log_action(adjusted_by, f"Tentativa de ajuste sem justificativa - {emp_id}:{event_type}", 
                   "evento", status='falha')
@@ -760,94 +2077,98 @@ def adjust_event_db(emp_id, event_type, timestamp, justificativa, adjusted_by='a
     date_str = timestamp.date().isoformat()
     
     try:
-        conn = connect()
-        c = conn.cursor()
-        
-        c.execute('SELECT name FROM funcionarios WHERE id=?', (emp_id,))
-        result = c.fetchone()
-        emp_name = result[0] if result else 'Desconhecido'
-        
-        c.execute(
-            'SELECT id FROM eventos WHERE funcionario_id=? AND tipo=? AND DATE(timestamp)=?',
-            (emp_id, event_type, date_str)
-        )
-        existing = c.fetchone()
-        
-        if existing:
-            event_id = existing[0]
-            c.execute('UPDATE eventos SET timestamp=? WHERE id=?', (ts_str, event_id))
-            action = f"Ajustou {event_type} para {timestamp.strftime('%H:%M')} - {emp_name}"
-        else:
-            c.execute(
-                'INSERT INTO eventos (funcionario_id, tipo, timestamp) VALUES (?,?,?)',
-                (emp_id, event_type, ts_str)
-            )
-            event_id = c.lastrowid
-            action = f"Adicionou {event_type} às {timestamp.strftime('%H:%M')} - {emp_name}"
-        
-        conn.commit()
-        conn.close()
-        
-        log_action(adjusted_by, action, "evento",
-                  detalhes=f"Funcionário: {emp_name} (ID: {emp_id}), Tipo: {event_type}, "
-                          f"Hora: {timestamp.strftime('%H:%M')}, Justificativa: {justificativa}")
-        
-        return True, "Evento ajustado com sucesso", event_id
-        
+        with write_transaction() as conn:
+            c = conn.cursor()
+            
+            c.execute('SELECT name FROM funcionarios WHERE id=?', (emp_id,))
+            result = c.fetchone()
+            emp_name = result[0] if result else 'Desconhecido'
+            
+            archived = _archived_year_message(c, timestamp.year)
+            if not archived:
+                c.execute(
+                    'SELECT id FROM eventos WHERE funcionario_id=? AND tipo=? AND DATE(timestamp)=?',
+                    (emp_id, event_type, date_str)
+                )
+                existing = c.fetchone()
+                
+                if existing:
+                    event_id = existing[0]
+                    c.execute('UPDATE eventos SET timestamp=? WHERE id=?', (ts_str, event_id))
+                    action = f"Ajustou {event_type} para {timestamp.strftime('%H:%M')} - {emp_name}"
+                else:
+                    c.execute(
+                        'INSERT INTO eventos (funcionario_id, tipo, timestamp) VALUES (?,?,?)',
+                        (emp_id, event_type, ts_str)
+                    )
+                    event_id = c.lastrowid
+                    action = f"Adicionou {event_type} às {timestamp.strftime('%H:%M')} - {emp_name}"
     except sqlite3.Error as e:
         log_action(adjusted_by, f"Erro ao ajustar evento: {str(e)}", "evento", status='falha')
         return False, f"Erro no banco de dados: {str(e)}", None
+    
+    if archived:
+        log_action(adjusted_by, f"Tentativa de ajuste em ano arquivado - {emp_name}: {event_type}", "evento",
+                  detalhes=f"Funcionário: {emp_name} (ID: {emp_id}), Data: {date_str}", status='falha')
+        return False, archived, None
+    
+    _notify_event('ajuste', emp_id, event_type, timestamp)
+    
+    log_action(adjusted_by, action, "evento",
+              detalhes=f"Funcionário: {emp_name} (ID: {emp_id}), Tipo: {event_type}, "
+                      f"Hora: {timestamp.strftime('%H:%M')}, Justificativa: {justificativa}")
+    
+    return True, "Evento ajustado com sucesso", event_id
 
 
-def remove_event_db(event_id, emp_id, justificativa, removed_by='admin'):
+def remove_event_db(event_id, emp_id, justificativa, removed_by=None):
     """
     Remove um evento de ponto com justificativa obrigatória
     """
+    removed_by = removed_by or current_user()
     if not justificativa or not justificativa.strip():
         log_action(removed_by, f"Tentativa de remover evento sem justificativa - ID:{event_id}", 
                   "evento", status='falha')
         return False, "Justificativa é obrigatória"
     
     try:
-        conn = connect()
-        c = conn.cursor()
-        
-        c.execute('SELECT funcionario_id, tipo, timestamp FROM eventos WHERE id=?', (event_id,))
-        result = c.fetchone()
-        
-        if not result:
-            conn.close()
-            log_action(removed_by, f"Tentativa de remover evento inexistente - ID:{event_id}", 
-                      "evento", status='falha')
-            return False, "Evento não encontrado"
-        
-        func_id, event_type, ts_str = result
-        
-        if func_id != emp_id:
-            conn.close()
-            log_action(removed_by, f"Tentativa de remover evento de outro funcionário - ID:{event_id}", 
-                      "evento", status='falha')
-            return False, "Funcionário não corresponde"
-        
-        c.execute('SELECT name FROM funcionarios WHERE id=?', (emp_id,))
-        emp_result = c.fetchone()
-        emp_name = emp_result[0] if emp_result else 'Desconhecido'
-        
-        c.execute('DELETE FROM eventos WHERE id=?', (event_id,))
-        conn.commit()
-        conn.close()
-        
-        ts_dt = datetime.datetime.fromisoformat(ts_str)
-        log_action(removed_by, f"Removeu {event_type} - {emp_name}", "evento",
-                  detalhes=f"Funcionário: {emp_name} (ID: {emp_id}), Tipo: {event_type}, "
-                          f"Horário original: {ts_dt.strftime('%H:%M')}, "
-                          f"Justificativa: {justificativa}")
-        
-        return True, "Evento removido com sucesso"
-        
+        with write_transaction() as conn:
+            c = conn.cursor()
+            
+            c.execute('SELECT funcionario_id, tipo, timestamp FROM eventos WHERE id=?', (event_id,))
+            result = c.fetchone()
+            
+            if result and result[0] == emp_id:
+                c.execute('SELECT name FROM funcionarios WHERE id=?', (emp_id,))
+                emp_result = c.fetchone()
+                emp_name = emp_result[0] if emp_result else 'Desconhecido'
+                
+                c.execute('DELETE FROM eventos WHERE id=?', (event_id,))
     except sqlite3.Error as e:
         log_action(removed_by, f"Erro ao remover evento: {str(e)}", "evento", status='falha')
         return False, f"Erro no banco de dados: {str(e)}"
+    
+    if not result:
+        log_action(removed_by, f"Tentativa de remover evento inexistente - ID:{event_id}", 
+                  "evento", status='falha')
+        # Eventos de anos arquivados não estão mais em ponto.db
+        return False, "Evento não encontrado (eventos de anos arquivados são somente leitura)"
+    
+    func_id, event_type, ts_str = result
+    
+    if func_id != emp_id:
+        log_action(removed_by, f"Tentativa de remover evento de outro funcionário - ID:{event_id}", 
+                  "evento", status='falha')
+        return False, "Funcionário não corresponde"
+    
+    ts_dt = datetime.datetime.fromisoformat(ts_str)
+    _notify_event('remocao', emp_id, event_type, ts_dt)
+    log_action(removed_by, f"Removeu {event_type} - {emp_name}", "evento",
+              detalhes=f"Funcionário: {emp_name} (ID: {emp_id}), Tipo: {event_type}, "
+                      f"Horário original: {ts_dt.strftime('%H:%M')}, "
+                      f"Justificativa: {justificativa}")
+    
+    return True, "Evento removido com sucesso"
 
 
 def get_employee_events_by_date(emp_id, date_obj):
@@ -859,8 +2180,9 @@ def get_employee_events_by_date(emp_id, date_obj):
         c = conn.cursor()
         date_str = date_obj.isoformat()
         
-        c.execute('''
-            SELECT id, tipo, timestamp FROM eventos
+        source = _event_source(conn, date_obj, date_obj)
+        c.execute(f'''
+            SELECT id, tipo, timestamp FROM {source}
             WHERE funcionario_id=? AND DATE(timestamp)=?
             ORDER BY timestamp
         ''', (emp_id, date_str))
@@ -878,3 +2200,265 @@ def get_employee_events_by_date(emp_id, date_obj):
     except sqlite3.Error as e:
         print(f"Erro ao buscar eventos: {e}")
         return []
+
+# --- Partições anuais de eventos ---
+# Anos encerrados saem da tabela eventos para arquivos próprios
+# (arquivo/eventos_AAAA.db), somente leitura; o ano atual continua em
+# ponto.db. As consultas anexam (ATTACH) apenas as partições do intervalo.
+EVENT_ARCHIVE_DIR = os.environ.get('MARC_EVENT_ARCHIVE_DIR')  # padrão: arquivo/ ao lado do banco
+EVENT_RETENTION_YEARS = int(os.environ.get('MARC_EVENT_RETENTION_YEARS', 5))  # guarda mínima (legal)
+EVENT_ARCHIVE_GRACE_DAYS = 60  # ajustes de dezembro ainda chegam no começo do ano
+MAX_ATTACHED_PARTITIONS = 9  # o SQLite anexa no máximo 10 bancos por conexão
+
+def event_partition_dir(db_file=None):
+    """Diretório das partições arquivadas do banco informado (padrão DB_FILE)"""
+    return EVENT_ARCHIVE_DIR or os.path.join(os.path.dirname(os.path.abspath(db_file or DB_FILE)), 'arquivo')
+
+def _readonly_uri(path):
+    return Path(path).absolute().as_uri() + '?mode=ro'
+
+def _archived_year_message(c, year):
+    """Mensagem de recusa se o ano já foi arquivado (None se gravável)"""
+    c.execute('SELECT 1 FROM particoes_eventos WHERE ano=?', (year,))
+    if c.fetchone():
+        return f"Os eventos de {year} já foram arquivados (somente leitura)"
+    return None
+
+def _event_source(conn, date_from, date_to):
+    """
+    Tabela (ou subconsulta) com os eventos de date_from a date_to, para usar
+    no FROM de uma consulta com as mesmas colunas de eventos
+    
+    Anexa somente as partições arquivadas dos anos do intervalo; main.eventos
+    só entra se algum ano do intervalo ainda não foi arquivado.
+    """
+    c = conn.execute('SELECT ano, arquivo FROM particoes_eventos WHERE ano BETWEEN ? AND ? ORDER BY ano',
+                     (date_from.year, date_to.year))
+    partitions = c.fetchall()
+    if not partitions:
+        return 'main.eventos'
+    if len(partitions) > MAX_ATTACHED_PARTITIONS:
+        raise sqlite3.OperationalError(
+            f"Intervalo abrange mais de {MAX_ATTACHED_PARTITIONS} anos arquivados")
+    
+    attached = {row[1] for row in conn.execute('PRAGMA database_list')}
+    sources = []
+    for year, filename in partitions:
+        alias = f'eventos_{year}'
+        if alias not in attached:
+            path = os.path.join(event_partition_dir(), filename)
+            if not os.path.exists(path):
+                raise sqlite3.OperationalError(f"Partição de eventos de {year} não encontrada: {path}")
+            conn.execute(f'ATTACH DATABASE ? AS {alias}', (_readonly_uri(path),))
+        sources.append(f'{alias}.eventos')
+    if len(partitions) < date_to.year - date_from.year + 1:
+        sources.insert(0, 'main.eventos')
+    
+    if len(sources) == 1:
+        return sources[0]
+    union = ' UNION ALL '.join(f'SELECT id, funcionario_id, tipo, timestamp FROM {table}'
+                               for table in sources)
+    return f'({union})'
+
+EVENT_COLUMNS = 'id, funcionario_id, tipo, timestamp'
+
+def _range_checksum(conn, table, columns, start, end):
+    """(quantidade, sha256) das linhas de table com start <= timestamp < end"""
+    digest = hashlib.sha256()
+    count = 0
+    rows = conn.execute(f'''
+        SELECT {columns} FROM {table}
+        WHERE timestamp >= ? AND timestamp < ?
+        ORDER BY id
+    ''', (start, end))
+    for row in rows:
+        digest.update('|'.join(str(value) for value in row).encode('utf-8') + b'\n')
+        count += 1
+    return count, digest.hexdigest()
+
+def _write_partition(path, rows):
+    """Cria o arquivo da partição com as linhas informadas (gravado com sync)"""
+    dest = sqlite3.connect(path)
+    try:
+        # Modo rollback: o arquivo fica autocontido e pode ser aberto com mode=ro
+        dest.execute('PRAGMA journal_mode=DELETE')
+        dest.execute('''
+            CREATE TABLE eventos (
+                id INTEGER PRIMARY KEY,
+                funcionario_id INTEGER,
+                tipo TEXT,
+                timestamp TEXT
+            )
+        ''')
+        dest.execute('CREATE INDEX idx_eventos_func_data ON eventos(funcionario_id, DATE(timestamp))')
+        dest.executemany('INSERT INTO eventos (id, funcionario_id, tipo, timestamp) VALUES (?,?,?,?)', rows)
+        dest.commit()
+    finally:
+        dest.close()
+
+def _remove_partition_file(path):
+    if os.path.exists(path):
+        os.chmod(path, 0o644)  # partições ficam somente leitura
+        os.remove(path)
+
+def list_event_partitions():
+    """Partições arquivadas: lista de {'ano', 'arquivo', 'registros', 'checksum', 'arquivado_em'}"""
+    try:
+        conn = connect()
+        c = conn.cursor()
+        c.execute('SELECT ano, arquivo, registros, checksum, arquivado_em FROM particoes_eventos ORDER BY ano')
+        result = [{'ano': row[0], 'arquivo': row[1], 'registros': row[2],
+                   'checksum': row[3], 'arquivado_em': row[4]} for row in c.fetchall()]
+        conn.close()
+        return result
+    except sqlite3.Error as e:
+        print(f"Erro ao listar partições de eventos: {e}")
+        return []
+
+def closed_event_years(today=None):
+    """Anos encerrados (além da carência) que ainda têm eventos em ponto.db"""
+    today = today or datetime.date.today()
+    last_closed = (today - datetime.timedelta(days=EVENT_ARCHIVE_GRACE_DAYS)).year - 1
+    conn = connect()
+    try:
+        c = conn.cursor()
+        c.execute('SELECT DISTINCT substr(timestamp, 1, 4) FROM eventos WHERE timestamp < ?',
+                  (f'{last_closed + 1:04d}-01-01',))
+        return sorted(int(row[0]) for row in c.fetchall())
+    finally:
+        conn.close()
+
+def archive_event_year(year, archived_by=None):
+    """
+    Move os eventos de um ano encerrado para a partição arquivo/eventos_AAAA.db
+    
+    1. Copia os eventos do ano para um arquivo temporário (leitura comum,
+       sem bloquear os terminais)
+    2. Com o bloqueio de escrita, confere quantidade e soma de verificação
+       da cópia com ponto.db (se o ano mudou no meio tempo, desiste), torna
+       o arquivo definitivo e somente leitura, remove os eventos do ano de
+       ponto.db e registra a partição, na mesma transação
+    
+    Uma queda em qualquer etapa mantém os eventos em ponto.db; a partição só
+    passa a ser usada depois do commit. Retorna: (sucesso, mensagem)
+    """
+    archived_by = archived_by or current_user()
+    if year >= datetime.date.today().year:
+        return False, f"O ano {year} ainda não foi encerrado"
+    
+    filename = f"eventos_{year}.db"
+    directory = event_partition_dir()
+    path = os.path.join(directory, filename)
+    temp_path = path + '.part'
+    start, end = f'{year:04d}-01-01', f'{year + 1:04d}-01-01'
+    
+    try:
+        os.makedirs(directory, exist_ok=True)
+        _remove_partition_file(temp_path)
+        
+        conn = connect()
+        try:
+            rows = conn.execute('''
+                SELECT id, funcionario_id, tipo, timestamp FROM eventos
+                WHERE timestamp >= ? AND timestamp < ?
+                ORDER BY id
+            ''', (start, end))
+            _write_partition(temp_path, rows)
+        finally:
+            conn.close()
+        
+        check = sqlite3.connect(_readonly_uri(temp_path), uri=True)
+        try:
+            copied = _range_checksum(check, 'eventos', EVENT_COLUMNS, start, end)
+        finally:
+            check.close()
+        if copied[0] == 0:
+            _remove_partition_file(temp_path)
+            return False, f"Nenhum evento de {year} em ponto.db"
+        
+        with write_transaction() as conn:
+            c = conn.cursor()
+            archived = _archived_year_message(c, year)
+            if archived:
+                _remove_partition_file(temp_path)
+                return False, archived
+            if _range_checksum(conn, 'main.eventos', EVENT_COLUMNS, start, end) != copied:
+                _remove_partition_file(temp_path)
+                return False, f"Eventos de {year} alterados durante o arquivamento; tente novamente"
+            
+            # Sobra de uma tentativa interrompida (nunca registrada) é substituída
+            _remove_partition_file(path)
+            os.replace(temp_path, path)
+            os.chmod(path, 0o444)
+            
+            c.execute('DELETE FROM eventos WHERE timestamp >= ? AND timestamp < ?', (start, end))
+            c.execute('''
+                INSERT INTO particoes_eventos (ano, arquivo, registros, checksum, arquivado_em)
+                VALUES (?,?,?,?,?)
+            ''', (year, filename, copied[0], copied[1], datetime.datetime.now().isoformat()))
+            _insert_log(c, archived_by, f"Arquivou os eventos de {year}", "sistema",
+                        detalhes=f"Arquivo: {filename}, Eventos: {copied[0]}, SHA-256: {copied[1]}")
+        
+        return True, f"{copied[0]} eventos de {year} arquivados em {filename}"
+    except (sqlite3.Error, OSError) as e:
+        print(f"Erro ao arquivar eventos de {year}: {e}")
+        log_action(archived_by, f"Erro ao arquivar eventos de {year}: {str(e)}", "sistema",
+                  status='falha')
+        return False, f"Erro ao arquivar eventos de {year}: {str(e)}"
+
+def purge_event_partition(year, justificativa, purged_by=None):
+    """
+    Remove a partição de eventos de um ano (ação administrativa explícita)
+    
+    O prazo de guarda (EVENT_RETENTION_YEARS) é o mínimo legal: anos dentro
+    dele nunca são removidos. A remoção exige justificativa, fica no log de
+    auditoria e não apaga a cópia em backups/arquivo/.
+    Retorna: (sucesso, mensagem)
+    """
+    purged_by = purged_by or current_user()
+    oldest_removable = datetime.date.today().year - EVENT_RETENTION_YEARS
+    if year >= oldest_removable:
+        return False, (f"Eventos de {year} ainda estão no prazo de guarda de {EVENT_RETENTION_YEARS} anos "
+                       f"(só anos anteriores a {oldest_removable} podem ser removidos)")
+    if not justificativa or len(justificativa.strip()) < 10:
+        return False, 'Justificativa deve ter no mínimo 10 caracteres'
+    
+    try:
+        with write_transaction() as conn:
+            c = conn.cursor()
+            c.execute('SELECT arquivo, registros FROM particoes_eventos WHERE ano=?', (year,))
+            row = c.fetchone()
+            if not row:
+                return False, f"Não há partição de eventos de {year}"
+            filename, count = row
+            c.execute('DELETE FROM particoes_eventos WHERE ano=?', (year,))
+            _insert_log(c, purged_by, f"Removeu os eventos arquivados de {year}", "sistema",
+                        detalhes=f"Arquivo: {filename}, Eventos: {count}, "
+                                 f"Guarda: {EVENT_RETENTION_YEARS} anos, Justificativa: {justificativa.strip()}")
+        
+        # O arquivo só é apagado depois que nenhuma consulta o encontra no registro
+        try:
+            _remove_partition_file(os.path.join(event_partition_dir(), filename))
+        except OSError as e:
+            print(f"Erro ao remover partição {filename}: {e}")
+        
+        return True, f"Partição de eventos de {year} removida ({count} eventos)"
+    except sqlite3.Error as e:
+        print(f"Erro ao remover partição de eventos: {e}")
+        return False, f"Erro no banco de dados: {str(e)}"
+
+def maintain_event_partitions():
+    """
+    Arquiva os anos encerrados (nenhuma partição é removida automaticamente:
+    ver purge_event_partition)
+    Retorna: lista de mensagens (uma por operação realizada)
+    """
+    messages = []
+    try:
+        years = closed_event_years()
+    except sqlite3.Error as e:
+        return [f"Erro ao verificar anos encerrados: {e}"]
+    for year in years:
+        ok, msg = archive_event_year(year, archived_by='system')
+        messages.append(msg)
+    return messages
@@ -0,0 +1,93 @@
+"""
+Marc - Índice de Busca de Funcionários
+Busca por prefixo de ID ou de qualquer palavra do nome, sem acentos e sem
+diferenciar maiúsculas, mantida em memória para os seletores da interface
+"""
+
+import heapq
+import unicodedata
+
+# Tamanho máximo dos prefixos indexados; termos maiores são conferidos no nome
+MAX_PREFIX = 8
+
+
+def normalize(text):
+    """Minúsculas e sem acentos ("João" -> "joao")"""
+    decomposed = unicodedata.normalize('NFKD', str(text))
+    return ''.join(ch for ch in decomposed if not unicodedata.combining(ch)).lower()
+
+
+def format_employee(employee):
+    """Texto exibido nos seletores ("id - nome")"""
+    return f"{employee['id']} - {employee['name']}"
+
+
+class EmployeeIndex:
+    """
+    Índice de prefixos e palavras dos funcionários
+
+    Cada palavra do nome e o ID são indexados por todos os seus prefixos (até
+    MAX_PREFIX caracteres). Uma busca com várias palavras retorna os
+    funcionários em que cada palavra é prefixo de alguma palavra do nome.
+    """
+
+    def __init__(self, employees=()):
+        self.rebuild(employees)
+
+    def rebuild(self, employees):
+        """Reconstrói o índice a partir de list_employees()"""
+        self._employees = {}
+        self._tokens = {}  # id -> palavras normalizadas do nome
+        self._prefixes = {}  # prefixo -> ids
+        self._sorted_ids = []
+
+        for employee in employees:
+            emp_id = employee['id']
+            tokens = normalize(employee['name']).split()
+            self._employees[emp_id] = employee
+            self._tokens[emp_id] = tokens
+            for token in tokens + [str(emp_id)]:
+                for size in range(1, min(len(token), MAX_PREFIX) + 1):
+                    self._prefixes.setdefault(token[:size], set()).add(emp_id)
+
+        self._sorted_ids = sorted(self._employees, key=lambda i: normalize(self._employees[i]['name']))
+        self._rank = {emp_id: position for position, emp_id in enumerate(self._sorted_ids)}
+
+    def __len__(self):
+        return len(self._employees)
+
+    def get(self, emp_id):
+        return self._employees.get(emp_id)
+
+    def _match_term(self, term):
+        ids = self._prefixes.get(term[:MAX_PREFIX], set())
+        if len(term) <= MAX_PREFIX:
+            return ids
+        return {emp_id for emp_id in ids
+                if str(emp_id).startswith(term) or any(t.startswith(term) for t in self._tokens[emp_id])}
+
+    def search(self, query, limit=30):
+        """
+        Retorna até limit funcionários que correspondem à busca
+
+        Ordem: ID exato, nomes que começam pela busca, demais em ordem alfabética
+        """
+        terms = normalize(query).split()
+        if not terms:
+            return [self._employees[i] for i in self._sorted_ids[:limit]]
+
+        matches = None
+        for term in sorted(terms, key=len, reverse=True):
+            ids = self._match_term(term)
+            matches = ids if matches is None else matches & ids
+            if not matches:
+                return []
+
+        full = ' '.join(terms)
+
+        def sort_key(emp_id):
+            return (str(emp_id) != full,
+                    not ' '.join(self._tokens[emp_id]).startswith(full),
+                    self._rank[emp_id])
+
+        return [self._employees[i] for i in heapq.nsmallest(limit, matches, key=sort_key)]
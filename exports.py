@@ -0,0 +1,354 @@
+"""
+Marc - Exportação de Relatórios
+Gera os PDFs (folha de ponto e logs de auditoria) em um processo separado,
+com progresso, cancelamento e histórico de trabalhos
+"""
+
+import calendar
+import datetime
+import itertools
+import multiprocessing
+import os
+import queue
+import subprocess
+import sys
+
+# Pasta de saída padrão dos relatórios (MARC_EXPORT_DIR para alterar)
+DEFAULT_EXPORT_DIR = os.environ.get('MARC_EXPORT_DIR', 'relatorios')
+
+# Situação dos trabalhos
+STATUS_QUEUED = 'na fila'
+STATUS_RUNNING = 'gerando'
+STATUS_DONE = 'concluído'
+STATUS_FAILED = 'falhou'
+STATUS_CANCELLED = 'cancelado'
+FINISHED_STATUSES = (STATUS_DONE, STATUS_FAILED, STATUS_CANCELLED)
+
+
+# --- Geração (executada no processo de exportação) ---
+def render_timesheet_pdf(path, emp_id, year, month, progress):
+    """Gera o PDF da folha de ponto mensal de um funcionário"""
+    from reportlab.lib.pagesizes import A4
+    from reportlab.pdfgen import canvas
+    from core_db import EVENT_TYPES, get_employee_by_id, get_timesheet, summarize_timesheet, format_timedelta
+
+    employee = get_employee_by_id(emp_id)
+    if not employee:
+        raise ValueError("Funcionário não encontrado")
+
+    emp_name = employee['name']
+    days = get_timesheet(emp_id, year, month)
+    summary = summarize_timesheet(days)
+    progress(0.2, "Dados carregados")
+
+    c = canvas.Canvas(path, pagesize=A4)
+
+    # Cabeçalho
+    c.setFillColorRGB(0.13, 0.59, 0.95)
+    c.rect(0, 800, 600, 42, fill=True, stroke=False)
+
+    c.setFillColorRGB(1, 1, 1)
+    c.setFont("Helvetica-Bold", 18)
+    c.drawString(50, 815, "⚡ Marc - Folha de Ponto")
+
+    y = 770
+    c.setFillColorRGB(0, 0, 0)
+    c.setFont("Helvetica-Bold", 12)
+    c.drawString(50, y, f"Funcionário: {emp_name}")
+    y -= 20
+    c.setFont("Helvetica", 10)
+    c.drawString(50, y, f"{calendar.month_name[month]} de {year}")
+    y -= 30
+
+    # Resumo
+    c.setFont("Helvetica-Bold", 10)
+    c.drawString(50, y, "Resumo Mensal:")
+    y -= 15
+    c.setFont("Helvetica", 9)
+    c.drawString(50, y, f"Total trabalhado: {summary['total_hours_formatted']}")
+    y -= 12
+    c.drawString(50, y, f"Dias: {summary['worked_days']} | Feriados: {summary['holidays']} | Folgas: {summary['days_off']}")
+    y -= 25
+
+    # Tabela
+    c.setFont("Helvetica-Bold", 8)
+    c.drawString(50, y, "Data")
+    c.drawString(110, y, "Entrada")
+    c.drawString(170, y, "In.Desc")
+    c.drawString(220, y, "Fim Desc")
+    c.drawString(280, y, "Saída")
+    c.drawString(340, y, "Total")
+    c.drawString(400, y, "Status")
+    y -= 15
+
+    c.setFont("Helvetica", 7)
+
+    for index, day in enumerate(days, 1):
+        if y < 50:
+            c.showPage()
+            c.setFont("Helvetica", 7)
+            y = 800
+
+        flags = []
+        if day['holiday']:
+            flags.append("FERIADO")
+        if day['off']:
+            flags.append("FOLGA")
+        flag_str = ", ".join(flags) if flags else "-"
+
+        ev_map = {k: '-' for k in EVENT_TYPES}
+        for e in day['events']:
+            ev_map[e['type']] = e['ts'].strftime('%H:%M')
+
+        total = format_timedelta(day['duration']) or '-'
+
+        c.drawString(50, y, day['date'].strftime('%d/%m/%Y'))
+        c.drawString(110, y, ev_map['entrada'])
+        c.drawString(170, y, ev_map['inicio_descanso'])
+        c.drawString(220, y, ev_map['fim_descanso'])
+        c.drawString(280, y, ev_map['saida'])
+        c.drawString(340, y, total)
+        c.drawString(400, y, flag_str)
+
+        y -= 12
+        progress(0.2 + 0.7 * index / len(days), f"Dia {index}/{len(days)}")
+
+    c.save()
+
+
+def render_logs_pdf(path, query, limit, progress):
+    """Gera o PDF dos logs de auditoria do filtro/ordenação informados"""
+    from reportlab.lib.pagesizes import A4
+    from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
+    from reportlab.lib.styles import getSampleStyleSheet
+    from reportlab.lib.units import inch
+    from reportlab.lib import colors
+    from db import get_logs_page
+
+    logs = get_logs_page(0, limit, **query)
+    if not logs:
+        raise ValueError("Nenhum log para exportar")
+    progress(0.2, f"{len(logs)} registros carregados")
+
+    # Preparar dados para a tabela
+    styleSheet = getSampleStyleSheet()
+    data = []
+
+    # Cabeçalho
+    headers = ["Data/Hora", "Usuário", "Ação", "Categoria", "Status"]
+    data.append([Paragraph(f"<b>{h}</b>", styleSheet['Normal']) for h in headers])
+
+    # Dados
+    for index, log in enumerate(logs, 1):
+        data.append([
+            Paragraph(log['timestamp'][:19], styleSheet['Normal']),
+            Paragraph(log['usuario'], styleSheet['Normal']),
+            Paragraph(log['acao'][:100] + ("..." if len(log['acao']) > 100 else ""), styleSheet['Normal']),
+            Paragraph(log['categoria'], styleSheet['Normal']),
+            Paragraph(log['status'], styleSheet['Normal'])
+        ])
+        if index % 100 == 0:
+            progress(0.2 + 0.5 * index / len(logs), f"Registro {index}/{len(logs)}")
+
+    # Tabela quebrada em páginas, repetindo o cabeçalho
+    table = Table(data, colWidths=[1.0*inch, 1.0*inch, 2.5*inch, 1.0*inch, 0.8*inch], repeatRows=1)
+    table.setStyle(TableStyle([
+        ('BACKGROUND', (0, 0), (-1, 0), colors.lightblue),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.black),
+        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('FONTSIZE', (0, 0), (-1, 0), 10),
+        ('BOTTOMPADDING', (0, 0), (-1, 0), 8),
+        ('BACKGROUND', (0, 1), (-1, -1), colors.white),
+        ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
+        ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+    ]))
+
+    title = Paragraph("<font color='#2196F3' size='16'><b>Relatório de Logs de Auditoria</b></font>",
+                      styleSheet['Normal'])
+    progress(0.75, "Montando páginas")
+    doc = SimpleDocTemplate(path, pagesize=A4, leftMargin=50, rightMargin=50, topMargin=50, bottomMargin=50)
+    doc.build([title, Spacer(1, 20), table])
+
+
+RENDERERS = {
+    'timesheet': render_timesheet_pdf,
+    'logs': render_logs_pdf
+}
+
+
+def _run_export(kind, params, path, db_file, updates):
+    """Ponto de entrada do processo de exportação"""
+    import db
+    db.DB_FILE = db_file
+
+    def progress(fraction, message=""):
+        updates.put(('progress', round(fraction, 3), message))
+
+    tmp_path = path + '.part'
+    try:
+        RENDERERS[kind](tmp_path, progress=progress, **params)
+        os.replace(tmp_path, path)
+        updates.put(('done', 1.0, path))
+    except Exception as e:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        updates.put(('failed', None, str(e)))
+
+
+# --- Gerenciamento (na thread do Tk) ---
+class ExportJob:
+    """Trabalho de exportação e sua situação"""
+
+    def __init__(self, job_id, kind, title, params, path):
+        self.id = job_id
+        self.kind = kind
+        self.title = title
+        self.params = params
+        self.path = path
+        self.status = STATUS_QUEUED
+        self.progress = 0.0
+        self.message = ""
+        self.created = datetime.datetime.now()
+        self.finished = None
+        self.process = None
+        self.updates = None
+
+    @property
+    def active(self):
+        return self.status not in FINISHED_STATUSES
+
+
+class ExportJobManager:
+    """
+    Fila de exportações executadas uma por vez em um processo separado
+
+    - submit() enfileira e retorna o ExportJob imediatamente
+    - poll() deve ser chamado periodicamente (after) na thread do Tk: lê o
+      progresso do processo, inicia o próximo trabalho e chama on_change
+    - cancel() encerra o processo e remove o arquivo parcial
+    - history mantém os últimos max_history trabalhos da sessão
+    """
+
+    def __init__(self, output_dir=DEFAULT_EXPORT_DIR, db_file=None, on_change=None, max_history=100):
+        self.output_dir = output_dir
+        self.db_file = db_file
+        self.on_change = on_change
+        self.max_history = max_history
+        self.history = []
+        self._ids = itertools.count(1)
+        self._context = multiprocessing.get_context('spawn')
+
+    def set_output_dir(self, path):
+        self.output_dir = path
+
+    def submit(self, kind, title, filename, **params):
+        """Enfileira uma exportação; filename é relativo à pasta de saída"""
+        if kind not in RENDERERS:
+            raise ValueError(f"Tipo de exportação inválido: {kind}")
+        os.makedirs(self.output_dir, exist_ok=True)
+        job = ExportJob(next(self._ids), kind, title, params, os.path.abspath(os.path.join(self.output_dir, filename)))
+        self.history.append(job)
+        self._trim_history()
+        self._changed(job)
+        self._start_next()
+        return job
+
+    def cancel(self, job):
+        """Cancela um trabalho na fila ou em execução"""
+        if not job.active:
+            return
+        if job.process is not None and job.process.is_alive():
+            job.process.terminate()
+            job.process.join(timeout=5)
+            partial = job.path + '.part'
+            if os.path.exists(partial):
+                os.remove(partial)
+        self._finish(job, STATUS_CANCELLED, "Cancelado pelo usuário")
+        self._changed(job)
+        self._start_next()
+
+    def cancel_all(self):
+        for job in list(self.history):
+            self.cancel(job)
+
+    @property
+    def running(self):
+        return next((job for job in self.history if job.status == STATUS_RUNNING), None)
+
+    def poll(self):
+        """Processa as mensagens do processo de exportação em andamento"""
+        job = self.running
+        if job is None:
+            return
+
+        while True:
+            try:
+                kind, fraction, message = job.updates.get_nowait()
+            except queue.Empty:
+                break
+            if kind == 'progress':
+                job.progress, job.message = fraction, message
+            elif kind == 'done':
+                job.progress = 1.0
+                self._finish(job, STATUS_DONE, "PDF gerado")
+            else:
+                self._finish(job, STATUS_FAILED, message)
+            self._changed(job)
+            if not job.active:
+                break
+
+        if job.active and not job.process.is_alive():
+            # Processo terminou sem resposta (falha grave)
+            self._finish(job, STATUS_FAILED, f"Processo encerrado (código {job.process.exitcode})")
+            self._changed(job)
+
+        if not job.active:
+            job.process.join(timeout=1)
+            self._start_next()
+
+    def _start_next(self):
+        if self.running is not None:
+            return
+        job = next((j for j in self.history if j.status == STATUS_QUEUED), None)
+        if job is None:
+            return
+
+        import db
+        job.updates = self._context.Queue()
+        job.process = self._context.Process(
+            target=_run_export,
+            args=(job.kind, job.params, job.path, os.path.abspath(self.db_file or db.DB_FILE), job.updates),
+            daemon=True,
+            name=f"marc-export-{job.id}"
+        )
+        job.status = STATUS_RUNNING
+        job.message = "Iniciando..."
+        job.process.start()
+        self._changed(job)
+
+    def _finish(self, job, status, message):
+        job.status = status
+        job.message = message
+        job.finished = datetime.datetime.now()
+
+    def _trim_history(self):
+        while len(self.history) > self.max_history:
+            finished = next((job for job in self.history if not job.active), None)
+            if finished is None:
+                return
+            self.history.remove(finished)
+
+    def _changed(self, job):
+        if self.on_change:
+            self.on_change(job)
+
+
+def open_path(path):
+    """Abre a pasta ou o arquivo com o aplicativo padrão do sistema"""
+    if sys.platform.startswith('win'):
+        os.startfile(path)
+    elif sys.platform == 'darwin':
+        subprocess.Popen(['open', path])
+    else:
+        subprocess.Popen(['xdg-open', path])
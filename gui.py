@@ -6,24 +6,42 @@ import customtkinter as ctk
 from tkinter import messagebox, ttk
 from core_db import (
     add_employee, remove_employee, list_employees,
-    record_event, get_timesheet, compute_work_duration,
-    format_timedelta, add_holiday, set_day_off,
-    get_employee_by_id, get_monthly_summary
+    record_event, get_timesheet, summarize_timesheet,
+    add_holiday, set_day_off,
+    get_employee_by_id
 )
-from db import get_logs, get_logs_summary, clear_old_logs, log_action
+from db import (
+    get_logs_page, count_logs, get_logs_summary, clear_old_logs, log_action,
+    LOG_SORT_COLUMNS, SORT_RELEVANCE, is_transient_error
+)
+from tasks import TaskExecutor
+from virtual_tree import VirtualTreeview
+from timesheet_table import TimesheetTable
+from employee_index import EmployeeIndex, format_employee
+from presence import get_presence_board, STATES, STATE_WORKING, STATE_BREAK, STATE_OUT
+from exports import ExportJobManager, open_path, STATUS_DONE
+from spool import get_punch_spool
 import datetime
-import calendar
-from reportlab.lib.pagesizes import A4
-from reportlab.pdfgen import canvas
-from reportlab.lib.units import inch
-from reportlab.pdfbase import pdfmetrics
-from reportlab.pdfbase.ttfonts import TTFont
-from reportlab.platypus import Table, TableStyle, Paragraph
-from reportlab.lib.styles import getSampleStyleSheet
-from reportlab.lib import colors
+import os
+# reportlab é importado apenas no processo de exportação (exports.py)
 
 EVENT_TYPES = ['entrada', 'inicio_descanso', 'fim_descanso', 'saida']
 
+# Intervalo de atualização do quadro de presença (lido da memória, sem consulta)
+PRESENCE_REFRESH_MS = 2000
+
+PRESENCE_LABELS = {
+    STATE_WORKING: "Trabalhando",
+    STATE_BREAK: "Em descanso",
+    STATE_OUT: "Fora"
+}
+
+# Número de funcionários listados por busca nos seletores
+EMPLOYEE_MATCHES = 30
+
+# Intervalo de leitura do progresso das exportações
+EXPORT_POLL_MS = 200
+
 # Paleta de cores Marc
 COLORS = {
     'primary': '#2196F3',
@@ -52,6 +70,21 @@ class PontoFlowApp(ctk.CTk):
         # Configurar tema
         ctk.set_appearance_mode("light")
         
+        # Índice de busca compartilhado pelos seletores de funcionários
+        self.employee_index = EmployeeIndex()
+        self.employee_comboboxes = []
+        
+        # Execução de consultas e operações lentas fora da thread do Tk
+        self.tasks = TaskExecutor(self, on_busy_change=self.on_busy_change,
+                                  on_error=self.on_task_error)
+        self.protocol("WM_DELETE_WINDOW", self.on_close)
+        
+        # Exportações de PDF em processo separado (uma por vez, com histórico)
+        self.exports = ExportJobManager(on_change=self.on_export_change)
+        self.export_window = None
+        self.export_rows = {}
+        self.export_poll_job = None
+        
         # Container principal
         self.main_container = ctk.CTkFrame(self, fg_color=COLORS['background'])
         self.main_container.pack(fill="both", expand=True)
@@ -64,6 +97,7 @@ class PontoFlowApp(ctk.CTk):
             self.main_container,
             width=1080,
             height=600,
+            command=self.on_tab_selected,
             fg_color=COLORS['card'],
             segmented_button_fg_color=COLORS['primary'],
             segmented_button_selected_color=COLORS['secondary'],
@@ -73,132 +107,44 @@ class PontoFlowApp(ctk.CTk):
         )
         self.tabview.pack(padx=10, pady=(0, 10))
         
-        self.tabview.add("📍 Registro de Ponto")
-        self.tabview.add("📊 Folha de Ponto")
+        # Registro de abas: o conteúdo só é construído na primeira seleção
+        self.tab_factories = {
+            "📍 Registro de Ponto": self.init_registro_tab,
+            "📊 Folha de Ponto": self.init_folha_tab
+        }
         
         if is_admin:
-            self.tabview.add("👥 Funcionários")
-            self.tabview.add("🏖️ Folgas")
-            self.tabview.add("🎉 Feriados")
-            self.tabview.add("🔧 Ajuste de Ponto")
-            self.tabview.add("📋 Logs de Auditoria")
+            self.tab_factories.update({
+                "🟢 Presença": self.init_presence_tab,
+                "👥 Funcionários": self.init_funcionarios_tab,
+                "🏖️ Folgas": self.init_day_off_tab,
+                "🎉 Feriados": self.init_feriados_tab,
+                "🔧 Ajuste de Ponto": self.init_adjust_ponto_tab,
+                "📋 Logs de Auditoria": self.init_logs_tab,
+                "💾 Backups": self.init_backup_tab
+            })
         
-        # Inicializar abas
-        self.init_registro_tab()
-        self.init_folha_tab()
+        self.built_tabs = set()
+        for name in self.tab_factories:
+            self.tabview.add(name)
         
-        if is_admin:
-            self.init_funcionarios_tab()
-            self.init_day_off_tab()
-            self.init_feriados_tab()
-            self.init_adjust_ponto_tab()
-            self.init_logs_tab()
-        if is_admin:
-            self.tabview.add("💾 Backups")
-            self.init_backup_tab()
+        # Apenas a aba inicial é construída na abertura da janela
+        self.ensure_tab(self.tabview.get())
 
     def export_logs_pdf(self):
-        """Exporta os logs de auditoria exibidos na tabela para PDF com layout profissional e sem corte"""
-        logs = self.get_displayed_logs()  # Obtém os logs exibidos atualmente
-
-        if not logs:
+        """Exporta para PDF os logs do filtro e ordenação atuais (gerado em segundo plano)"""
+        if not self.logs_view.total:
             messagebox.showwarning("Aviso", "Nenhum log para exportar.")
             return
 
-        from datetime import datetime
-        from reportlab.lib.pagesizes import A4
-        from reportlab.pdfgen import canvas
-        from reportlab.platypus import Table, TableStyle, Paragraph
-        from reportlab.lib.styles import getSampleStyleSheet
-        from reportlab.lib import colors
-
-        timestamp = datetime.now().strftime("%d_%m_%Y_%H_%M_%S")
-        filename = f"Logs_Auditoria_{timestamp}.pdf"
+        timestamp = datetime.datetime.now().strftime("%d_%m_%Y_%H_%M_%S")
+        self.submit_export(
+            'logs',
+            "Logs de auditoria",
+            f"Logs_Auditoria_{timestamp}.pdf",
+            query=dict(self.logs_view.query), limit=500
+        )
 
-        try:
-            c = canvas.Canvas(filename, pagesize=A4)
-            width, height = A4
-
-            # Título
-            c.setFillColorRGB(0.13, 0.59, 0.95)
-            c.setFont("Helvetica-Bold", 16)
-            c.drawString(50, height - 50, "Relatório de Logs de Auditoria")
-
-            # Preparar dados para a tabela
-            styleSheet = getSampleStyleSheet()
-            data = []
-
-            # Cabeçalho
-            headers = ["Data/Hora", "Usuário", "Ação", "Categoria", "Status"]
-            data.append([Paragraph(f"<b>{h}</b>", styleSheet['Normal']) for h in headers])
-
-            # Dados
-            for log in logs:
-                row = [
-                    Paragraph(log['timestamp'][:19], styleSheet['Normal']),
-                    Paragraph(log['usuario'], styleSheet['Normal']),
-                    Paragraph(log['acao'][:100] + ("..." if len(log['acao']) > 100 else ""), styleSheet['Normal']),
-                    Paragraph(log['categoria'], styleSheet['Normal']),
-                    Paragraph(log['status'], styleSheet['Normal'])
-                ]
-                data.append(row)
-
-            # Criar tabela
-            table = Table(data, colWidths=[1.0*inch, 1.0*inch, 2.5*inch, 1.0*inch, 0.8*inch])
-
-            # Estilo da tabela
-            table.setStyle(TableStyle([
-                ('BACKGROUND', (0, 0), (-1, 0), colors.lightblue),
-                ('TEXTCOLOR', (0, 0), (-1, 0), colors.black),
-                ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-                ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-                ('FONTSIZE', (0, 0), (-1, 0), 10),
-                ('BOTTOMPADDING', (0, 0), (-1, 0), 8),
-                ('BACKGROUND', (0, 1), (-1, -1), colors.white),
-                ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
-                ('VALIGN', (0, 0), (-1, -1), 'TOP'),
-                ('WORDWRAP', (0, 0), (-1, -1), True),
-            ]))
-
-            # Calcular posição dinâmica
-            table.wrapOn(c, width - 100, height)  # Calcula o tamanho necessário
-            table_height = table._height  # Altura real da tabela
-
-            # Posicionar a tabela abaixo do título, com margem
-            y_position = height - 80 - table_height  # Começa abaixo do título
-
-            # Se a tabela for muito grande, quebra em páginas
-            if y_position < 50:
-                c.showPage()
-                y_position = height - 50
-
-            # Desenhar a tabela
-            table.drawOn(c, 50, y_position)
-
-            # Salvar
-            c.showPage()
-            c.save()
-
-            messagebox.showinfo("✓ Sucesso", f"Relatório salvo como:\n{filename}")
-
-        except Exception as e:
-            messagebox.showerror("✗ Erro", f"Erro ao salvar PDF:\n{str(e)}")
-
-    def get_displayed_logs(self):
-        """Retorna os logs atualmente exibidos na Treeview de logs"""
-        logs = []
-        for child in self.logs_tree.get_children():
-            item = self.logs_tree.item(child)
-            values = item['values']
-            logs.append({
-                'timestamp': values[0],
-                'usuario': values[1],
-                'acao': values[2],
-                'categoria': values[3],
-                'status': values[4]
-            })
-        return logs
-        
     def init_backup_tab(self):
         """Inicializa a aba de gerenciamento de backups"""
         from backup import BackupManager
@@ -212,7 +158,7 @@ class PontoFlowApp(ctk.CTk):
         manual_frame = ctk.CTkFrame(manual_card, fg_color="transparent")
         manual_frame.pack(fill="x", pady=15, padx=20)
         
-        ctk.CTkButton(
+        self.backup_daily_button = ctk.CTkButton(
             manual_frame,
             text="📌 Backup Diário Agora",
             command=self.backup_daily_action,
@@ -221,9 +167,10 @@ class PontoFlowApp(ctk.CTk):
             fg_color=COLORS['primary'],
             hover_color=COLORS['secondary'],
             font=ctk.CTkFont(size=12, weight="bold")
-        ).pack(side="left", padx=5)
+        )
+        self.backup_daily_button.pack(side="left", padx=5)
         
-        ctk.CTkButton(
+        self.backup_weekly_button = ctk.CTkButton(
             manual_frame,
             text="📌 Backup Semanal Agora",
             command=self.backup_weekly_action,
@@ -232,9 +179,10 @@ class PontoFlowApp(ctk.CTk):
             fg_color=COLORS['success'],
             hover_color='#45A049',
             font=ctk.CTkFont(size=12, weight="bold")
-        ).pack(side="left", padx=5)
+        )
+        self.backup_weekly_button.pack(side="left", padx=5)
         
-        ctk.CTkButton(
+        self.backup_cleanup_button = ctk.CTkButton(
             manual_frame,
             text="🧹 Limpar Antigos",
             command=self.cleanup_backups_action,
@@ -243,7 +191,8 @@ class PontoFlowApp(ctk.CTk):
             fg_color=COLORS['warning'],
             hover_color='#F57C00',
             font=ctk.CTkFont(size=12, weight="bold")
-        ).pack(side="left", padx=5)
+        )
+        self.backup_cleanup_button.pack(side="left", padx=5)
         
         # Card de informações
         info_card = self.create_card(tab, "ℹ️ Informações de Backups")
@@ -295,7 +244,7 @@ class PontoFlowApp(ctk.CTk):
         )
         self.backup_restore_combo.pack(fill="x", pady=10)
         
-        ctk.CTkButton(
+        self.backup_restore_button = ctk.CTkButton(
             restore_frame,
             text="⚠️ Restaurar Selecionado",
             command=self.restore_backup_action,
@@ -304,7 +253,14 @@ class PontoFlowApp(ctk.CTk):
             fg_color=COLORS['danger'],
             hover_color='#D32F2F',
             font=ctk.CTkFont(size=12, weight="bold")
-        ).pack(pady=10)
+        )
+        self.backup_restore_button.pack(pady=10)
+        
+        # Backups, limpeza e restauração não podem ser disparados em paralelo
+        self.backup_action_buttons = [
+            self.backup_daily_button, self.backup_weekly_button,
+            self.backup_cleanup_button, self.backup_restore_button
+        ]
         
         # Info
         info_frame = ctk.CTkFrame(restore_card, fg_color=COLORS['background'], corner_radius=10)
@@ -313,7 +269,8 @@ class PontoFlowApp(ctk.CTk):
         ctk.CTkLabel(
             info_frame,
             text="⚠️ ATENÇÃO: Restaurar um backup substitui o banco de dados atual!\n"
-                "Um backup do banco atual será criado antes da restauração.",
+                "Um backup do banco atual será criado antes da restauração.\n"
+                "Operações em andamento são concluídas antes da troca; a aplicação não é reiniciada.",
             font=ctk.CTkFont(size=10),
             text_color=COLORS['danger'],
             justify="center"
@@ -326,9 +283,11 @@ class PontoFlowApp(ctk.CTk):
         """Atualiza as informações de backup na interface"""
         from backup import BackupManager
         
-        backup_manager = BackupManager()
-        backup_info = backup_manager.get_backup_info()
-        
+        self.tasks.submit('backup_info', lambda: BackupManager().get_backup_info(),
+                          on_success=self.show_backup_info)
+
+    def show_backup_info(self, backup_info):
+        """Exibe as informações de backup carregadas"""
         self.backup_info_textbox.delete("1.0", "end")
         
         # Cabeçalho
@@ -370,82 +329,137 @@ class PontoFlowApp(ctk.CTk):
                     f"   Data: {backup['timestamp'][:19]}\n"
                     f"   Tamanho: {backup['size_mb']} MB\n"
                 )
+                metrics = backup.get('metrics')
+                if metrics:
+                    self.backup_info_textbox.insert("end",
+                        f"   Duração: {metrics['duration_s']}s "
+                        f"(cópia {metrics['copy_s']}s, verificação {metrics['verify_s']}s) | "
+                        f"{metrics['mb_per_s'] or '-'} MB/s | {metrics['pages']} páginas | "
+                        f"Pausa de escrita: {metrics['writer_stall_ms']} ms\n"
+                    )
         else:
             self.backup_info_textbox.insert("end", "Nenhum backup disponível ainda.\n")
             self.backup_restore_combo.configure(state="disabled")
         
+        # Métricas das últimas operações
+        if backup_info.get('runs'):
+            operation_labels = {'backup': 'BACKUP', 'cleanup': 'LIMPEZA', 'restore': 'RESTAURAÇÃO'}
+            self.backup_info_textbox.insert("end", "\nÚLTIMAS OPERAÇÕES:\n")
+            self.backup_info_textbox.insert("end", "-" * 70 + "\n")
+            for run in backup_info['runs']:
+                size_mb = run.get('bytes', 0) / (1024 * 1024)
+                line = (f"{run['timestamp'][:19]}  {operation_labels.get(run['operation'], run['operation']):<12} "
+                        f"{run['duration_s']:>8}s  {size_mb:>9.2f} MB")
+                if run.get('mb_per_s'):
+                    line += f"  {run['mb_per_s']} MB/s"
+                if 'downtime_s' in run:
+                    line += f"  indisponível {run['downtime_s']}s"
+                if 'writer_stall_ms' in run:
+                    line += f"  pausa {run['writer_stall_ms']} ms"
+                self.backup_info_textbox.insert("end", line + "\n")
+        
         self.backup_info_textbox.insert("end", "\n" + "=" * 70 + "\n")
 
     def backup_daily_action(self):
         """Executa um backup diário manual"""
-        from backup import BackupManager
-        from db import log_action
-        from core_db import get_current_user
-        
-        backup_manager = BackupManager()
-        success, backup_path, msg = backup_manager.create_backup('daily')
-        
-        if success:
-            log_action(get_current_user(), "Executou backup diário manual", "backup",
-                    detalhes=f"Arquivo: {backup_path}")
-            messagebox.showinfo("✓ Sucesso", msg)
-            self.refresh_backup_info()
-        else:
-            log_action(get_current_user(), "Falha ao executar backup diário manual", "backup",
-                    detalhes=msg, status='falha')
-            messagebox.showerror("✗ Erro", msg)
+        self.run_manual_backup('daily')
 
     def backup_weekly_action(self):
         """Executa um backup semanal manual"""
+        self.run_manual_backup('weekly')
+
+    def run_manual_backup(self, backup_type):
+        """Executa um backup manual em segundo plano"""
         from backup import BackupManager
         from db import log_action
         from core_db import get_current_user
         
-        backup_manager = BackupManager()
-        success, backup_path, msg = backup_manager.create_backup('weekly')
+        label = 'diário' if backup_type == 'daily' else 'semanal'
+        user = get_current_user()
         
-        if success:
-            log_action(get_current_user(), "Executou backup semanal manual", "backup",
-                    detalhes=f"Arquivo: {backup_path}")
-            messagebox.showinfo("✓ Sucesso", msg)
-            self.refresh_backup_info()
-        else:
-            log_action(get_current_user(), "Falha ao executar backup semanal manual", "backup",
-                    detalhes=msg, status='falha')
-            messagebox.showerror("✗ Erro", msg)
+        def work():
+            success, backup_path, msg = BackupManager().create_backup(backup_type)
+            if success:
+                log_action(user, f"Executou backup {label} manual", "backup",
+                        detalhes=f"Arquivo: {backup_path}")
+            else:
+                log_action(user, f"Falha ao executar backup {label} manual", "backup",
+                        detalhes=msg, status='falha')
+            return success, msg
+        
+        def done(result):
+            success, msg = result
+            if success:
+                messagebox.showinfo("✓ Sucesso", msg)
+                self.refresh_backup_info()
+            else:
+                messagebox.showerror("✗ Erro", msg)
+        
+        self.tasks.submit(None, work, on_success=done,
+                          busy=self.backup_action_buttons)
 
     def cleanup_backups_action(self):
-        """Limpa backups antigos"""
+        """Limpa backups antigos segundo a política de retenção"""
+        from backup import BackupManager
+        
+        def work():
+            backup_manager = BackupManager()
+            policy = backup_manager.get_retention_policy()
+            return policy, backup_manager.plan_retention(policy)
+        
+        self.tasks.submit('backup_cleanup_plan', work, on_success=self.confirm_backup_cleanup,
+                          busy=self.backup_action_buttons)
+
+    def confirm_backup_cleanup(self, result):
+        """Exibe o plano de retenção e aplica a limpeza em segundo plano"""
         from backup import BackupManager
         from db import log_action
         from core_db import get_current_user
         
+        policy, plan = result
+        
+        if not plan['delete']:
+            messagebox.showinfo("ℹ️ Limpeza", "Nenhum backup antigo encontrado para remover.")
+            return
+        
+        freed_mb = plan['freed_bytes'] / (1024 * 1024)
+        kept_mb = plan['kept_bytes'] / (1024 * 1024)
+        budget = (f"{policy.max_total_bytes / (1024 * 1024):.0f} MB"
+                  if policy.max_total_bytes is not None else "sem limite")
+        preview = "\n".join(f"- {b['filename']} ({', '.join(b['reasons'])})"
+                            for b in plan['delete'][:10])
+        if len(plan['delete']) > 10:
+            preview += f"\n... e mais {len(plan['delete']) - 10}"
+        
         confirm = messagebox.askyesno(
             "⚠️ Confirmar Limpeza",
-            "Deseja realmente remover backups antigos?\n\n"
-            "Serão mantidos:\n"
-            "- Últimos 14 backups diários\n"
-            "- Últimos 12 backups semanais\n\n"
+            f"Política: {policy.hourly} horas, {policy.daily} dias, {policy.weekly} semanas, "
+            f"{policy.monthly} meses, {policy.yearly} anos (espaço: {budget})\n\n"
+            f"Serão removidos {len(plan['delete'])} backup(s), liberando {freed_mb:.2f} MB.\n"
+            f"Serão mantidos {len(plan['keep'])} backup(s) ({kept_mb:.2f} MB).\n\n"
+            f"{preview}\n\n"
             "Esta ação não pode ser desfeita!"
         )
         
         if not confirm:
             return
         
-        backup_manager = BackupManager()
-        removed = backup_manager.cleanup_old_backups(keep_daily=14, keep_weekly=12)
+        user = get_current_user()
         
-        log_action(get_current_user(), "Executou limpeza de backups antigos", "backup",
-                detalhes=f"Backups removidos: {removed}")
+        def work():
+            # Remove exatamente os backups listados na confirmação
+            removed = BackupManager().apply_retention(plan=plan)['removed']
+            log_action(user, "Executou limpeza de backups antigos", "backup",
+                    detalhes=f"Backups removidos: {removed}")
+            return removed
         
-        if removed > 0:
-            messagebox.showinfo("✓ Limpeza Concluída", 
+        def done(removed):
+            messagebox.showinfo("✓ Limpeza Concluída",
                             f"{removed} backup(s) antigo(s) removido(s) com sucesso!")
-        else:
-            messagebox.showinfo("ℹ️ Limpeza", "Nenhum backup antigo encontrado para remover.")
+            self.refresh_backup_info()
         
-        self.refresh_backup_info()
-
+        self.tasks.submit(None, work, on_success=done,
+                          busy=self.backup_action_buttons)
     def restore_backup_action(self):
         """Restaura um backup selecionado"""
         from backup import BackupManager
@@ -471,20 +485,51 @@ class PontoFlowApp(ctk.CTk):
         if not confirm:
             return
         
-        backup_manager = BackupManager()
-        success, msg = backup_manager.restore_backup(backup_filename)
+        from db import quiesced
+        from punch_state import punch_states
+        
+        user = get_current_user()
+        
+        def work():
+            success, msg = BackupManager().restore_backup(backup_filename, quiesce=quiesced)
+            if success:
+                # Estado de ponto do dia em cache pertence ao banco anterior
+                punch_states.clear()
+                log_action(user, "Restaurou backup do banco de dados", "backup",
+                        detalhes=f"Arquivo restaurado: {backup_filename}")
+            else:
+                log_action(user, "Falha ao restaurar backup", "backup",
+                        detalhes=f"Arquivo: {backup_filename}, Erro: {msg}", status='falha')
+            return success, msg
+        
+        def done(result):
+            success, msg = result
+            if success:
+                messagebox.showinfo("✓ Sucesso", msg)
+                # Recarregar as telas a partir do banco restaurado (sem reiniciar)
+                self.reload_after_restore()
+            else:
+                messagebox.showerror("✗ Erro", msg)
         
-        if success:
-            log_action(get_current_user(), "Restaurou backup do banco de dados", "backup",
-                    detalhes=f"Arquivo restaurado: {backup_filename}")
-            messagebox.showinfo("✓ Sucesso", msg + "\n\nA aplicação será reiniciada.")
-            # Reiniciar aplicação
-            import os
-            os.execv(sys.executable, ['python'] + sys.argv)
+        self.tasks.submit(None, work, on_success=done,
+                          busy=self.backup_action_buttons)
+
+    def reload_after_restore(self):
+        """Recarrega os dados exibidos após a troca do banco de dados"""
+        if hasattr(self, "emp_listbox"):
+            self.refresh_employees()
         else:
-            log_action(get_current_user(), "Falha ao restaurar backup", "backup",
-                    detalhes=f"Arquivo: {backup_filename}, Erro: {msg}", status='falha')
-            messagebox.showerror("✗ Erro", msg)
+            self.refresh_employee_comboboxes()
+        if hasattr(self, "logs_tree"):
+            self.load_logs()
+        if hasattr(self, "tree"):
+            self.timesheet_table.clear()
+            self.summary_label.configure(text="")
+        if hasattr(self, "adjust_events_tree"):
+            self.adjust_events_tree.delete(*self.adjust_events_tree.get_children())
+        if getattr(self, "presence_board", None):
+            self.load_presence()
+        self.refresh_backup_info()
 
     def init_adjust_ponto_tab(self):
         """Inicializa a aba de ajuste administrativo de ponto"""
@@ -509,6 +554,7 @@ class PontoFlowApp(ctk.CTk):
             button_color=COLORS['primary']
         )
         self.adjust_emp_combo.pack(side="left", padx=5)
+        self.attach_employee_search(self.adjust_emp_combo)
         
         # Data
         ctk.CTkLabel(add_frame, text="Data (AAAA-MM-DD):", font=ctk.CTkFont(size=11, weight="bold")).pack(side="left", padx=(20, 5))
@@ -587,7 +633,7 @@ class PontoFlowApp(ctk.CTk):
         self.adjust_justif_text.pack(fill="both", padx=20, pady=5)
         
         # Botão
-        ctk.CTkButton(
+        self.adjust_button = ctk.CTkButton(
             add_card,
             text="✓ Adicionar/Editar Evento",
             command=self.do_adjust_event,
@@ -596,7 +642,8 @@ class PontoFlowApp(ctk.CTk):
             font=ctk.CTkFont(size=13, weight="bold"),
             fg_color=COLORS['success'],
             hover_color='#45A049'
-        ).pack(pady=15)
+        )
+        self.adjust_button.pack(pady=15)
         
         # ===== CARD 2: Eventos do Dia =====
         events_card = self.create_card(tab, "📅 Eventos do Dia")
@@ -654,16 +701,24 @@ class PontoFlowApp(ctk.CTk):
             messagebox.showerror("Erro", "Selecione um funcionário")
             return
         
+        employee = self.selected_employee(self.adjust_emp_var)
+        if employee is None:
+            messagebox.showerror("Erro", "Funcionário inválido")
+            return
+        emp_id = employee['id']
+        
         try:
-            emp_id = int(emp_str.split(' - ')[0])
             date_obj = datetime.date.fromisoformat(date_str)
-        except (ValueError, IndexError):
+        except ValueError:
             messagebox.showerror("Erro", "Data inválida. Use AAAA-MM-DD")
             return
         
         from core_db import get_employee_events
-        events = get_employee_events(emp_id, date_obj)
-        
+        self.tasks.submit('daily_events', get_employee_events, emp_id, date_obj,
+                          on_success=self.show_daily_events)
+
+    def show_daily_events(self, events):
+        """Exibe os eventos do dia carregados"""
         self.adjust_events_tree.delete(*self.adjust_events_tree.get_children())
         
         if not events:
@@ -678,7 +733,6 @@ class PontoFlowApp(ctk.CTk):
                 ts_formatted,
                 "🗑️ Remover"
             ])
-
     def on_event_double_click(self, event):
         """Manipula clique duplo em um evento"""
         item = self.adjust_events_tree.selection()[0]
@@ -717,8 +771,13 @@ class PontoFlowApp(ctk.CTk):
             messagebox.showerror("Erro", "Justificativa deve ter no mínimo 10 caracteres")
             return
         
+        employee = self.selected_employee(self.adjust_emp_var)
+        if employee is None:
+            messagebox.showerror("Erro", "Funcionário inválido")
+            return
+        emp_id = employee['id']
+        
         try:
-            emp_id = int(emp_str.split(' - ')[0])
             date_obj = datetime.date.fromisoformat(date_str)
             h, m = map(int, time_str.split(':'))
             timestamp = datetime.datetime.combine(date_obj, datetime.time(h, m))
@@ -727,15 +786,19 @@ class PontoFlowApp(ctk.CTk):
             return
         
         from core_db import adjust_event
-        success, msg = adjust_event(emp_id, event_type, timestamp, justificativa)
         
-        if success:
-            messagebox.showinfo("✓ Sucesso", msg)
-            self.adjust_justif_text.delete("1.0", "end")
-            self.adjust_time_var.set("09:00")
-            self.load_daily_events()
-        else:
-            messagebox.showerror("✗ Erro", msg)
+        def done(result):
+            success, msg = result
+            if success:
+                messagebox.showinfo("✓ Sucesso", msg)
+                self.adjust_justif_text.delete("1.0", "end")
+                self.adjust_time_var.set("09:00")
+                self.load_daily_events()
+            else:
+                messagebox.showerror("✗ Erro", msg)
+        
+        self.tasks.submit(None, adjust_event, emp_id, event_type, timestamp,
+                          justificativa, on_success=done, busy=[self.adjust_button])
 
     def remove_event_action(self):
         """Remove um evento selecionado"""
@@ -751,13 +814,11 @@ class PontoFlowApp(ctk.CTk):
         event_type = values[1]
         event_hour = values[2]
         
-        emp_str = self.adjust_emp_var.get()
-        
-        try:
-            emp_id = int(emp_str.split(' - ')[0])
-        except (ValueError, IndexError):
-            messagebox.showerror("Erro", "Dados inválidos")
+        employee = self.selected_employee(self.adjust_emp_var)
+        if employee is None:
+            messagebox.showerror("Erro", "Funcionário inválido")
             return
+        emp_id = employee['id']
         
         # Diálogo para justificativa
         justify_window = ctk.CTkToplevel(self)
@@ -793,26 +854,31 @@ class PontoFlowApp(ctk.CTk):
                 return
             
             from core_db import remove_event
-            success, msg = remove_event(int(event_id), emp_id, justificativa)
             
-            if success:
-                messagebox.showinfo("✓ Sucesso", msg)
-                justify_window.destroy()
-                self.load_daily_events()
-            else:
-                messagebox.showerror("✗ Erro", msg)
+            def done(result):
+                success, msg = result
+                if success:
+                    messagebox.showinfo("✓ Sucesso", msg)
+                    justify_window.destroy()
+                    self.load_daily_events()
+                else:
+                    messagebox.showerror("✗ Erro", msg)
+            
+            self.tasks.submit(None, remove_event, int(event_id), emp_id, justificativa,
+                              on_success=done, busy=[remove_button])
         
         button_frame = ctk.CTkFrame(justify_window, fg_color="transparent")
         button_frame.pack(pady=15)
         
-        ctk.CTkButton(
+        remove_button = ctk.CTkButton(
             button_frame,
             text="✓ Remover",
             command=do_remove,
             width=150,
             fg_color=COLORS['danger'],
             hover_color='#D32F2F'
-        ).pack(side="left", padx=5)
+        )
+        remove_button.pack(side="left", padx=5)
         
         ctk.CTkButton(
             button_frame,
@@ -851,6 +917,232 @@ class PontoFlowApp(ctk.CTk):
             font=ctk.CTkFont(size=12),
             text_color="white"
         ).pack(side="right", padx=20)
+        
+        # Indicador de operações em andamento
+        self.busy_label = ctk.CTkLabel(
+            header,
+            text="",
+            font=ctk.CTkFont(size=12, weight="bold"),
+            text_color="white"
+        )
+        self.busy_label.pack(side="right", padx=10)
+        
+        # Fila de exportações
+        self.exports_button = ctk.CTkButton(
+            header,
+            text="📄 Exportações",
+            command=self.open_exports_window,
+            width=130,
+            height=32,
+            fg_color=COLORS['secondary'],
+            hover_color=COLORS['accent']
+        )
+        self.exports_button.pack(side="right", padx=10)
+
+    def on_tab_selected(self):
+        """Constrói a aba selecionada na primeira vez que é aberta"""
+        self.ensure_tab(self.tabview.get())
+
+    def ensure_tab(self, name):
+        """
+        Constrói o conteúdo da aba se ainda não foi construído
+        Abas já construídas mantêm seus widgets e estado entre as trocas
+        """
+        if name in self.built_tabs or name not in self.tab_factories:
+            return
+        self.built_tabs.add(name)
+        self.tab_factories[name]()
+
+    def on_busy_change(self, count):
+        """Atualiza o indicador de atividade do cabeçalho"""
+        if count:
+            self.busy_label.configure(text=f"⏳ Processando ({count})...")
+            self.configure(cursor="watch")
+        else:
+            self.busy_label.configure(text="")
+            self.configure(cursor="")
+
+    def on_task_error(self, task, error):
+        """Tratador padrão de falhas em tarefas de segundo plano"""
+        messagebox.showerror("✗ Erro", f"Erro ao executar operação:\n{str(error)}")
+
+    def on_close(self):
+        """Encerra as tarefas de segundo plano e fecha a janela"""
+        active = [job for job in self.exports.history if job.active]
+        if active and not messagebox.askyesno(
+                "Exportações em andamento",
+                f"{len(active)} exportação(ões) ainda não concluída(s).\nCancelar e sair?"):
+            return
+        self.exports.cancel_all()
+        if self.export_poll_job:
+            self.after_cancel(self.export_poll_job)
+        self.tasks.shutdown()
+        self.destroy()
+
+    # ============ EXPORTAÇÕES ============
+    def submit_export(self, kind, title, filename, **params):
+        """Enfileira uma exportação de PDF e mostra a janela de acompanhamento"""
+        try:
+            self.exports.submit(kind, title, filename, **params)
+        except (OSError, ValueError) as e:
+            messagebox.showerror("✗ Erro", f"Erro ao iniciar exportação:\n{str(e)}")
+            return
+        self.open_exports_window()
+        if self.export_poll_job is None:
+            self.poll_exports()
+
+    def poll_exports(self):
+        """Lê o progresso enquanto houver exportação em andamento"""
+        self.export_poll_job = None
+        self.exports.poll()
+        if any(job.active for job in self.exports.history):
+            self.export_poll_job = self.after(EXPORT_POLL_MS, self.poll_exports)
+
+    def on_export_change(self, job):
+        """Atualiza o cabeçalho e a janela de exportações"""
+        active = sum(1 for j in self.exports.history if j.active)
+        self.exports_button.configure(text=f"📄 Exportações ({active})" if active else "📄 Exportações")
+        if self.export_window is not None and job.id in self.export_rows:
+            self.update_export_row(job)
+        elif self.export_window is not None:
+            self.add_export_row(job)
+
+    def open_exports_window(self):
+        """Janela não modal com a fila e o histórico de exportações"""
+        if self.export_window is not None:
+            self.export_window.deiconify()
+            self.export_window.lift()
+            return
+
+        window = ctk.CTkToplevel(self)
+        window.title("Marc - Exportações")
+        window.geometry("720x460")
+        window.configure(fg_color=COLORS['background'])
+        window.protocol("WM_DELETE_WINDOW", self.close_exports_window)
+        self.export_window = window
+
+        top = ctk.CTkFrame(window, fg_color="transparent")
+        top.pack(fill="x", padx=15, pady=(15, 5))
+
+        self.export_dir_label = ctk.CTkLabel(
+            top,
+            text="",
+            font=ctk.CTkFont(size=12),
+            text_color=COLORS['text_light'],
+            anchor="w"
+        )
+        self.export_dir_label.pack(side="left", fill="x", expand=True)
+
+        ctk.CTkButton(
+            top,
+            text="📂 Abrir pasta",
+            command=self.open_export_folder,
+            width=120,
+            fg_color=COLORS['primary'],
+            hover_color=COLORS['secondary']
+        ).pack(side="right", padx=5)
+
+        ctk.CTkButton(
+            top,
+            text="⚙️ Alterar pasta",
+            command=self.change_export_dir,
+            width=120,
+            fg_color=COLORS['text_light'],
+            hover_color='#5F6C7B'
+        ).pack(side="right", padx=5)
+
+        self.export_list = ctk.CTkScrollableFrame(window, fg_color=COLORS['card'])
+        self.export_list.pack(fill="both", expand=True, padx=15, pady=(5, 15))
+
+        self.export_rows = {}
+        self.update_export_dir_label()
+        # Mais recentes primeiro
+        for job in reversed(self.exports.history):
+            self.add_export_row(job, recent_first=False)
+
+    def close_exports_window(self):
+        """Fecha a janela; as exportações continuam em segundo plano"""
+        self.export_window.destroy()
+        self.export_window = None
+        self.export_rows = {}
+
+    def add_export_row(self, job, recent_first=True):
+        """Linha da exportação: título, situação, progresso e cancelamento"""
+        rows = self.export_list.pack_slaves()
+        row = ctk.CTkFrame(self.export_list, fg_color="transparent")
+        if recent_first and rows:
+            row.pack(fill="x", pady=4, before=rows[0])
+        else:
+            row.pack(fill="x", pady=4)
+
+        ctk.CTkLabel(
+            row,
+            text=job.title,
+            font=ctk.CTkFont(size=12, weight="bold"),
+            text_color=COLORS['text'],
+            anchor="w"
+        ).grid(row=0, column=0, sticky="w")
+
+        status = ctk.CTkLabel(row, text="", font=ctk.CTkFont(size=11),
+                              text_color=COLORS['text_light'], anchor="w")
+        status.grid(row=1, column=0, sticky="w")
+
+        bar = ctk.CTkProgressBar(row, width=200, progress_color=COLORS['primary'])
+        bar.grid(row=0, column=1, rowspan=2, padx=10)
+
+        action = ctk.CTkButton(row, text="", width=90)
+        action.grid(row=0, column=2, rowspan=2)
+
+        row.grid_columnconfigure(0, weight=1)
+        self.export_rows[job.id] = (status, bar, action)
+        self.update_export_row(job)
+
+    def update_export_row(self, job):
+        status, bar, action = self.export_rows[job.id]
+        text = f"{job.status.capitalize()} · {job.created.strftime('%H:%M:%S')}"
+        if job.message:
+            text += f" · {job.message}"
+        status.configure(text=text)
+        bar.set(job.progress)
+
+        if job.active:
+            action.configure(text="✗ Cancelar", fg_color=COLORS['danger'], hover_color='#D32F2F',
+                             command=lambda: self.exports.cancel(job))
+        elif job.status == STATUS_DONE:
+            bar.configure(progress_color=COLORS['success'])
+            action.configure(text="📄 Abrir", fg_color=COLORS['success'], hover_color='#388E3C',
+                             command=lambda: self.open_export_file(job.path))
+        else:
+            bar.configure(progress_color=COLORS['danger'])
+            action.configure(text="-", state="disabled", fg_color=COLORS['text_light'])
+
+    def update_export_dir_label(self):
+        self.export_dir_label.configure(text=f"📁 {os.path.abspath(self.exports.output_dir)}")
+
+    def change_export_dir(self):
+        """Escolhe a pasta onde os próximos PDFs serão gravados"""
+        from tkinter import filedialog
+        path = filedialog.askdirectory(parent=self.export_window,
+                                       initialdir=os.path.abspath(self.exports.output_dir))
+        if path:
+            self.exports.set_output_dir(path)
+            self.update_export_dir_label()
+
+    def open_export_folder(self):
+        try:
+            os.makedirs(self.exports.output_dir, exist_ok=True)
+            open_path(os.path.abspath(self.exports.output_dir))
+        except OSError as e:
+            messagebox.showerror("✗ Erro", f"Erro ao abrir pasta:\n{str(e)}")
+
+    def open_export_file(self, path):
+        if not os.path.exists(path):
+            messagebox.showerror("✗ Erro", f"Arquivo não encontrado:\n{path}")
+            return
+        try:
+            open_path(path)
+        except OSError as e:
+            messagebox.showerror("✗ Erro", f"Erro ao abrir arquivo:\n{str(e)}")
 
     def create_card(self, parent, title=None):
         """Cria um card estilizado"""
@@ -904,6 +1196,7 @@ class PontoFlowApp(ctk.CTk):
             font=ctk.CTkFont(size=13)
         )
         self.event_emp_combobox.pack(pady=5, padx=20)
+        self.attach_employee_search(self.event_emp_combobox)
         
         # Seleção de tipo de evento
         ctk.CTkLabel(
@@ -938,7 +1231,7 @@ class PontoFlowApp(ctk.CTk):
             ).pack(anchor="w", pady=5, padx=30)
         
         # Botão de registro
-        ctk.CTkButton(
+        self.record_button = ctk.CTkButton(
             card,
             text="✓ Registrar Evento",
             command=self.record_event,
@@ -948,29 +1241,99 @@ class PontoFlowApp(ctk.CTk):
             fg_color=COLORS['success'],
             hover_color='#45A049',
             corner_radius=10
-        ).pack(pady=40)
+        )
+        self.record_button.pack(pady=(40, 10))
+        
+        # Modo quiosque: registro por crachá em tela cheia
+        ctk.CTkButton(
+            card,
+            text="🖥️ Modo Quiosque",
+            command=self.open_kiosk,
+            width=300,
+            height=40,
+            font=ctk.CTkFont(size=13, weight="bold"),
+            fg_color=COLORS['primary'],
+            hover_color=COLORS['secondary'],
+            corner_radius=10
+        ).pack(pady=10)
         
         self.refresh_employee_comboboxes()
 
+    def open_kiosk(self):
+        """Abre o modo quiosque (registro por crachá em tela cheia)"""
+        from kiosk import KioskWindow
+        
+        kiosk = getattr(self, "kiosk_window", None)
+        if kiosk is not None and kiosk.winfo_exists():
+            kiosk.focus_force()
+            return
+        self.kiosk_window = KioskWindow(self, self.tasks, COLORS)
+
     def refresh_employee_comboboxes(self):
         """Atualiza os comboboxes de funcionários"""
-        employees = list_employees()
-        emp_options = [f"{e['id']} - {e['name']}" for e in employees]
-        
-        if hasattr(self, "event_emp_combobox"):
-            self.event_emp_combobox.configure(values=emp_options)
-            if emp_options:
-                self.event_emp_combobox.set(emp_options[0])
-        
-        if hasattr(self, "ts_emp_combobox"):
-            self.ts_emp_combobox.configure(values=emp_options)
-            if emp_options:
-                self.ts_emp_combobox.set(emp_options[0])
-        
-        if hasattr(self, "dayoff_emp_combobox"):
-            self.dayoff_emp_combobox.configure(values=emp_options)
-            if emp_options:
-                self.dayoff_emp_combobox.set(emp_options[0])
+        self.tasks.submit('employees', list_employees, on_success=self.show_employee_options)
+
+    def show_employee_options(self, employees):
+        """Reconstrói o índice de busca e atualiza os seletores de funcionários"""
+        self.employee_index.rebuild(employees)
+        
+        # Apenas abas já construídas; a seleção atual é mantida se ainda for válida
+        for combobox in self.employee_comboboxes:
+            current = self.resolve_employee(combobox.get())
+            if current is None:
+                first = self.employee_index.search("", limit=1)
+                combobox.set(format_employee(first[0]) if first else "")
+            self.update_employee_matches(combobox, "")
+
+    def attach_employee_search(self, combobox):
+        """Transforma o combobox em seletor com busca por ID ou nome"""
+        self.employee_comboboxes.append(combobox)
+        combobox.bind("<KeyRelease>", lambda e: self.on_employee_search_key(combobox, e), add="+")
+        combobox.bind("<FocusOut>", lambda e: self.complete_employee(combobox), add="+")
+        combobox.bind("<Return>", lambda e: self.complete_employee(combobox), add="+")
+
+    def on_employee_search_key(self, combobox, event):
+        if event.keysym in ("Return", "KP_Enter", "Tab", "Up", "Down", "Escape"):
+            return
+        self.update_employee_matches(combobox, combobox.get())
+
+    def update_employee_matches(self, combobox, text):
+        """Mostra na lista apenas os EMPLOYEE_MATCHES melhores resultados"""
+        matches = self.employee_index.search(text, limit=EMPLOYEE_MATCHES)
+        combobox.configure(values=[format_employee(e) for e in matches])
+
+    def complete_employee(self, combobox):
+        """
+        Normaliza o texto para "id - nome": ID digitado que existe ou busca
+        com um único resultado
+        """
+        text = combobox.get()
+        employee = self.resolve_employee(text)
+        if employee is None:
+            matches = self.employee_index.search(text, limit=2)
+            employee = matches[0] if len(matches) == 1 else None
+        if employee is not None and text != format_employee(employee):
+            combobox.set(format_employee(employee))
+
+    def selected_employee(self, variable):
+        """
+        Funcionário escolhido no seletor ligado a variable (None se inválido);
+        o texto é normalizado para "id - nome"
+        """
+        employee = self.resolve_employee(variable.get())
+        if employee is not None:
+            variable.set(format_employee(employee))
+        return employee
+
+    def resolve_employee(self, text):
+        """Funcionário correspondente a "id - nome" ou a um ID digitado"""
+        emp_id = text.split(' - ')[0].strip()
+        if not emp_id.isdigit():
+            return None
+        employee = self.employee_index.get(int(emp_id))
+        if employee is None or (' - ' in text and text != format_employee(employee)):
+            return None
+        return employee
 
     def record_event(self):
         """Registra um evento de ponto"""
@@ -980,20 +1343,38 @@ class PontoFlowApp(ctk.CTk):
             messagebox.showerror("Erro", "Selecione um funcionário")
             return
         
-        try:
-            emp_id = int(emp_str.split(' - ')[0])
-            emp_name = emp_str.split(' - ')[1]
-        except (ValueError, IndexError):
+        employee = self.selected_employee(self.event_emp_var)
+        if employee is None:
             messagebox.showerror("Erro", "Funcionário inválido")
             return
+        emp_id, emp_name = employee['id'], employee['name']
         
         event_type = self.event_type_var.get()
-        ok, msg = record_event(emp_id, event_type)
+        # Horário da marcação é o do clique, não o da gravação
+        timestamp = datetime.datetime.now()
         
-        if ok:
-            messagebox.showinfo("✓ Sucesso", msg)
-        else:
-            messagebox.showerror("✗ Erro", msg)
+        def done(result):
+            ok, msg = result
+            if ok:
+                messagebox.showinfo("✓ Sucesso", msg)
+            else:
+                messagebox.showerror("✗ Erro", msg)
+        
+        def failed(error):
+            if not is_transient_error(error):
+                messagebox.showerror("✗ Erro", f"Erro no banco de dados: {error}")
+                return
+            # Banco ocupado: guardar no spool com o horário do clique
+            get_punch_spool().submit(emp_id, event_type, timestamp)
+            messagebox.showwarning(
+                "⏳ Registro guardado",
+                f"Banco de dados indisponível no momento.\n"
+                f"O registro de {emp_name} às {timestamp.strftime('%H:%M')} foi guardado "
+                f"e será gravado automaticamente."
+            )
+        
+        self.tasks.submit(None, record_event, emp_id, event_type, timestamp, raise_errors=True,
+                          on_success=done, on_error=failed, busy=[self.record_button])
 
     # ============ FOLHA DE PONTO ============
     def init_folha_tab(self):
@@ -1019,6 +1400,7 @@ class PontoFlowApp(ctk.CTk):
             button_color=COLORS['primary']
         )
         self.ts_emp_combobox.pack(side="left", padx=5)
+        self.attach_employee_search(self.ts_emp_combobox)
         
         # Mês
         ctk.CTkLabel(frame_controls, text="Mês:", font=ctk.CTkFont(size=12, weight="bold")).pack(side="left", padx=(20, 5))
@@ -1097,6 +1479,9 @@ class PontoFlowApp(ctk.CTk):
         self.tree.pack(side="left", fill="both", expand=True, padx=5, pady=5)
         scrollbar.pack(side="right", fill="y")
         
+        # Linhas atualizadas no lugar, com tags de estilo fixas
+        self.timesheet_table = TimesheetTable(self.tree)
+        
         # Estilo da Treeview
         style = ttk.Style()
         style.theme_use('clam')
@@ -1122,16 +1507,29 @@ class PontoFlowApp(ctk.CTk):
             messagebox.showerror("Erro", "Selecione um funcionário")
             return
         
+        employee = self.selected_employee(self.ts_emp_var)
+        if employee is None:
+            messagebox.showerror("Erro", "Funcionário inválido")
+            return
+        emp_id = employee['id']
+        
         try:
-            emp_id = int(emp_str.split(' - ')[0])
             month = int(self.ts_month_var.get())
             year = int(self.ts_year_var.get())
-        except (ValueError, IndexError):
+        except ValueError:
             messagebox.showerror("Erro", "Dados inválidos")
             return
         
-        days = get_timesheet(emp_id, year, month)
-        summary = get_monthly_summary(emp_id, year, month)
+        def work():
+            days = get_timesheet(emp_id, year, month)
+            return days, summarize_timesheet(days)
+        
+        # Trocar de funcionário/mês cancela a consulta anterior ainda em andamento
+        self.tasks.submit('timesheet', work, on_success=self.show_timesheet)
+
+    def show_timesheet(self, result):
+        """Exibe a folha de ponto carregada"""
+        days, summary = result
         
         self.summary_label.configure(
             text=f"⏱️ Total: {summary['total_hours_formatted']} | "
@@ -1140,43 +1538,10 @@ class PontoFlowApp(ctk.CTk):
                  f"🏖️ Folgas: {summary['days_off']}"
         )
         
-        self.tree.delete(*self.tree.get_children())
-        
-        for day in days:
-            flags = []
-            bg = "white"
-            
-            if day['holiday']:
-                flags.append("🎉 FERIADO")
-                bg = "#FFEBEE"
-            if day['off']:
-                flags.append("🏖️ FOLGA")
-                bg = "#E3F2FD"
-            
-            flag_str = ", ".join(flags) if flags else "-"
-            
-            ev_map = {k: '-' for k in EVENT_TYPES}
-            for e in day['events']:
-                ev_map[e['type']] = e['ts'].strftime('%H:%M')
-            
-            total = format_timedelta(compute_work_duration(day)) or '-'
-            
-            item = self.tree.insert("", "end", values=[
-                day['date'].strftime('%d/%m/%Y'),
-                ev_map['entrada'],
-                ev_map['inicio_descanso'],
-                ev_map['fim_descanso'],
-                ev_map['saida'],
-                total,
-                flag_str
-            ])
-            
-            if bg != "white":
-                self.tree.tag_configure(f'bg_{item}', background=bg)
-                self.tree.item(item, tags=(f'bg_{item}',))
+        self.timesheet_table.update(days)
 
     def export_pdf(self):
-        """Exporta folha de ponto para PDF"""
+        """Exporta folha de ponto para PDF (gerada em segundo plano)"""
         emp_str = self.ts_emp_var.get()
         
         if not emp_str:
@@ -1184,101 +1549,24 @@ class PontoFlowApp(ctk.CTk):
             return
         
         try:
-            emp_id = int(emp_str.split(' - ')[0])
             month = int(self.ts_month_var.get())
             year = int(self.ts_year_var.get())
-        except (ValueError, IndexError):
+        except ValueError:
             messagebox.showerror("Erro", "Dados inválidos")
             return
         
-        employee = get_employee_by_id(emp_id)
+        employee = self.selected_employee(self.ts_emp_var)
         if not employee:
             messagebox.showerror("Erro", "Funcionário não encontrado")
             return
         
-        emp_name = employee['name']
-        days = get_timesheet(emp_id, year, month)
-        summary = get_monthly_summary(emp_id, year, month)
-        
-        filename = f"PontoFlow_{emp_name.replace(' ', '_')}_{month:02d}_{year}.pdf"
-        
-        try:
-            c = canvas.Canvas(filename, pagesize=A4)
-            
-            # Cabeçalho
-            c.setFillColorRGB(0.13, 0.59, 0.95)
-            c.rect(0, 800, 600, 42, fill=True, stroke=False)
-            
-            c.setFillColorRGB(1, 1, 1)
-            c.setFont("Helvetica-Bold", 18)
-            c.drawString(50, 815, "⚡ Marc - Folha de Ponto")
-            
-            y = 770
-            c.setFillColorRGB(0, 0, 0)
-            c.setFont("Helvetica-Bold", 12)
-            c.drawString(50, y, f"Funcionário: {emp_name}")
-            y -= 20
-            c.setFont("Helvetica", 10)
-            c.drawString(50, y, f"{calendar.month_name[month]} de {year}")
-            y -= 30
-            
-            # Resumo
-            c.setFont("Helvetica-Bold", 10)
-            c.drawString(50, y, "Resumo Mensal:")
-            y -= 15
-            c.setFont("Helvetica", 9)
-            c.drawString(50, y, f"Total trabalhado: {summary['total_hours_formatted']}")
-            y -= 12
-            c.drawString(50, y, f"Dias: {summary['worked_days']} | Feriados: {summary['holidays']} | Folgas: {summary['days_off']}")
-            y -= 25
-            
-            # Tabela
-            c.setFont("Helvetica-Bold", 8)
-            c.drawString(50, y, "Data")
-            c.drawString(110, y, "Entrada")
-            c.drawString(170, y, "In.Desc")
-            c.drawString(220, y, "Fim Desc")
-            c.drawString(280, y, "Saída")
-            c.drawString(340, y, "Total")
-            c.drawString(400, y, "Status")
-            y -= 15
-            
-            c.setFont("Helvetica", 7)
-            
-            for day in days:
-                if y < 50:
-                    c.showPage()
-                    c.setFont("Helvetica", 7)
-                    y = 800
-                
-                flags = []
-                if day['holiday']:
-                    flags.append("FERIADO")
-                if day['off']:
-                    flags.append("FOLGA")
-                flag_str = ", ".join(flags) if flags else "-"
-                
-                ev_map = {k: '-' for k in EVENT_TYPES}
-                for e in day['events']:
-                    ev_map[e['type']] = e['ts'].strftime('%H:%M')
-                
-                total = format_timedelta(compute_work_duration(day)) or '-'
-                
-                c.drawString(50, y, day['date'].strftime('%d/%m/%Y'))
-                c.drawString(110, y, ev_map['entrada'])
-                c.drawString(170, y, ev_map['inicio_descanso'])
-                c.drawString(220, y, ev_map['fim_descanso'])
-                c.drawString(280, y, ev_map['saida'])
-                c.drawString(340, y, total)
-                c.drawString(400, y, flag_str)
-                
-                y -= 12
-            
-            c.save()
-            messagebox.showinfo("✓ Sucesso", f"PDF gerado: {filename}")
-            
-        except Exception as e:
-            messagebox.showerror("✗ Erro", f"Erro ao gerar PDF: {str(e)}")
+        filename = f"PontoFlow_{employee['name'].replace(' ', '_')}_{month:02d}_{year}.pdf"
+        self.submit_export(
+            'timesheet',
+            f"Folha de ponto - {employee['name']} ({month:02d}/{year})",
+            filename,
+            emp_id=employee['id'], year=year, month=month
+        )
 
     # ============ FUNCIONÁRIOS (ADMIN) ============
     def init_funcionarios_tab(self):
@@ -1308,7 +1596,7 @@ class PontoFlowApp(ctk.CTk):
         self.name_entry.pack(side="left", padx=5)
         self.name_entry.bind("<Return>", lambda e: self.add_employee())
         
-        ctk.CTkButton(
+        self.add_employee_button = ctk.CTkButton(
             add_frame,
             text="✓ Adicionar",
             command=self.add_employee,
@@ -1316,7 +1604,8 @@ class PontoFlowApp(ctk.CTk):
             height=35,
             fg_color=COLORS['success'],
             hover_color='#45A049'
-        ).pack(side="left", padx=5)
+        )
+        self.add_employee_button.pack(side="left", padx=5)
         
         # Card de remoção
         remove_card = self.create_card(tab, "🗑️ Remover Funcionário")
@@ -1341,7 +1630,7 @@ class PontoFlowApp(ctk.CTk):
         self.remove_entry.pack(side="left", padx=5)
         self.remove_entry.bind("<Return>", lambda e: self.remove_employee())
         
-        ctk.CTkButton(
+        self.remove_employee_button = ctk.CTkButton(
             remove_frame,
             text="✗ Remover",
             command=self.remove_employee,
@@ -1349,7 +1638,8 @@ class PontoFlowApp(ctk.CTk):
             height=35,
             fg_color=COLORS['danger'],
             hover_color='#D32F2F'
-        ).pack(side="left", padx=5)
+        )
+        self.remove_employee_button.pack(side="left", padx=5)
         
         # Card de lista
         list_card = self.create_card(tab, "📋 Funcionários Cadastrados")
@@ -1368,8 +1658,11 @@ class PontoFlowApp(ctk.CTk):
 
     def refresh_employees(self):
         """Atualiza a lista de funcionários"""
+        self.tasks.submit('employees_list', list_employees, on_success=self.show_employees)
+
+    def show_employees(self, employees):
+        """Exibe a lista de funcionários carregada"""
         self.emp_listbox.delete("0.0", "end")
-        employees = list_employees()
         
         if not employees:
             self.emp_listbox.insert("end", "📭 Nenhum funcionário cadastrado.\n")
@@ -1379,8 +1672,7 @@ class PontoFlowApp(ctk.CTk):
             for e in employees:
                 self.emp_listbox.insert("end", f"{e['id']:<10} {e['name']:<30}\n")
         
-        self.refresh_employee_comboboxes()
-
+        self.show_employee_options(employees)
     def add_employee(self):
         """Adiciona um funcionário"""
         name = self.name_entry.get().strip()
@@ -1389,14 +1681,16 @@ class PontoFlowApp(ctk.CTk):
             messagebox.showerror("Erro", "Digite o nome do funcionário")
             return
         
-        emp_id, msg = add_employee(name)
+        def done(result):
+            emp_id, msg = result
+            if emp_id:
+                messagebox.showinfo("✓ Sucesso", f"{msg} (ID: {emp_id})")
+                self.name_entry.delete(0, "end")
+                self.refresh_employees()
+            else:
+                messagebox.showerror("✗ Erro", msg)
         
-        if emp_id:
-            messagebox.showinfo("✓ Sucesso", f"{msg} (ID: {emp_id})")
-            self.name_entry.delete(0, "end")
-            self.refresh_employees()
-        else:
-            messagebox.showerror("✗ Erro", msg)
+        self.tasks.submit(None, add_employee, name, on_success=done, busy=[self.add_employee_button])
 
     def remove_employee(self):
         """Remove um funcionário"""
@@ -1406,7 +1700,11 @@ class PontoFlowApp(ctk.CTk):
             messagebox.showerror("Erro", "Digite um ID válido")
             return
         
-        employee = get_employee_by_id(emp_id)
+        self.tasks.submit('remove_employee_lookup', get_employee_by_id, emp_id,
+                          on_success=lambda employee: self.confirm_remove_employee(emp_id, employee))
+
+    def confirm_remove_employee(self, emp_id, employee):
+        """Confirma e executa a remoção do funcionário encontrado"""
         if not employee:
             messagebox.showerror("Erro", "Funcionário não encontrado")
             return
@@ -1420,15 +1718,17 @@ class PontoFlowApp(ctk.CTk):
         if not confirm:
             return
         
-        success, msg = remove_employee(emp_id)
+        def done(result):
+            success, msg = result
+            if success:
+                messagebox.showinfo("✓ Sucesso", msg)
+                self.remove_entry.delete(0, "end")
+                self.refresh_employees()
+            else:
+                messagebox.showerror("✗ Erro", msg)
         
-        if success:
-            messagebox.showinfo("✓ Sucesso", msg)
-            self.remove_entry.delete(0, "end")
-            self.refresh_employees()
-        else:
-            messagebox.showerror("✗ Erro", msg)
-
+        self.tasks.submit(None, remove_employee, emp_id, on_success=done,
+                          busy=[self.remove_employee_button])
     # ============ FOLGAS (ADMIN) ============
     def init_day_off_tab(self):
         """Inicializa a aba de gerenciamento de folgas"""
@@ -1456,6 +1756,7 @@ class PontoFlowApp(ctk.CTk):
             button_color=COLORS['primary']
         )
         self.dayoff_emp_combobox.pack(pady=5, padx=20)
+        self.attach_employee_search(self.dayoff_emp_combobox)
         
         # Data
         ctk.CTkLabel(
@@ -1476,7 +1777,7 @@ class PontoFlowApp(ctk.CTk):
         self.dayoff_date_entry.bind("<Return>", lambda e: self.add_day_off())
         
         # Botão
-        ctk.CTkButton(
+        self.dayoff_button = ctk.CTkButton(
             card,
             text="✓ Adicionar Folga",
             command=self.add_day_off,
@@ -1485,7 +1786,8 @@ class PontoFlowApp(ctk.CTk):
             font=ctk.CTkFont(size=14, weight="bold"),
             fg_color=COLORS['primary'],
             hover_color=COLORS['secondary']
-        ).pack(pady=40)
+        )
+        self.dayoff_button.pack(pady=40)
         
         # Info
         info_frame = ctk.CTkFrame(card, fg_color=COLORS['background'], corner_radius=10)
@@ -1519,19 +1821,172 @@ class PontoFlowApp(ctk.CTk):
             messagebox.showerror("Erro", "Data inválida. Use AAAA-MM-DD")
             return
         
-        try:
-            emp_id = int(emp_str.split(' - ')[0])
-        except (ValueError, IndexError):
+        employee = self.selected_employee(self.dayoff_emp_var)
+        if employee is None:
             messagebox.showerror("Erro", "Funcionário inválido")
             return
+        emp_id = employee['id']
         
-        success, msg = set_day_off(emp_id, date_obj)
+        def done(result):
+            success, msg = result
+            if success:
+                messagebox.showinfo("✓ Sucesso", msg)
+                self.dayoff_date_entry.delete(0, "end")
+            else:
+                messagebox.showerror("✗ Erro", msg)
+        
+        self.tasks.submit(None, set_day_off, emp_id, date_obj, on_success=done, busy=[self.dayoff_button])
+
+    # ============ PRESENÇA (ADMIN) ============
+    def init_presence_tab(self):
+        """Inicializa o quadro de presença (quem está trabalhando agora)"""
+        tab = self.tabview.tab("🟢 Presença")
+        
+        self.presence_board = None
+        self.presence_version = None
+        self.presence_rows = {}  # iid -> valores exibidos
+        
+        # Contadores
+        counts_frame = ctk.CTkFrame(tab, fg_color="transparent")
+        counts_frame.pack(fill="x", pady=(15, 5), padx=10)
+        
+        self.presence_count_labels = {}
+        for state, color in ((STATE_WORKING, COLORS['success']), (STATE_BREAK, COLORS['warning']),
+                             (STATE_OUT, COLORS['text_light'])):
+            card = ctk.CTkFrame(counts_frame, fg_color=color, corner_radius=10)
+            card.pack(side="left", expand=True, fill="x", padx=5)
+            label = ctk.CTkLabel(card, text="-", font=ctk.CTkFont(size=15, weight="bold"),
+                                 text_color="white")
+            label.pack(pady=10)
+            self.presence_count_labels[state] = label
+        
+        # Filtros
+        filter_card = self.create_card(tab)
+        filter_card.pack(fill="x", pady=5, padx=10)
+        
+        filter_frame = ctk.CTkFrame(filter_card, fg_color="transparent")
+        filter_frame.pack(fill="x", pady=10, padx=15)
+        
+        ctk.CTkLabel(filter_frame, text="Situação:", font=ctk.CTkFont(size=11, weight="bold")).pack(side="left", padx=5)
+        self.presence_state_var = ctk.StringVar(value="Todos")
+        ctk.CTkSegmentedButton(
+            filter_frame,
+            values=["Todos"] + [PRESENCE_LABELS[state] for state in STATES],
+            variable=self.presence_state_var,
+            command=lambda value: self.refresh_presence(force=True)
+        ).pack(side="left", padx=5)
+        
+        ctk.CTkLabel(filter_frame, text="Buscar:", font=ctk.CTkFont(size=11, weight="bold")).pack(side="left", padx=(20, 5))
+        self.presence_search_entry = ctk.CTkEntry(
+            filter_frame,
+            placeholder_text="Nome ou ID",
+            width=180,
+            border_color=COLORS['primary']
+        )
+        self.presence_search_entry.pack(side="left", padx=5)
+        self.presence_search_entry.bind("<KeyRelease>", lambda e: self.refresh_presence(force=True))
         
-        if success:
-            messagebox.showinfo("✓ Sucesso", msg)
-            self.dayoff_date_entry.delete(0, "end")
+        ctk.CTkButton(
+            filter_frame,
+            text="🔄 Recarregar",
+            command=self.load_presence,
+            width=110,
+            fg_color=COLORS['accent'],
+            hover_color='#0097A7'
+        ).pack(side="right", padx=5)
+        
+        # Lista
+        tree_frame = ctk.CTkFrame(tab, fg_color=COLORS['card'])
+        tree_frame.pack(fill="both", expand=True, padx=10, pady=5)
+        
+        columns = ["ID", "Funcionário", "Situação", "Desde", "Último registro"]
+        self.presence_tree = ttk.Treeview(tree_frame, columns=columns, show="headings", height=18)
+        for col in columns:
+            self.presence_tree.heading(col, text=col)
+            self.presence_tree.column(col, width=250 if col == "Funcionário" else 120,
+                                      anchor="w" if col == "Funcionário" else "center")
+        
+        scrollbar = ttk.Scrollbar(tree_frame, orient="vertical", command=self.presence_tree.yview)
+        self.presence_tree.configure(yscrollcommand=scrollbar.set)
+        self.presence_tree.pack(side="left", fill="both", expand=True, padx=5, pady=5)
+        scrollbar.pack(side="right", fill="y")
+        
+        # Tags fixas por situação
+        self.presence_tree.tag_configure(STATE_WORKING, background="#E8F5E9")
+        self.presence_tree.tag_configure(STATE_BREAK, background="#FFF3E0")
+        
+        self.load_presence(reload=False)
+
+    def load_presence(self, reload=True):
+        """Carrega (ou recarrega) o quadro de presença a partir do banco"""
+        def work():
+            board = get_presence_board()
+            if reload:
+                board.load()
+            return board
+        
+        self.tasks.submit('presence_load', work, on_success=self.on_presence_loaded)
+
+    def on_presence_loaded(self, board):
+        first_load = self.presence_board is None
+        self.presence_board = board
+        self.refresh_presence(force=True)
+        if first_load:
+            self.after(PRESENCE_REFRESH_MS, self.presence_tick)
+
+    def presence_tick(self):
+        """
+        Atualização periódica: só redesenha se o quadro mudou; a cada
+        RECONCILE_INTERVAL_S o quadro é conferido com o banco em segundo plano
+        (registros de outros terminais)
+        """
+        if self.presence_board.date != datetime.date.today():
+            self.load_presence()
         else:
-            messagebox.showerror("✗ Erro", msg)
+            self.tasks.submit('presence_reconcile', self.presence_board.reconcile)
+            self.refresh_presence()
+        self.after(PRESENCE_REFRESH_MS, self.presence_tick)
+
+    def refresh_presence(self, force=False):
+        """Atualiza contadores e lista a partir do quadro em memória"""
+        board = self.presence_board
+        if board is None or (not force and board.version == self.presence_version):
+            return
+        self.presence_version = board.version
+        
+        counts = board.counts()
+        for state, label in self.presence_count_labels.items():
+            label.configure(text=f"{PRESENCE_LABELS[state]}: {counts[state]}")
+        
+        selected = self.presence_state_var.get()
+        state = next((s for s in STATES if PRESENCE_LABELS[s] == selected), None)
+        entries = board.snapshot(state=state, search=self.presence_search_entry.get())
+        
+        # Atualização no lugar: só linhas novas, removidas ou alteradas mudam
+        visible = []
+        for index, entry in enumerate(entries):
+            iid = str(entry['id'])
+            values = (
+                entry['id'],
+                entry['name'],
+                PRESENCE_LABELS[entry['state']],
+                entry['since'].strftime('%H:%M') if entry['since'] else '-',
+                entry['last_event'].replace('_', ' ') if entry['last_event'] else '-'
+            )
+            if iid not in self.presence_rows:
+                self.presence_tree.insert("", index, iid=iid, values=values, tags=(entry['state'],))
+            elif self.presence_rows[iid] != values:
+                self.presence_tree.item(iid, values=values, tags=(entry['state'],))
+            if self.presence_tree.index(iid) != index:
+                self.presence_tree.move(iid, "", index)
+            self.presence_rows[iid] = values
+            visible.append(iid)
+        
+        stale = set(self.presence_rows) - set(visible)
+        if stale:
+            self.presence_tree.delete(*stale)
+            for iid in stale:
+                del self.presence_rows[iid]
 
     # ============ FERIADOS (ADMIN) ============
     def init_feriados_tab(self):
@@ -1560,7 +2015,7 @@ class PontoFlowApp(ctk.CTk):
         self.holiday_date_entry.bind("<Return>", lambda e: self.add_holiday())
         
         # Botão
-        ctk.CTkButton(
+        self.holiday_button = ctk.CTkButton(
             card,
             text="✓ Adicionar Feriado",
             command=self.add_holiday,
@@ -1569,7 +2024,8 @@ class PontoFlowApp(ctk.CTk):
             font=ctk.CTkFont(size=14, weight="bold"),
             fg_color=COLORS['primary'],
             hover_color=COLORS['secondary']
-        ).pack(pady=40)
+        )
+        self.holiday_button.pack(pady=40)
         
         # Info
         info_frame = ctk.CTkFrame(card, fg_color=COLORS['background'], corner_radius=10)
@@ -1597,13 +2053,15 @@ class PontoFlowApp(ctk.CTk):
             messagebox.showerror("Erro", "Data inválida. Use AAAA-MM-DD")
             return
         
-        success, msg = add_holiday(date_obj)
+        def done(result):
+            success, msg = result
+            if success:
+                messagebox.showinfo("✓ Sucesso", msg)
+                self.holiday_date_entry.delete(0, "end")
+            else:
+                messagebox.showerror("✗ Erro", msg)
         
-        if success:
-            messagebox.showinfo("✓ Sucesso", msg)
-            self.holiday_date_entry.delete(0, "end")
-        else:
-            messagebox.showerror("✗ Erro", msg)
+        self.tasks.submit(None, add_holiday, date_obj, on_success=done, busy=[self.holiday_button])
 
     # ============ LOGS DE AUDITORIA (ADMIN) ============
     def init_logs_tab(self):
@@ -1641,6 +2099,17 @@ class PontoFlowApp(ctk.CTk):
         )
         self.logs_usuario_entry.pack(side="left", padx=5)
         
+        # Busca textual em ação e detalhes (índice FTS5, resultados por relevância)
+        ctk.CTkLabel(frame_controls, text="Busca:", font=ctk.CTkFont(size=11, weight="bold")).pack(side="left", padx=(20, 5))
+        self.logs_busca_entry = ctk.CTkEntry(
+            frame_controls,
+            placeholder_text='Ex: ajuste 42, "justificativa"',
+            width=200,
+            border_color=COLORS['primary']
+        )
+        self.logs_busca_entry.pack(side="left", padx=5)
+        self.logs_busca_entry.bind("<Return>", lambda e: self.load_logs())
+        
         # Botões
         ctk.CTkButton(
             frame_controls,
@@ -1660,14 +2129,15 @@ class PontoFlowApp(ctk.CTk):
             hover_color='#0097A7'
         ).pack(side="left", padx=5)
         
-        ctk.CTkButton(
+        self.clear_logs_button = ctk.CTkButton(
             frame_controls,
             text="🗑️ Limpar (>90 dias)",
             command=self.clear_old_logs_action,
             width=160,
             fg_color=COLORS['warning'],
             hover_color='#F57C00'
-        ).pack(side="left", padx=5)
+        )
+        self.clear_logs_button.pack(side="left", padx=5)
 
         ctk.CTkButton(
             frame_controls,
@@ -1690,15 +2160,34 @@ class PontoFlowApp(ctk.CTk):
         )
         self.logs_summary_label.pack(pady=10, padx=15)
         
-        # Treeview
+        # Lista virtual: páginas buscadas no banco conforme a rolagem
         tree_frame = ctk.CTkFrame(tab, fg_color=COLORS['card'])
         tree_frame.pack(fill="both", expand=True, padx=10, pady=5)
         
         columns = ["Timestamp", "Usuário", "Categoria", "Ação", "Status", "Detalhes"]
-        self.logs_tree = ttk.Treeview(tree_frame, columns=columns, show="headings", height=20)
+        self.logs_sort = None  # padrão: relevância na busca, senão mais recentes primeiro
+        self.logs_view = VirtualTreeview(
+            tree_frame, self.tasks, 'logs', columns,
+            fetch_page=get_logs_page,
+            fetch_count=count_logs,
+            format_row=lambda log: [
+                log['timestamp'][:19],  # Sem microsegundos
+                log['usuario'],
+                log['categoria'],
+                log['acao'][:40],  # Truncar se muito longo
+                log['status'].upper(),
+                (log.get('trecho') or log['detalhes'] or '-')[:50]  # na busca: trecho encontrado
+            ],
+            row_tags=lambda log: ('falha',) if log['status'] == 'falha' else (),
+            height=18,
+            on_sort=self.sort_logs,
+            row_id=lambda log: log['id'],
+            # Chave da ordenação atual (paginação por chave em get_logs_page)
+            row_key=lambda log, query: (log.get(query.get('sort_by')), log['id'])
+        )
+        self.logs_tree = self.logs_view.tree
         
         for col in columns:
-            self.logs_tree.heading(col, text=col)
             if col == "Timestamp":
                 self.logs_tree.column(col, width=140, anchor="center")
             elif col == "Usuário":
@@ -1710,11 +2199,10 @@ class PontoFlowApp(ctk.CTk):
             else:
                 self.logs_tree.column(col, width=150, anchor="w")
         
-        scrollbar = ttk.Scrollbar(tree_frame, orient="vertical", command=self.logs_tree.yview)
-        self.logs_tree.configure(yscrollcommand=scrollbar.set)
+        # Tag compartilhada por todas as linhas com falha
+        self.logs_tree.tag_configure('falha', background="#FFEBEE")
         
-        self.logs_tree.pack(side="left", fill="both", expand=True, padx=5, pady=5)
-        scrollbar.pack(side="right", fill="y")
+        self.logs_view.pack(fill="both", expand=True, padx=5, pady=5)
         
         # Estilo da Treeview
         style = ttk.Style()
@@ -1735,14 +2223,30 @@ class PontoFlowApp(ctk.CTk):
         self.load_logs()
 
     def load_logs(self):
-        """Carrega os logs de auditoria com filtros"""
-        categoria = self.logs_categoria_var.get() or None
-        usuario = self.logs_usuario_entry.get().strip() or None
-        
-        logs = get_logs(limit=500, categoria=categoria, usuario=usuario)
-        summary = get_logs_summary()
-        
-        # Atualizar resumo
+        """Carrega os logs de auditoria com filtros (filtro e ordenação no banco)"""
+        busca = self.logs_busca_entry.get().strip() or None
+        if self.logs_sort is None:
+            sort_by, descending = (SORT_RELEVANCE, True) if busca else ('timestamp', True)
+        else:
+            sort_by, descending = self.logs_sort
+        self.logs_view.set_query(
+            categoria=self.logs_categoria_var.get() or None,
+            usuario=self.logs_usuario_entry.get().strip() or None,
+            busca=busca,
+            sort_by=sort_by,
+            descending=descending
+        )
+        self.tasks.submit('logs_summary', get_logs_summary, on_success=self.show_logs_summary)
+
+    def sort_logs(self, column_index):
+        """Ordena pela coluna clicada; clicar de novo inverte a ordem"""
+        sort_by = LOG_SORT_COLUMNS[column_index]
+        current, descending = self.logs_sort or ('timestamp', True)
+        self.logs_sort = (sort_by, not descending if sort_by == current else sort_by == 'timestamp')
+        self.load_logs()
+
+    def show_logs_summary(self, summary):
+        """Exibe o resumo de logs por categoria"""
         summary_text = "Resumo: "
         if summary:
             parts = []
@@ -1753,48 +2257,34 @@ class PontoFlowApp(ctk.CTk):
         else:
             summary_text += "Sem registros"
         
+        query = self.logs_view.query
+        if query.get('sort_by') == SORT_RELEVANCE:
+            summary_text += f"  (busca \"{query['busca']}\", ordenado por relevância)"
+        else:
+            summary_text += f"  (ordenado por {query.get('sort_by')}, {'decrescente' if query.get('descending') else 'crescente'})"
         self.logs_summary_label.configure(text=summary_text)
-        
-        # Atualizar treeview
-        self.logs_tree.delete(*self.logs_tree.get_children())
-        
-        for log in logs:
-            bg = "white"
-            if log['status'] == 'falha':
-                bg = "#FFEBEE"
-            
-            item = self.logs_tree.insert("", "end", values=[
-                log['timestamp'][:19],  # Sem microsegundos
-                log['usuario'],
-                log['categoria'],
-                log['acao'][:40],  # Truncar se muito longo
-                log['status'].upper(),
-                log['detalhes'][:50] if log['detalhes'] else '-'
-            ])
-            
-            if bg != "white":
-                self.logs_tree.tag_configure(f'bg_{item}', background=bg)
-                self.logs_tree.item(item, tags=(f'bg_{item}',))
 
     def clear_old_logs_action(self):
         """Limpa logs antigos"""
         confirm = messagebox.askyesno(
             "⚠️ Confirmar Limpeza",
-            "Deseja realmente remover logs com mais de 90 dias?\n\n"
-            "Esta ação não pode ser desfeita!"
+            "Deseja arquivar e remover do banco os logs com mais de 90 dias?\n\n"
+            "Os registros são copiados antes para arquivos compactados em arquivo/logs/."
         )
         
         if not confirm:
             return
         
-        count = clear_old_logs(days=90)
-        if count > 0:
-            messagebox.showinfo("✓ Limpeza Concluída", f"{count} registros de log removidos com sucesso!")
-        else:
-            messagebox.showinfo("ℹ️ Limpeza", "Nenhum log antigo encontrado para remover.")
+        def done(count):
+            if count > 0:
+                messagebox.showinfo("✓ Limpeza Concluída", f"{count} registros de log arquivados e removidos com sucesso!")
+            else:
+                messagebox.showinfo("ℹ️ Limpeza", "Nenhum log antigo encontrado para remover.")
+            
+            # Atualizar a visualização
+            self.load_logs()
         
-        # Atualizar a visualização
-        self.load_logs()
+        self.tasks.submit(None, clear_old_logs, days=90, on_success=done, busy=[self.clear_logs_button])
 
 
 if __name__ == "__main__":
@@ -0,0 +1,254 @@
+"""
+Marc - Modo Quiosque
+Registro de ponto em tela cheia por número do crachá (ID do funcionário):
+o tipo de evento é deduzido da situação atual (a tecla Saída encerra a
+jornada de quem não fez descanso), o registro é aceito no spool
+local (gravado no banco em segundo plano) e a confirmação aparece em um
+aviso não modal
+"""
+
+import datetime
+
+import customtkinter as ctk
+
+from spool import get_punch_spool
+from presence import get_presence_board, TRANSITIONS, STATE_WORKING, STATE_BREAK
+
+EVENT_LABELS = {
+    'entrada': '🟢 Entrada',
+    'inicio_descanso': '🟡 Início Descanso',
+    'fim_descanso': '🟠 Fim Descanso',
+    'saida': '🔴 Saída'
+}
+
+# Tempo de exibição do aviso de confirmação (ms)
+TOAST_MS = 2500
+
+# Crachá repetido neste intervalo (s) é tratado como leitura duplicada
+REPEAT_GUARD_S = 60
+
+
+def infer_next_event(state, last_event, exit_requested=False):
+    """
+    Deduz o próximo evento a partir da situação do funcionário
+    exit_requested: tecla Saída (encerra a jornada mesmo sem descanso)
+    Retorna: tipo do evento ou None se a jornada do dia já foi encerrada
+    """
+    if exit_requested and state == STATE_WORKING:
+        return 'saida'
+    if state == STATE_BREAK:
+        return 'fim_descanso'
+    if state == STATE_WORKING:
+        # Depois do descanso, o próximo registro é a saída
+        return 'saida' if last_event == 'fim_descanso' else 'inicio_descanso'
+    if last_event == 'saida':
+        return None
+    return 'entrada'
+
+
+class KioskWindow(ctk.CTkToplevel):
+    """Janela de quiosque em tela cheia (Esc para sair)"""
+
+    def __init__(self, master, tasks, colors):
+        super().__init__(master)
+        self.colors = colors
+        self.tasks = tasks
+        self.board = None
+        # Spool compartilhado do aplicativo: continua gravando após fechar o quiosque
+        self.writer = get_punch_spool()
+        self.writer.poll()  # descartar resultados de registros anteriores
+        # Eventos enfileirados e ainda não confirmados: emp_id -> último tipo
+        self._pending = {}
+        self._last_punch = {}  # emp_id -> horário do último registro neste quiosque
+        self._toast_job = None
+        self._jobs = {}
+
+        self.title("Marc - Quiosque")
+        self.attributes("-fullscreen", True)
+        self.configure(fg_color=colors['background'])
+        self.protocol("WM_DELETE_WINDOW", self.close)
+        self.bind("<Escape>", lambda e: self.close())
+
+        ctk.CTkLabel(
+            self,
+            text="⚡ Marc - Registro de Ponto",
+            font=ctk.CTkFont(size=36, weight="bold"),
+            text_color=colors['primary']
+        ).pack(pady=(60, 10))
+
+        self.clock_label = ctk.CTkLabel(self, text="", font=ctk.CTkFont(size=28),
+                                        text_color=colors['text'])
+        self.clock_label.pack(pady=10)
+
+        ctk.CTkLabel(
+            self,
+            text="Digite ou passe o crachá e pressione Enter (Shift+Enter ou 🔴 Saída para encerrar a jornada)",
+            font=ctk.CTkFont(size=16),
+            text_color=colors['text_light']
+        ).pack(pady=(30, 10))
+
+        self.badge_entry = ctk.CTkEntry(
+            self,
+            width=420,
+            height=70,
+            justify="center",
+            font=ctk.CTkFont(size=36, weight="bold"),
+            border_color=colors['primary'],
+            border_width=3
+        )
+        self.badge_entry.pack(pady=10)
+        self.badge_entry.bind("<Return>", lambda e: self.punch())
+        self.badge_entry.bind("<KP_Enter>", lambda e: self.punch())
+        self.badge_entry.bind("<Shift-Return>", lambda e: self.punch(exit_requested=True))
+        self.badge_entry.bind("<Shift-KP_Enter>", lambda e: self.punch(exit_requested=True))
+
+        # Teclado numérico para telas de toque
+        keypad = ctk.CTkFrame(self, fg_color="transparent")
+        keypad.pack(pady=20)
+        keys = ['1', '2', '3', '4', '5', '6', '7', '8', '9', '⌫', '0', '✓']
+        for i, key in enumerate(keys):
+            ctk.CTkButton(
+                keypad,
+                text=key,
+                width=110,
+                height=70,
+                font=ctk.CTkFont(size=26, weight="bold"),
+                fg_color=colors['success'] if key == '✓' else colors['primary'],
+                hover_color=colors['secondary'],
+                command=lambda k=key: self.on_key(k)
+            ).grid(row=i // 3, column=i % 3, padx=6, pady=6)
+        # Quem não faz descanso: a saída não é deduzida logo após a entrada
+        ctk.CTkButton(
+            keypad,
+            text=EVENT_LABELS['saida'],
+            height=70,
+            font=ctk.CTkFont(size=26, weight="bold"),
+            fg_color=colors['danger'],
+            hover_color=colors['secondary'],
+            command=lambda: self.on_key('saida')
+        ).grid(row=len(keys) // 3, column=0, columnspan=3, padx=6, pady=6, sticky="ew")
+
+        self.toast = ctk.CTkLabel(self, text="", font=ctk.CTkFont(size=22, weight="bold"),
+                                  corner_radius=12, text_color="white", height=70)
+
+        self.status_label = ctk.CTkLabel(self, text="⏳ Carregando funcionários...",
+                                         font=ctk.CTkFont(size=12), text_color=colors['text_light'])
+        self.status_label.pack(side="bottom", pady=15)
+
+        tasks.submit('kiosk_board', get_presence_board, on_success=self.on_board_ready)
+
+        self.badge_entry.focus_set()
+        self.tick()
+        self.poll_writer()
+
+    def on_board_ready(self, board):
+        self.board = board
+        self.status_label.configure(text="Esc para sair do modo quiosque")
+
+    def tick(self):
+        self.clock_label.configure(text=datetime.datetime.now().strftime('%d/%m/%Y  %H:%M:%S'))
+        if self.board is not None:
+            # Registros de outros terminais: o quadro é conferido com o banco
+            # (no máximo a cada presence.RECONCILE_INTERVAL_S)
+            self.tasks.submit('kiosk_reconcile', self.board.reconcile)
+        self._jobs['tick'] = self.after(1000, self.tick)
+
+    def on_key(self, key):
+        if key == '⌫':
+            self.badge_entry.delete(len(self.badge_entry.get()) - 1, "end")
+        elif key == '✓':
+            self.punch()
+        elif key == 'saida':
+            self.punch(exit_requested=True)
+        else:
+            self.badge_entry.insert("end", key)
+        self.badge_entry.focus_set()
+
+    def punch(self, exit_requested=False):
+        """
+        Enfileira o registro do crachá digitado e libera a entrada imediatamente
+        exit_requested: registrar a saída em vez do evento deduzido
+        """
+        badge = self.badge_entry.get().strip()
+        self.badge_entry.delete(0, "end")
+
+        if not badge:
+            return
+        if self.board is None:
+            self.show_toast("⏳ Aguarde, carregando funcionários...", self.colors['warning'])
+            return
+
+        try:
+            emp_id = int(badge)
+        except ValueError:
+            self.show_toast("✗ Crachá inválido", self.colors['danger'])
+            return
+
+        employee = self.board.get_state(emp_id)
+        if employee is None:
+            self.show_toast(f"✗ Crachá {emp_id} não encontrado", self.colors['danger'])
+            # Pode ter sido cadastrado em outro terminal: disponível na próxima leitura
+            self.tasks.submit(f'kiosk_reload_{emp_id}', self.board.reload_employee, emp_id)
+            return
+
+        timestamp = datetime.datetime.now()
+        last_punch = self._last_punch.get(emp_id)
+        if last_punch and (timestamp - last_punch).total_seconds() < REPEAT_GUARD_S:
+            self.show_toast(f"ℹ️ {employee['name']}: registro já efetuado", self.colors['warning'])
+            return
+
+        # Considerar registros ainda na fila da gravação
+        last_event = self._pending.get(emp_id, employee['last_event'])
+        state = TRANSITIONS[last_event] if emp_id in self._pending else employee['state']
+
+        event_type = infer_next_event(state, last_event, exit_requested)
+        if event_type is None:
+            self.show_toast(f"ℹ️ {employee['name']}: jornada de hoje já encerrada", self.colors['warning'])
+            return
+        if exit_requested and event_type != 'saida':
+            message = ("finalize o descanso antes da saída" if state == STATE_BREAK
+                       else "registre a entrada primeiro")
+            self.show_toast(f"✗ {employee['name']}: {message}", self.colors['danger'])
+            return
+
+        self._pending[emp_id] = event_type
+        self._last_punch[emp_id] = timestamp
+        self.writer.submit(emp_id, event_type, timestamp)
+        self.show_toast(f"✓ {employee['name']} - {EVENT_LABELS[event_type]} às {timestamp.strftime('%H:%M')}",
+                        self.colors['success'])
+
+    def poll_writer(self):
+        """
+        Confere os resultados da gravação; falhas são exibidas no aviso e o
+        funcionário é relido do banco (o evento deduzido pode ter sido
+        registrado em outro terminal)
+        """
+        for emp_id, event_type, timestamp, ok, msg in self.writer.poll():
+            if self._pending.get(emp_id) == event_type:
+                del self._pending[emp_id]
+            if not ok and self.board is not None:
+                name = (self.board.get_state(emp_id) or {}).get('name', emp_id)
+                self.show_toast(f"✗ {name} - {EVENT_LABELS[event_type]}: {msg}", self.colors['danger'])
+                self._last_punch.pop(emp_id, None)  # permitir nova tentativa logo em seguida
+                self.tasks.submit(f'kiosk_reload_{emp_id}', self.board.reload_employee, emp_id)
+
+        pending = self.writer.pending
+        if self.board is not None:
+            self.status_label.configure(
+                text=f"Gravando {pending} registro(s)..." if pending else "Esc para sair do modo quiosque")
+        self._jobs['poll'] = self.after(100, self.poll_writer)
+
+    def show_toast(self, text, color):
+        """Aviso não modal que desaparece sozinho"""
+        self.toast.configure(text=f"  {text}  ", fg_color=color)
+        self.toast.place(relx=0.5, rely=0.9, anchor="center")
+        if self._toast_job:
+            self.after_cancel(self._toast_job)
+        self._toast_job = self.after(TOAST_MS, self.toast.place_forget)
+
+    def close(self):
+        """Sai do modo quiosque (os registros pendentes já estão no spool)"""
+        for job in list(self._jobs.values()) + [self._toast_job]:
+            if job:
+                self.after_cancel(job)
+        self.destroy()
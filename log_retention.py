@@ -0,0 +1,137 @@
+"""
+Marc - Retenção de Logs de Auditoria
+Agendamento diário, em segundo plano, da compressão dos detalhes grandes
+(db.compress_old_logs), do particionamento mensal dos logs e do arquivamento
+das partições vencidas (db.purge_old_logs)
+"""
+
+import datetime
+import sqlite3
+import threading
+
+import db
+
+# Ação registrada por db.purge_old_logs ao final de cada execução
+RUN_ACTION_PREFIX = 'Retenção de logs'
+
+
+class LogRetentionScheduler:
+    """
+    Executa a retenção de logs uma vez por dia, no horário configurado
+
+    A última execução é lida do próprio log de auditoria, então reiniciar a
+    aplicação não repete a limpeza do dia e uma execução perdida (aplicação
+    desligada) é feita após start_delay. A conversão única de bancos antigos
+    para vacuum incremental (VACUUM completo) só ocorre no horário agendado,
+    nunca em uma execução atrasada durante o expediente.
+    """
+
+    def __init__(self, days=None, hour=2, start_delay=0, check_interval=3600, retry_interval=900):
+        """
+        Parâmetros:
+        - days: idade máxima dos logs no banco (padrão db.LOG_RETENTION_DAYS)
+        - hour: hora do dia da execução (padrão 02:00)
+        - start_delay: espera em segundos antes da primeira verificação
+        - check_interval: espera máxima entre verificações em segundos
+        - retry_interval: espera em segundos após uma execução com erro
+        """
+        self.days = days
+        self.hour = hour
+        self.start_delay = start_delay
+        self.check_interval = check_interval
+        self.retry_interval = retry_interval
+        self.running = False
+        self.thread = None
+        self.last_result = None
+        self._last_run = None
+        self._stop_event = threading.Event()
+
+    def start(self):
+        """Inicia o agendador em thread separada"""
+        if self.running:
+            return
+        self.running = True
+        self._stop_event.clear()
+        self.thread = threading.Thread(daemon=True, name="marc-log-retention", target=self._loop)
+        self.thread.start()
+        print(f"✓ Retenção de logs agendada para {self.hour:02d}:00")
+
+    def stop(self):
+        """Para o agendador (uma execução em andamento para no próximo lote)"""
+        self.running = False
+        self._stop_event.set()
+        if self.thread:
+            self.thread.join(timeout=10)
+
+    def previous_slot(self, now):
+        slot = datetime.datetime.combine(now.date(), datetime.time(self.hour))
+        return slot if slot <= now else slot - datetime.timedelta(days=1)
+
+    def last_run(self):
+        """
+        Horário da última execução: a registrada no log de auditoria ou a
+        deste processo (execuções sem logs vencidos não são registradas)
+        """
+        conn = db.connect()
+        try:
+            row = conn.execute(
+                "SELECT MAX(timestamp) FROM logs WHERE categoria = 'sistema' AND acao LIKE ?",
+                (RUN_ACTION_PREFIX + '%',)
+            ).fetchone()
+        finally:
+            conn.close()
+        logged = datetime.datetime.fromisoformat(row[0]) if row and row[0] else None
+        return max(filter(None, (logged, self._last_run)), default=None)
+
+    def is_due(self, now=None):
+        now = now or datetime.datetime.now()
+        last = self.last_run()
+        return last is None or last < self.previous_slot(now)
+
+    def run_now(self, convert=False):
+        """
+        Executa a retenção imediatamente; retorna o resultado de
+        db.purge_old_logs, com 'compressed' (detalhes compactados antes)
+        """
+        self._last_run = datetime.datetime.now()
+        # Antes do particionamento: os meses encerrados vão compactados para as partições
+        compression = db.compress_old_logs(cancel_event=self._stop_event)
+        result = db.purge_old_logs(self.days, cancel_event=self._stop_event)
+        result['compressed'] = compression['compressed']
+        result['freed_pages'] += compression['freed_pages']
+        if convert and not self._stop_event.is_set():
+            result['freed_pages'] += db.incremental_vacuum(convert=True, cancel_event=self._stop_event)
+        self.last_result = result
+        return result
+
+    def _loop(self):
+        if self._stop_event.wait(self.start_delay):
+            return
+
+        while self.running:
+            now = datetime.datetime.now()
+            next_slot = self.previous_slot(now) + datetime.timedelta(days=1)
+            wait = max(1, min(self.check_interval, (next_slot - now).total_seconds()))
+            try:
+                if self.is_due(now):
+                    # No horário agendado (e não atrasado) o VACUUM único é aceitável
+                    on_schedule = now - self.previous_slot(now) < datetime.timedelta(hours=1)
+                    result = self.run_now(convert=on_schedule)
+                    print(f"[RETENÇÃO DE LOGS] {result['archived']} registros arquivados, "
+                          f"{result['compressed']} detalhes compactados, "
+                          f"{result['freed_pages']} páginas liberadas ({result['duration_s']}s)")
+            except sqlite3.Error as e:
+                print(f"Erro na retenção de logs: {e}")
+                wait = self.retry_interval
+
+            self._stop_event.wait(wait)
+
+
+def start_log_retention(days=None, hour=2, start_delay=0):
+    """
+    Inicia a retenção diária de logs
+    Retorna: LogRetentionScheduler
+    """
+    scheduler = LogRetentionScheduler(days=days, hour=hour, start_delay=start_delay)
+    scheduler.start()
+    return scheduler
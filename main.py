@@ -3,18 +3,148 @@ Marc - Sistema de Gestão de Ponto
 Versão 1.2 - Com Autenticação Segura, Auditoria e Backup Automático
 """
 
-import customtkinter as ctk
-from tkinter import messagebox
-import db
-from core_db import set_current_user
-from backup import BackupManager, BackupScheduler, initialize_backup_system, start_automatic_backups
+import multiprocessing
+import sys
+import time
+import threading
+from contextlib import contextmanager
 
-# Inicializar banco de dados
-db.init_db()
+_STARTUP_T0 = time.perf_counter()
 
-# Inicializar sistema de backup
-backup_manager = initialize_backup_system(db_file="ponto.db", backup_dir="backups")
-backup_scheduler = start_automatic_backups(backup_manager, check_interval=3600)
+
+class StartupProfiler:
+    """Mede as etapas da inicialização (ativado com --profile-startup)"""
+    
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.steps = []  # (etapa, segundos, thread)
+        self._lock = threading.Lock()
+    
+    @contextmanager
+    def step(self, label):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.steps.append((label, time.perf_counter() - t0, threading.current_thread().name))
+    
+    def mark(self, label):
+        """Registra o tempo decorrido desde o início do processo"""
+        with self._lock:
+            self.steps.append((label, time.perf_counter() - _STARTUP_T0, None))
+    
+    def report(self, title):
+        """Imprime as etapas registradas até agora"""
+        if not self.enabled:
+            return
+        with self._lock:
+            steps, self.steps = self.steps, []
+        print("-" * 60)
+        print(f"⏱️  {title}")
+        for label, seconds, thread in steps:
+            where = f" [{thread}]" if thread and thread != "MainThread" else ""
+            print(f"   {label:<36} {seconds * 1000:>9.1f} ms{where}")
+        print("-" * 60)
+
+
+profiler = StartupProfiler(enabled="--profile-startup" in sys.argv)
+
+with profiler.step("import customtkinter"):
+    import customtkinter as ctk
+    from tkinter import messagebox
+with profiler.step("import db, core_db"):
+    import db
+    from session import set_default_user
+with profiler.step("import backup"):
+    from backup import initialize_backup_system, start_automatic_backups, start_wal_archiving
+from log_retention import start_log_retention
+from tasks import TaskExecutor
+
+# Atraso do primeiro ciclo do agendador de backups após a abertura (segundos)
+STARTUP_BACKUP_DELAY = 120
+
+
+class StartupServices:
+    """
+    Inicialização em etapas dos serviços de banco de dados e backup
+    
+    A janela de login aparece primeiro; a verificação do esquema (init_db)
+    roda logo em seguida em segundo plano e o agendador de backups só faz
+    sua primeira verificação após STARTUP_BACKUP_DELAY segundos.
+    """
+    
+    def __init__(self, backup_delay=STARTUP_BACKUP_DELAY):
+        self.backup_delay = backup_delay
+        self.db_ready = threading.Event()
+        self.backup_ready = threading.Event()
+        self.error = None
+        self.backup_manager = None
+        self.backup_scheduler = None
+        self.wal_archiver = None
+        self.log_retention = None
+        self._lock = threading.Lock()
+        self._stopped = False
+    
+    def start(self):
+        threading.Thread(daemon=True, name="marc-startup", target=self._run).start()
+        return self
+    
+    def _run(self):
+        try:
+            with profiler.step("init_db (esquema)"):
+                db.init_db()
+            self.db_ready.set()
+            
+            # Reaplicar registros que ficaram no spool na execução anterior
+            with profiler.step("spool de ponto"):
+                from spool import get_punch_spool
+                get_punch_spool()
+            
+            # Arquivar anos encerrados de eventos (somente leitura, nada é removido)
+            with profiler.step("partições de eventos"):
+                for message in db.maintain_event_partitions():
+                    print(f"🗄️  {message}")
+            
+            with profiler.step("catálogo de backups"):
+                backup_manager = initialize_backup_system(db_file="ponto.db", backup_dir="backups")
+            
+            with self._lock:
+                if self._stopped:
+                    return
+                self.backup_manager = backup_manager
+                with profiler.step("agendador + arquivamento de WAL"):
+                    self.backup_scheduler = start_automatic_backups(
+                        backup_manager, check_interval=3600, start_delay=self.backup_delay)
+                    # Arquivamento contínuo de alterações para recuperação em ponto no tempo
+                    self.wal_archiver = start_wal_archiving(backup_manager, interval=60)
+                # Arquivamento e remoção em lotes dos logs vencidos (diário, 02:00)
+                self.log_retention = start_log_retention(start_delay=self.backup_delay)
+            self.backup_ready.set()
+            
+            # Logs anteriores ao índice de busca: indexados em lotes curtos
+            db.index_old_logs()
+        except Exception as e:
+            self.error = e
+            print(f"❌ Erro na inicialização em segundo plano: {e}")
+        finally:
+            # Não deixar a tela de login esperando indefinidamente
+            self.db_ready.set()
+            self.backup_ready.set()
+    
+    def stop(self):
+        """Para o agendador de backups, o arquivamento e a retenção de logs, se já iniciados"""
+        with self._lock:
+            self._stopped = True
+            if self.backup_scheduler:
+                self.backup_scheduler.stop()
+            if self.wal_archiver:
+                self.wal_archiver.stop()
+            if self.log_retention:
+                self.log_retention.stop()
+
+
+services = StartupServices()
 
 # Paleta de cores Marc
 PONTOFLOW_COLORS = {
@@ -168,6 +298,20 @@ class LoginPontoFlow(ctk.CTk):
         self.login_button.grid(row=0, column=0, sticky="ew")
         row += 1
         
+        # Indicador de autenticação em andamento (oculto até o clique)
+        self.login_progress = ctk.CTkProgressBar(
+            form_card,
+            mode="indeterminate",
+            height=6,
+            progress_color=PONTOFLOW_COLORS['primary']
+        )
+        self.login_progress.grid(row=row, column=0, pady=(0, 10), padx=30, sticky="ew")
+        self.login_progress.grid_remove()
+        row += 1
+        
+        # Autenticação (bcrypt + banco) fora da thread do Tk
+        self.tasks = TaskExecutor(self, max_workers=1)
+        
         # ===== FOOTER =====
         footer = ctk.CTkFrame(container, fg_color="transparent", height=60)
         footer.pack(side="bottom", fill="x", pady=10)
@@ -180,19 +324,34 @@ class LoginPontoFlow(ctk.CTk):
             text_color="gray"
         ).pack()
         
-        backup_info = backup_manager.get_backup_info()
-        backup_status = f"✓ Backups automáticos: {backup_info['total_backups']} cópia(s)"
-        
-        ctk.CTkLabel(
+        self.backup_status_label = ctk.CTkLabel(
             footer,
-            text=backup_status,
+            text="⏳ Verificando banco de dados...",
             font=ctk.CTkFont(size=8),
-            text_color="green"
-        ).pack()
+            text_color="gray"
+        )
+        self.backup_status_label.pack()
+        self.after(200, self.update_backup_status)
         
         # Focar no campo de usuário
         self.username_entry.focus()
     
+    def update_backup_status(self):
+        """Atualiza o rodapé quando o sistema de backup termina de iniciar"""
+        if not services.backup_ready.is_set():
+            self.after(200, self.update_backup_status)
+            return
+        
+        if services.backup_manager is None:
+            self.backup_status_label.configure(text="⚠️ Sistema de backup indisponível", text_color="red")
+            return
+        
+        backup_info = services.backup_manager.get_backup_info()
+        self.backup_status_label.configure(
+            text=f"✓ Backups automáticos: {backup_info['total_backups']} cópia(s)",
+            text_color="green"
+        )
+    
     def center_window(self):
         """Centraliza a janela na tela"""
         self.update_idletasks()
@@ -217,22 +376,53 @@ class LoginPontoFlow(ctk.CTk):
             self.password_entry.focus()
             return
         
-        # Autenticar usando o banco de dados
-        success, is_admin, message = db.authenticate_user(username, password)
+        def authenticate():
+            # O esquema é verificado em segundo plano; a autenticação espera por ele
+            services.db_ready.wait()
+            return db.authenticate_user(username, password)
+        
+        self.set_authenticating(True)
+        self.tasks.submit('login', authenticate,
+                          on_success=lambda result: self.on_authenticated(username, result),
+                          on_error=self.on_authentication_error)
+    
+    def set_authenticating(self, active):
+        """Mostra/oculta o indicador de progresso e bloqueia novos envios"""
+        if active:
+            self.login_button.configure(state="disabled", text="Autenticando...")
+            self.login_progress.grid()
+            self.login_progress.start()
+        else:
+            self.login_progress.stop()
+            self.login_progress.grid_remove()
+            self.login_button.configure(state="normal", text="Entrar")
+    
+    def on_authentication_error(self, error):
+        self.set_authenticating(False)
+        messagebox.showerror("Erro de Autenticação", f"Erro ao autenticar: {str(error)}")
+    
+    def on_authenticated(self, username, result):
+        """Abre a aplicação após a autenticação concluída no worker"""
+        success, is_admin, message = result
+        self.set_authenticating(False)
         
         if success:
             # Login bem-sucedido - importar GUI aqui para evitar import circular
-            from gui import PontoFlowApp
+            with profiler.step("import gui"):
+                from gui import PontoFlowApp
             
-            # Definir usuário atual para logs de auditoria
-            set_current_user(username)
+            # Operador desta janela nos logs de auditoria
+            set_default_user(username, is_admin=is_admin)
             
+            self.tasks.shutdown()
             self.destroy()
-            app = PontoFlowApp(is_admin=is_admin, current_user=username)
+            with profiler.step("construção da janela principal"):
+                app = PontoFlowApp(is_admin=is_admin, current_user=username)
+            app.after_idle(lambda: profiler.report("Abertura da janela principal"))
             app.mainloop()
             
             # Parar o agendador de backups quando a aplicação fecha
-            backup_scheduler.stop()
+            services.stop()
         else:
             # Falha no login
             messagebox.showerror("Erro de Autenticação", message)
@@ -241,6 +431,9 @@ class LoginPontoFlow(ctk.CTk):
 
 
 if __name__ == "__main__":
+    # Necessário para o processo de exportação de PDF no executável do Windows
+    multiprocessing.freeze_support()
+    
     # Configurações do CustomTkinter
     ctk.set_appearance_mode("light")
     ctk.set_default_color_theme("blue")
@@ -248,18 +441,32 @@ if __name__ == "__main__":
     print("=" * 60)
     print("🚀 Marc v1.2 - Sistema de Gestão de Ponto")
     print("=" * 60)
-    print("✓ Banco de dados inicializado")
-    print("✓ Sistema de backup automático iniciado")
+    print("✓ Inicializando banco de dados em segundo plano")
+    print(f"✓ Backups automáticos a partir de {STARTUP_BACKUP_DELAY}s após a abertura")
     print(f"✓ Backups localizados em: backups/")
     print("=" * 60)
     
     # Iniciar aplicação
     try:
-        login = LoginPontoFlow()
+        with profiler.step("janela de login"):
+            login = LoginPontoFlow()
+        services.start()
+        
+        def login_shown():
+            profiler.mark("tempo até o login (desde o início)")
+            profiler.report("Inicialização até a janela de login")
+            if profiler.enabled:
+                # Etapas em segundo plano são relatadas quando concluídas
+                def report_background():
+                    services.backup_ready.wait()
+                    profiler.report("Inicialização em segundo plano")
+                threading.Thread(daemon=True, target=report_background).start()
+        
+        login.after_idle(login_shown)
         login.mainloop()
     except KeyboardInterrupt:
         print("\n⚠️  Aplicação interrompida pelo usuário")
-        backup_scheduler.stop()
+        services.stop()
     except Exception as e:
         print(f"❌ Erro na aplicação: {e}")
-        backup_scheduler.stop()
+        services.stop()
@@ -0,0 +1,245 @@
+"""
+Marc - Quadro de Presença
+Estado atual de cada funcionário (fora / trabalhando / em descanso), carregado
+uma vez a partir dos eventos do dia e atualizado a cada registro confirmado
+"""
+
+import datetime
+import sqlite3
+import threading
+import time
+
+import db
+
+STATE_OUT = 'fora'
+STATE_WORKING = 'trabalhando'
+STATE_BREAK = 'descanso'
+STATES = (STATE_WORKING, STATE_BREAK, STATE_OUT)
+
+# Intervalo mínimo entre conferências com o banco (registros de outros
+# terminais e processos não passam por on_event)
+RECONCILE_INTERVAL_S = 30
+
+# Máquina de estados: evento -> novo estado
+TRANSITIONS = {
+    'entrada': STATE_WORKING,
+    'inicio_descanso': STATE_BREAK,
+    'fim_descanso': STATE_WORKING,
+    'saida': STATE_OUT
+}
+
+
+def _new_entry(emp_id, name):
+    return {'id': emp_id, 'name': name, 'state': STATE_OUT, 'since': None, 'last_event': None}
+
+
+def _apply(entry, event_type, timestamp):
+    state = TRANSITIONS.get(event_type)
+    if state is None:
+        return
+    entry['state'] = state
+    entry['since'] = timestamp
+    entry['last_event'] = event_type
+
+
+class PresenceBoard:
+    """
+    Quadro de presença em memória
+
+    - load() lê os funcionários e os eventos do dia em uma única consulta
+    - on_event() é registrado em db.add_event_listener e aplica cada registro
+      confirmado sem consultar o banco; ajustes, remoções e registros fora de
+      ordem recarregam apenas o funcionário afetado
+    - reconcile() relê o quadro do banco periodicamente: registros de outros
+      terminais (ou do spool de outro processo) só chegam por ele
+    - version é incrementado a cada alteração, para a interface só redesenhar
+      quando algo mudou
+    """
+
+    def __init__(self):
+        self.date = None
+        self.version = 0
+        self.reconciled_at = 0.0  # time.monotonic() da última leitura completa
+        self._employees = {}  # id -> entrada do quadro
+        self._lock = threading.Lock()
+
+    # --- Carga ---
+    def load(self, date=None):
+        """Carrega o estado de todos os funcionários para a data (padrão: hoje)"""
+        date = date or datetime.date.today()
+        try:
+            employees = self._read(date)
+        except sqlite3.Error as e:
+            print(f"Erro ao carregar quadro de presença: {e}")
+            return False
+
+        with self._lock:
+            self.date = date
+            self._employees = employees
+            self.version += 1
+            self.reconciled_at = time.monotonic()
+        return True
+
+    def reconcile(self, max_age=RECONCILE_INTERVAL_S):
+        """
+        Confere o quadro com o banco se a última leitura tem mais de max_age
+        segundos e aplica as diferenças (registros de outros terminais)
+        Retorna: True se o quadro mudou
+        """
+        with self._lock:
+            date = self.date
+            version = self.version
+            if date is None or time.monotonic() - self.reconciled_at < max_age:
+                return False
+        if date != datetime.date.today():
+            return self.load()
+
+        try:
+            employees = self._read(date)
+        except sqlite3.Error as e:
+            print(f"Erro ao conferir quadro de presença: {e}")
+            return False
+
+        with self._lock:
+            if self.version != version or self.date != date:
+                return False  # alterado durante a leitura: confere na próxima vez
+            self.reconciled_at = time.monotonic()
+            if employees == self._employees:
+                return False
+            self._employees = employees
+            self.version += 1
+        return True
+
+    @staticmethod
+    def _read(date):
+        """Estado de todos os funcionários na data, lido do banco"""
+        conn = db.connect()
+        try:
+            c = conn.cursor()
+            c.execute('''
+                SELECT f.id, f.name, e.tipo, e.timestamp
+                FROM funcionarios f
+                LEFT JOIN eventos e ON e.funcionario_id = f.id AND DATE(e.timestamp) = ?
+                ORDER BY f.id, e.timestamp
+            ''', (date.isoformat(),))
+            rows = c.fetchall()
+        finally:
+            conn.close()
+
+        employees = {}
+        for emp_id, name, event_type, ts in rows:
+            entry = employees.get(emp_id)
+            if entry is None:
+                entry = employees[emp_id] = _new_entry(emp_id, name)
+            if event_type:
+                _apply(entry, event_type, datetime.datetime.fromisoformat(ts))
+        return employees
+
+    def reload_employee(self, emp_id):
+        """Recalcula o estado de um funcionário a partir do banco"""
+        with self._lock:
+            date = self.date
+        if date is None:
+            return
+
+        try:
+            conn = db.connect()
+            c = conn.cursor()
+            c.execute('SELECT name FROM funcionarios WHERE id=?', (emp_id,))
+            result = c.fetchone()
+            c.execute('''
+                SELECT tipo, timestamp FROM eventos
+                WHERE funcionario_id=? AND DATE(timestamp)=?
+                ORDER BY timestamp
+            ''', (emp_id, date.isoformat()))
+            events = c.fetchall()
+            conn.close()
+        except sqlite3.Error as e:
+            print(f"Erro ao atualizar quadro de presença: {e}")
+            return
+
+        with self._lock:
+            if result is None:
+                self._employees.pop(emp_id, None)
+            else:
+                entry = _new_entry(emp_id, result[0])
+                for event_type, ts in events:
+                    _apply(entry, event_type, datetime.datetime.fromisoformat(ts))
+                self._employees[emp_id] = entry
+            self.version += 1
+
+    def ensure_current(self):
+        """Recarrega se o dia mudou; retorna True se recarregou"""
+        if self.date != datetime.date.today():
+            return self.load()
+        return False
+
+    # --- Atualização a partir dos registros confirmados ---
+    def on_event(self, action, emp_id, event_type=None, timestamp=None):
+        if action == 'registro' and timestamp is not None:
+            with self._lock:
+                if timestamp.date() != self.date:
+                    return  # outro dia: não altera o quadro atual
+                entry = self._employees.get(emp_id)
+                if entry is not None and (entry['since'] is None or timestamp >= entry['since']):
+                    _apply(entry, event_type, timestamp)
+                    self.version += 1
+                    return
+        elif timestamp is not None and timestamp.date() != self.date:
+            return
+
+        # Ajuste, remoção, cadastro ou registro fora de ordem
+        self.reload_employee(emp_id)
+
+    # --- Consulta ---
+    def counts(self):
+        """Número de funcionários por estado"""
+        with self._lock:
+            counts = {state: 0 for state in STATES}
+            for entry in self._employees.values():
+                counts[entry['state']] += 1
+        return counts
+
+    def snapshot(self, state=None, search=None):
+        """
+        Lista ordenada por nome das entradas do quadro
+
+        Parâmetros:
+        - state: filtrar por estado (STATES)
+        - search: trecho do nome ou ID
+        """
+        search = (search or '').strip().lower()
+        with self._lock:
+            entries = [dict(entry) for entry in self._employees.values()
+                       if (state is None or entry['state'] == state)
+                       and (not search or search in entry['name'].lower() or search == str(entry['id']))]
+        entries.sort(key=lambda entry: entry['name'].lower())
+        return entries
+
+    def get_state(self, emp_id):
+        """Estado atual do funcionário (None se não cadastrado)"""
+        with self._lock:
+            entry = self._employees.get(emp_id)
+            return dict(entry) if entry else None
+
+
+_board = None
+_board_lock = threading.Lock()
+
+
+def get_presence_board():
+    """
+    Retorna o quadro de presença compartilhado, carregando-o e registrando-o
+    para receber os registros confirmados na primeira chamada
+    """
+    global _board
+    with _board_lock:
+        if _board is None:
+            board = PresenceBoard()
+            # Registrar antes de carregar: nenhum registro fica entre a carga e a escuta
+            db.add_event_listener(board.on_event)
+            board.load()
+            _board = board
+        else:
+            _board.ensure_current()
+    return _board
@@ -0,0 +1,367 @@
+"""
+Marc - Serviço de Ponto (HTTP/JSON)
+Permite que tablets e terminais da rede local registrem o ponto no banco
+desta máquina, sem acessar o ponto.db por compartilhamento de rede
+
+- Servidor asyncio (somente biblioteca padrão) para os pedidos
+- Registros são aceitos no spool local (spool.py) e aplicados em ordem por
+  uma única thread; se o banco estiver ocupado, a resposta é 202 (aceito)
+- Leituras (folha de ponto) rodam no executor padrão, em paralelo
+
+Rotas:
+    GET  /health                                  situação do serviço
+    POST /punch      {"emp_id": 3, "event_type": "entrada", "timestamp": opcional}
+                     (timestamp só é aceito até MAX_CLOCK_SKEW_S do relógio do servidor)
+    GET  /timesheet?emp_id=3&year=2026&month=10  folha de ponto do mês
+
+Por padrão o serviço escuta só em 127.0.0.1; outro endereço (ex: 0.0.0.0
+para a rede local) exige MARC_SERVICE_TOKEN definido.
+
+Uso:
+    MARC_SERVICE_TOKEN=... python punch_service.py serve --host 0.0.0.0 --port 8765
+    python punch_service.py health
+    python punch_service.py punch 3 entrada
+    python punch_service.py timesheet 3 2026 10
+"""
+
+import argparse
+import asyncio
+import datetime
+import hmac
+import ipaddress
+import json
+import os
+import time
+import urllib.error
+import urllib.request
+from urllib.parse import parse_qs, urlsplit
+
+import db
+from core_db import EVENT_TYPES, get_timesheet, summarize_timesheet
+from session import session_scope
+from spool import get_punch_spool
+
+DEFAULT_HOST = os.environ.get('MARC_SERVICE_HOST', '127.0.0.1')
+DEFAULT_PORT = int(os.environ.get('MARC_SERVICE_PORT', 8765))
+# Se definido, os pedidos devem enviar "Authorization: Bearer <token>"
+# (obrigatório para escutar em endereço que não seja de loopback)
+SERVICE_TOKEN = os.environ.get('MARC_SERVICE_TOKEN')
+# Diferença máxima (s) entre o horário enviado pelo terminal e o do servidor
+MAX_CLOCK_SKEW_S = int(os.environ.get('MARC_SERVICE_MAX_SKEW', 120))
+
+SERVICE_USER = 'servico_ponto'  # usuário dos registros no log de auditoria ("servico_ponto@ip")
+MAX_BODY = 16 * 1024
+MAX_PENDING = 500  # registros aguardando gravação antes de recusar novos
+ACCEPT_WAIT_S = 2  # espera pela gravação antes de responder 202 (aceito no spool)
+REQUEST_TIMEOUT = 10
+
+REASONS = {200: 'OK', 201: 'Created', 400: 'Bad Request', 401: 'Unauthorized', 404: 'Not Found',
+           405: 'Method Not Allowed', 409: 'Conflict', 413: 'Payload Too Large',
+           500: 'Internal Server Error', 503: 'Service Unavailable'}
+
+
+class RequestError(Exception):
+    """Pedido inválido: vira uma resposta JSON com o status informado"""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def is_loopback(host):
+    """True se o endereço só aceita conexões desta máquina"""
+    if host == 'localhost':
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+def _timesheet_json(days):
+    """Folha de ponto em formato JSON (datas ISO, durações em segundos)"""
+    summary = summarize_timesheet(days)
+    return {
+        'days': [{
+            'date': day['date'].isoformat(),
+            'events': [{'type': e['type'], 'timestamp': e['ts'].isoformat()} for e in day['events']],
+            'holiday': day['holiday'],
+            'off': day['off'],
+            'duration_s': int(day['duration'].total_seconds()) if day['duration'] else None
+        } for day in days],
+        'summary': {
+            'total_s': int(summary['total_hours'].total_seconds()),
+            'total_formatted': summary['total_hours_formatted'],
+            'worked_days': summary['worked_days'],
+            'holidays': summary['holidays'],
+            'days_off': summary['days_off']
+        }
+    }
+
+
+class PunchService:
+    """Servidor HTTP/JSON de registro de ponto"""
+
+    def __init__(self, host=DEFAULT_HOST, port=DEFAULT_PORT, token=SERVICE_TOKEN):
+        if not token and not is_loopback(host):
+            raise ValueError(f"Escutar em {host} exige token de acesso (defina MARC_SERVICE_TOKEN) "
+                             f"ou use 127.0.0.1")
+        self.host = host
+        self.port = port
+        self.token = token
+        self.writer = None
+        self.server = None
+        self.started = None
+        self.routes = {
+            ('GET', '/health'): self.health,
+            ('POST', '/punch'): self.punch,
+            ('GET', '/timesheet'): self.timesheet
+        }
+
+    async def start(self):
+        self.writer = get_punch_spool('servico', keep_results=False)
+        self.server = await asyncio.start_server(self.handle, self.host, self.port)
+        self.started = time.monotonic()
+        # Porta real (permite port=0 nos testes)
+        self.port = self.server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self):
+        """Para de aceitar pedidos e grava os registros ainda na fila"""
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+        if self.writer is not None:
+            await asyncio.get_running_loop().run_in_executor(None, self.writer.stop)
+
+    async def serve_forever(self):
+        await self.start()
+        print(f"✓ Serviço de ponto em http://{self.host}:{self.port} (banco: {db.DB_FILE})")
+        try:
+            await self.server.serve_forever()
+        finally:
+            await self.stop()
+
+    # --- HTTP ---
+    async def handle(self, reader, writer):
+        status, payload = 500, {'ok': False, 'message': 'Erro interno'}
+        try:
+            method, path, query, headers, body = await asyncio.wait_for(
+                self.read_request(reader), REQUEST_TIMEOUT)
+            self.check_auth(headers)
+            route = self.routes.get((method, path))
+            if route is None:
+                if any(p == path for _, p in self.routes):
+                    raise RequestError(405, "Método não permitido")
+                raise RequestError(404, "Rota não encontrada")
+            # Cada conexão roda em sua própria tarefa asyncio (e contexto):
+            # a sessão identifica o terminal de origem no log de auditoria
+            peer = writer.get_extra_info('peername')
+            source = peer[0] if peer else None
+            with session_scope(f"{SERVICE_USER}@{source}" if source else SERVICE_USER, source=source):
+                status, payload = await route(query, body)
+        except RequestError as e:
+            status, payload = e.status, {'ok': False, 'message': str(e)}
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, UnicodeDecodeError, ValueError):
+            status, payload = 400, {'ok': False, 'message': "Pedido HTTP inválido"}
+        except Exception as e:
+            print(f"Erro no serviço de ponto: {e}")
+
+        data = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        writer.write(
+            f"HTTP/1.1 {status} {REASONS.get(status, '')}\r\n"
+            f"Content-Type: application/json; charset=utf-8\r\n"
+            f"Content-Length: {len(data)}\r\n"
+            f"Connection: close\r\n\r\n".encode('latin-1') + data
+        )
+        try:
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def read_request(self, reader):
+        request_line = (await reader.readline()).decode('latin-1').strip()
+        method, target, _ = request_line.split(' ', 2)
+
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        length = int(headers.get('content-length', 0))
+        if length > MAX_BODY:
+            raise RequestError(413, "Corpo do pedido muito grande")
+        body = await reader.readexactly(length) if length else b''
+
+        url = urlsplit(target)
+        query = {key: values[0] for key, values in parse_qs(url.query).items()}
+        return method.upper(), url.path, query, headers, body
+
+    def check_auth(self, headers):
+        if not self.token:
+            return
+        expected = f"Bearer {self.token}".encode('utf-8')
+        if not hmac.compare_digest(headers.get('authorization', '').encode('utf-8'), expected):
+            raise RequestError(401, "Token de acesso inválido")
+
+    # --- Rotas ---
+    async def health(self, query, body):
+        return 200, {
+            'ok': True,
+            'status': 'ok',
+            'pending': self.writer.pending,
+            'uptime_s': round(time.monotonic() - self.started, 1)
+        }
+
+    async def punch(self, query, body):
+        try:
+            data = json.loads(body or b'{}')
+            emp_id = int(data['emp_id'])
+            event_type = data['event_type']
+            timestamp = data.get('timestamp')
+            timestamp = datetime.datetime.fromisoformat(timestamp) if timestamp else None
+        except (KeyError, TypeError, ValueError):
+            raise RequestError(400, "Informe emp_id, event_type e, opcionalmente, timestamp ISO")
+
+        now = datetime.datetime.now()
+        if timestamp is None:
+            timestamp = now
+        else:
+            if timestamp.tzinfo is not None:
+                timestamp = timestamp.astimezone().replace(tzinfo=None)  # horário local, como os demais
+            # O horário do terminal só corrige a latência da rede, não substitui o relógio do servidor
+            if abs((timestamp - now).total_seconds()) > MAX_CLOCK_SKEW_S:
+                raise RequestError(400, f"Horário do terminal difere do servidor em mais de "
+                                        f"{MAX_CLOCK_SKEW_S}s; acerte o relógio do terminal")
+
+        if event_type not in EVENT_TYPES:
+            raise RequestError(400, f"Tipo de evento inválido (use {', '.join(EVENT_TYPES)})")
+        if self.writer.pending >= MAX_PENDING:
+            raise RequestError(503, "Serviço sobrecarregado; tente novamente")
+
+        # submit() não espera o disco: a gravação no spool (fsync) roda na thread do spool
+        future = self.writer.submit(emp_id, event_type, timestamp)
+        try:
+            await asyncio.wrap_future(future.accepted)
+        except OSError as e:
+            raise RequestError(503, f"Registro não gravado no spool: {e}")
+        response = {
+            'id': future.entry_id,
+            'emp_id': emp_id,
+            'event_type': event_type,
+            'timestamp': timestamp.isoformat()
+        }
+        try:
+            ok, msg = await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(future)), ACCEPT_WAIT_S)
+        except asyncio.TimeoutError:
+            # Já gravado no spool com o horário original; será aplicado assim que possível
+            return 202, {'ok': True, 'queued': True, 'message': 'Registro aceito; gravação pendente', **response}
+        return (201 if ok else 409), {'ok': ok, 'queued': False, 'message': msg, **response}
+
+    async def timesheet(self, query, body):
+        try:
+            emp_id = int(query['emp_id'])
+            today = datetime.date.today()
+            year = int(query.get('year', today.year))
+            month = int(query.get('month', today.month))
+            datetime.date(year, month, 1)
+        except (KeyError, ValueError):
+            raise RequestError(400, "Informe emp_id e, opcionalmente, year e month")
+
+        days = await asyncio.to_thread(get_timesheet, emp_id, year, month)
+        if not days:
+            raise RequestError(404, "Funcionário não encontrado")
+        return 200, {'ok': True, 'emp_id': emp_id, 'year': year, 'month': month, **_timesheet_json(days)}
+
+
+class PunchClient:
+    """Cliente do serviço de ponto (tablets, scripts e testes locais)"""
+
+    def __init__(self, base_url=f"http://127.0.0.1:{DEFAULT_PORT}", token=SERVICE_TOKEN, timeout=10):
+        self.base_url = base_url.rstrip('/')
+        self.token = token
+        self.timeout = timeout
+
+    def request(self, method, path, payload=None):
+        """Retorna (status HTTP, resposta JSON)"""
+        data = json.dumps(payload).encode('utf-8') if payload is not None else None
+        req = urllib.request.Request(self.base_url + path, data=data, method=method)
+        req.add_header('Content-Type', 'application/json')
+        if self.token:
+            req.add_header('Authorization', f"Bearer {self.token}")
+        try:
+            with urllib.request.urlopen(req, timeout=self.timeout) as response:
+                return response.status, json.loads(response.read())
+        except urllib.error.HTTPError as e:
+            return e.code, json.loads(e.read() or b'{}')
+
+    def health(self):
+        return self.request('GET', '/health')
+
+    def punch(self, emp_id, event_type, timestamp=None):
+        payload = {'emp_id': emp_id, 'event_type': event_type}
+        if timestamp is not None:
+            payload['timestamp'] = timestamp.isoformat()
+        return self.request('POST', '/punch', payload)
+
+    def timesheet(self, emp_id, year=None, month=None):
+        path = f"/timesheet?emp_id={emp_id}"
+        if year:
+            path += f"&year={year}"
+        if month:
+            path += f"&month={month}"
+        return self.request('GET', path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serviço de ponto do Marc (HTTP/JSON)")
+    parser.add_argument('--url', default=f"http://127.0.0.1:{DEFAULT_PORT}", help='endereço do serviço (cliente)')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    serve = sub.add_parser('serve', help='inicia o serviço')
+    serve.add_argument('--host', default=DEFAULT_HOST)
+    serve.add_argument('--port', type=int, default=DEFAULT_PORT)
+    serve.add_argument('--db', default=db.DB_FILE, help='arquivo do banco de dados')
+
+    sub.add_parser('health', help='consulta a situação do serviço')
+    punch = sub.add_parser('punch', help='registra um evento de ponto')
+    punch.add_argument('emp_id', type=int)
+    punch.add_argument('event_type', choices=EVENT_TYPES)
+    timesheet = sub.add_parser('timesheet', help='consulta a folha de ponto do mês')
+    timesheet.add_argument('emp_id', type=int)
+    timesheet.add_argument('year', type=int, nargs='?')
+    timesheet.add_argument('month', type=int, nargs='?')
+
+    args = parser.parse_args()
+
+    if args.command == 'serve':
+        db.DB_FILE = args.db
+        db.init_db()
+        try:
+            service = PunchService(args.host, args.port)
+        except ValueError as e:
+            parser.error(str(e))
+        try:
+            asyncio.run(service.serve_forever())
+        except KeyboardInterrupt:
+            print("\n✓ Serviço de ponto encerrado")
+        return
+
+    client = PunchClient(args.url)
+    if args.command == 'health':
+        status, response = client.health()
+    elif args.command == 'punch':
+        status, response = client.punch(args.emp_id, args.event_type)
+    else:
+        status, response = client.timesheet(args.emp_id, args.year, args.month)
+    print(status, json.dumps(response, indent=2, ensure_ascii=False))
+    raise SystemExit(0 if status < 400 else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""
+Marc - Estado de Ponto do Dia
+Cache em memória dos eventos já registrados hoje por funcionário, usado na
+validação da sequência de cada registro sem reler os eventos do dia
+"""
+
+import datetime
+import threading
+
+import db
+
+
+class PunchStateCache:
+    """
+    Tipos de evento registrados hoje, por funcionário, válidos para uma
+    versão dos eventos do banco (db.events_version: incrementada por gatilho
+    a cada inserção, alteração ou remoção em eventos, de qualquer terminal)
+
+    - db.record_event_db consulta o cache dentro da transação de escrita:
+      com a versão do banco igual à do cache, a sequência é conferida só
+      com ele (verificação definitiva, sem reler os eventos do dia); senão
+      os eventos do funcionário são lidos e o cache recomeça nessa versão
+    - Depois do commit, o estado do funcionário e a versão avançam juntos
+    - Na virada do dia, reconcile() lê os eventos de hoje de todos os
+      funcionários em uma única consulta (cache completo)
+    - clear() descarta tudo (ex: após restaurar um backup)
+    """
+
+    def __init__(self):
+        self.date = None
+        self.version = None
+        self.complete = False  # todos os funcionários carregados (ausente = nenhum evento)
+        self._states = {}  # emp_id -> frozenset de tipos
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, emp_id, date_obj, version):
+        """Tipos do funcionário na data se o cache vale para a versão informada (senão None)"""
+        with self._lock:
+            if date_obj == self.date and version == self.version:
+                state = self._states.get(emp_id)
+                if state is None and self.complete:
+                    state = frozenset()
+                if state is not None:
+                    self.hits += 1
+                    return state
+            self.misses += 1
+            return None
+
+    def loaded(self, emp_id, date_obj, version, state):
+        """Estado lido do banco na versão informada (dentro da transação de escrita)"""
+        if date_obj != datetime.date.today():
+            return  # outros dias não são guardados
+        with self._lock:
+            if date_obj != self.date or version != self.version:
+                self._reset(date_obj, version)
+            self._states[emp_id] = state
+
+    def recorded(self, emp_id, date_obj, version, state):
+        """Registro confirmado: version é a versão do banco logo após o commit"""
+        with self._lock:
+            if date_obj != self.date:
+                return
+            if self.version == version - 1:
+                # Nenhuma outra alteração entre a conferência e o commit
+                self.version = version
+            if self.version == version:
+                self._states[emp_id] = state
+
+    def reconcile(self):
+        """
+        Virada do dia: carrega os eventos de hoje de todos os funcionários e a
+        versão correspondente (mesmo instantâneo do banco)
+        Levanta sqlite3.Error
+        """
+        today = datetime.date.today()
+        conn = db.connect()
+        try:
+            conn.execute('BEGIN')
+            version = db.events_version(conn)
+            rows = conn.execute('SELECT funcionario_id, tipo FROM eventos WHERE DATE(timestamp) = ?',
+                                (today.isoformat(),)).fetchall()
+        finally:
+            conn.close()
+
+        states = {}
+        for emp_id, event_type in rows:
+            states.setdefault(emp_id, set()).add(event_type)
+        with self._lock:
+            self._reset(today, version)
+            self._states = {emp_id: frozenset(types) for emp_id, types in states.items()}
+            self.complete = True
+
+    def clear(self):
+        with self._lock:
+            self._reset(None, None)
+
+    def _reset(self, date_obj, version):
+        self.date = date_obj
+        self.version = version
+        self.complete = False
+        self._states = {}
+
+    @staticmethod
+    def load_day(emp_id, date_obj):
+        """
+        Tipos de evento do funcionário na data, lidos do banco
+        Retorna None se o funcionário não existe; levanta sqlite3.Error
+        """
+        conn = db.connect()
+        try:
+            c = conn.cursor()
+            c.execute('''
+                SELECT e.tipo
+                FROM funcionarios f
+                LEFT JOIN eventos e ON e.funcionario_id = f.id AND DATE(e.timestamp) = ?
+                WHERE f.id = ?
+            ''', (date_obj.isoformat(), emp_id))
+            rows = c.fetchall()
+        finally:
+            conn.close()
+        if not rows:
+            return None
+        return frozenset(row[0] for row in rows if row[0])
+
+
+punch_states = PunchStateCache()
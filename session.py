@@ -0,0 +1,59 @@
+"""
+Marc - Contexto de Sessão
+Identifica o operador responsável por cada ação (log de auditoria) por
+contexto de execução (contextvars), e não por uma variável global
+
+- session_scope() define o operador de um trecho de código (ex: um pedido
+  do serviço de ponto); pedidos simultâneos não interferem entre si
+- set_default_user() define o operador do processo (a interface gráfica,
+  com um único usuário logado), usado onde nenhuma sessão foi definida
+- Threads não herdam o contexto: quem entrega trabalho a outra thread deve
+  copiá-lo com contextvars.copy_context() (o TaskExecutor já faz; o spool
+  grava o operador em cada registro)
+"""
+
+import contextvars
+from contextlib import contextmanager
+
+
+class Session:
+    """Operador de uma sessão: usuário, perfil e origem (ex: endereço do terminal)"""
+
+    def __init__(self, username, is_admin=False, source=None):
+        self.username = username
+        self.is_admin = is_admin
+        self.source = source
+
+    def __repr__(self):
+        return f"Session({self.username!r}, is_admin={self.is_admin}, source={self.source!r})"
+
+
+_default_session = Session('system')
+_session = contextvars.ContextVar('marc_session')
+
+
+def current_session():
+    """Sessão do contexto atual (ou a sessão padrão do processo)"""
+    return _session.get(_default_session)
+
+
+def current_user():
+    """Usuário da sessão atual, usado nos registros de auditoria"""
+    return current_session().username
+
+
+def set_default_user(username, is_admin=False, source=None):
+    """Define o operador padrão do processo (contextos sem sessão própria)"""
+    global _default_session
+    _default_session = Session(username, is_admin, source)
+
+
+@contextmanager
+def session_scope(username, is_admin=False, source=None):
+    """Executa o bloco com a sessão informada; restaura a anterior ao sair"""
+    session = Session(username, is_admin, source)
+    token = _session.set(session)
+    try:
+        yield session
+    finally:
+        _session.reset(token)
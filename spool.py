@@ -0,0 +1,441 @@
+"""
+Marc - Spool de Registros de Ponto
+Arquivo local, somente de acréscimo, onde os registros são aceitos na hora
+(com o horário original) e depois aplicados ao banco por uma thread, mesmo
+que o banco esteja bloqueado por outro terminal ou em restauração
+
+Formato (uma linha JSON por registro, gravada com fsync):
+    {"id": "...", "emp_id": 3, "event_type": "entrada", "timestamp": "...", "user": "...", "accepted_at": "..."}
+    {"ack": "...", "status": "aplicado" | "recusado", "message": "..."}
+
+Um registro sem "ack" ainda está pendente e é reaplicado ao reabrir o spool.
+A chave "id" é gravada no banco com o evento (idempotência), então um
+registro aplicado pouco antes de uma queda não é duplicado. Registros que
+falham por outro motivo que não o banco ocupado são estacionados depois de
+MAX_APPLY_ATTEMPTS tentativas em <spool>.parked.jsonl (status "estacionado")
+e não bloqueiam os seguintes.
+
+As linhas são gravadas por uma thread própria, que junta as que chegam ao
+mesmo tempo em um único fsync (group commit): quem registra não espera o disco.
+
+Cada arquivo é usado por um único processo (bloqueio exclusivo do sistema
+operacional): um segundo processo na mesma máquina abre outro arquivo
+(ponto_<máquina>_2.jsonl, ...), e os pendentes de arquivos sem dono
+(processo encerrado) são assumidos por quem abre o spool.
+"""
+
+import datetime
+import json
+import os
+import queue
+import re
+import socket
+import threading
+import uuid
+from concurrent.futures import Future
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+from core_db import EVENT_TYPES, record_event
+from db import is_transient_error, log_action
+from session import current_user, session_scope
+
+SPOOL_DIR = os.environ.get('MARC_SPOOL_DIR', 'spool')
+
+STATUS_APPLIED = 'aplicado'
+STATUS_REJECTED = 'recusado'
+STATUS_PARKED = 'estacionado'
+
+RETRY_MIN_S = 0.5
+RETRY_MAX_S = 30
+MAX_APPLY_ATTEMPTS = 5  # falhas que não são banco ocupado: depois, o registro é estacionado
+COMPACT_AFTER = 1000  # linhas confirmadas antes de esvaziar o arquivo
+MAX_SPOOL_FILES = 32  # processos simultâneos com o mesmo spool na máquina
+
+
+class SpoolInUseError(OSError):
+    """Arquivo de spool bloqueado por outro processo"""
+
+
+class SpoolClosedError(OSError):
+    """Gravação pedida depois de stop()"""
+
+
+def _try_lock(fd):
+    """Bloqueio exclusivo do arquivo, sem esperar; False se outro processo o detém"""
+    try:
+        if fcntl is not None:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+    except OSError:
+        return False
+    return True
+
+
+def _read_spool(path):
+    """
+    Lê um arquivo de spool
+    Retorna: (registros sem confirmação, em ordem; número de confirmações)
+    """
+    entries = {}
+    acked = set()
+    with open(path, 'rb') as f:
+        for raw in f:
+            try:
+                record = json.loads(raw)
+            except ValueError:
+                # Última linha incompleta (queda durante a gravação): nunca foi aceita
+                continue
+            if 'ack' in record:
+                acked.add(record['ack'])
+            else:
+                entries[record['id']] = record
+    return [entry for key, entry in entries.items() if key not in acked], len(acked)
+
+
+class PunchSpool:
+    """
+    Spool durável com uma única thread de aplicação, na ordem de chegada
+
+    submit() não espera o disco nem o banco: retorna um Future com (sucesso,
+    mensagem), resolvido quando o registro é aplicado, recusado ou
+    estacionado; future.accepted é resolvido quando a linha está gravada
+    (fsync) pela thread de gravação. Recusas (sequência inválida,
+    duplicidade) e registros estacionados vão para o log de auditoria.
+    """
+
+    def __init__(self, path, keep_results=True):
+        self.path = path
+        self.parked_path = path[:-len('.jsonl')] + '.parked.jsonl' if path.endswith('.jsonl') \
+            else path + '.parked'
+        self._lock = threading.Lock()  # estado em memória (nunca mantido durante E/S)
+        self._pending = []  # registros gravados aguardando aplicação, em ordem
+        self._futures = {}
+        self._results = queue.Queue() if keep_results else None
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._acked_lines = 0
+        self._io = queue.Queue()  # (linha, Future) para a thread de gravação; None encerra
+        self._closed = False
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600)
+        if not _try_lock(self._fd):
+            os.close(self._fd)
+            raise SpoolInUseError(f"Spool {path} em uso por outro processo")
+        self._replay()
+
+        self._io_thread = threading.Thread(daemon=True, name="marc-punch-spool-io", target=self._write_loop)
+        self._io_thread.start()
+        self._thread = threading.Thread(daemon=True, name="marc-punch-spool", target=self._run)
+        self._thread.start()
+        if self._pending:
+            print(f"⏳ Spool de ponto: {len(self._pending)} registro(s) pendente(s) de {path}")
+            self._wakeup.set()
+
+    @property
+    def pending(self):
+        with self._lock:
+            return len(self._pending)
+
+    def submit(self, emp_id, event_type, timestamp=None):
+        """Aceita o registro sem acessar o banco nem esperar o disco (ver future.accepted)"""
+        if event_type not in EVENT_TYPES:
+            raise ValueError(f"Tipo de evento inválido: {event_type}")
+        timestamp = timestamp or datetime.datetime.now()
+        entry = {
+            'id': uuid.uuid4().hex,
+            'emp_id': int(emp_id),
+            'event_type': event_type,
+            'timestamp': timestamp.isoformat(),
+            'user': current_user(),
+            'accepted_at': datetime.datetime.now().isoformat()
+        }
+        future = Future()
+        future.entry_id = entry['id']
+        with self._lock:
+            self._futures[entry['id']] = future
+        future.accepted = self._write(entry)
+        future.accepted.add_done_callback(lambda written: self._accepted(entry, written.exception()))
+        return future
+
+    def _accepted(self, entry, error):
+        """Linha gravada (na thread de gravação): o registro passa a aguardar aplicação"""
+        if error is None:
+            with self._lock:
+                self._pending.append(entry)
+            self._wakeup.set()
+            return
+        print(f"Erro ao gravar registro no spool {self.path}: {error}")
+        self._resolve(entry, False, f"Registro não gravado no spool: {error}")
+
+    def poll(self):
+        """Resultados prontos: lista de (emp_id, tipo, timestamp, sucesso, mensagem)"""
+        results = []
+        while self._results is not None:
+            try:
+                results.append(self._results.get_nowait())
+            except queue.Empty:
+                break
+        return results
+
+    def stop(self, timeout=30):
+        """Tenta aplicar os pendentes e encerra (o restante fica no arquivo)"""
+        self._stopping.set()
+        self._wakeup.set()
+        self._thread.join(timeout=timeout)
+        with self._lock:
+            self._closed = True
+        self._io.put(None)
+        self._io_thread.join(timeout=timeout)
+        os.close(self._fd)
+
+    # --- Arquivo ---
+    def _write(self, record):
+        """
+        Enfileira uma linha para a thread de gravação
+        Retorna: Future resolvido quando a linha está em disco (fsync)
+        """
+        written = Future()
+        line = (json.dumps(record, ensure_ascii=False) + '\n').encode('utf-8')
+        with self._lock:
+            if self._closed:
+                written.set_exception(SpoolClosedError(f"Spool {self.path} fechado"))
+                return written
+            self._io.put((line, written))
+        return written
+
+    def _write_loop(self):
+        """Grava as linhas enfileiradas; as que chegam juntas compartilham um fsync"""
+        while True:
+            batch = [self._io.get()]
+            while True:
+                try:
+                    batch.append(self._io.get_nowait())
+                except queue.Empty:
+                    break
+            stop = None in batch
+            batch = [item for item in batch if item is not None]
+
+            error = None
+            if batch:
+                try:
+                    os.write(self._fd, b''.join(line for line, _ in batch))
+                    os.fsync(self._fd)
+                except OSError as e:
+                    error = e
+            for _, written in batch:
+                if error is None:
+                    written.set_result(None)
+                else:
+                    written.set_exception(error)
+            if error is None:
+                self._compact()
+            if stop:
+                return
+
+    def _replay(self):
+        """Lê o arquivo (já bloqueado) e recupera os registros ainda sem confirmação"""
+        self._pending, self._acked_lines = _read_spool(self.path)
+
+    def adopt(self, path):
+        """
+        Assume os pendentes de um spool sem dono (processo encerrado)
+
+        Os registros são copiados para este arquivo (fsync) antes de o outro
+        ser esvaziado; uma queda no meio não perde nem duplica registros
+        (mesma chave de idempotência).
+        Retorna: número de registros assumidos (0 se o arquivo está em uso)
+        """
+        try:
+            fd = os.open(path, os.O_RDWR)
+        except OSError:
+            return 0
+        try:
+            if not _try_lock(fd):
+                return 0
+            entries, _ = _read_spool(path)
+            with self._lock:
+                known = {entry['id'] for entry in self._pending}
+            entries = [entry for entry in entries if entry['id'] not in known]
+            # Só esvazia o outro arquivo depois que as cópias estão em disco
+            for written in [self._write(entry) for entry in entries]:
+                written.result()
+            with self._lock:
+                self._pending.extend(entries)
+            os.ftruncate(fd, 0)
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+        if entries:
+            print(f"⏳ Spool de ponto: {len(entries)} registro(s) pendente(s) assumido(s) de {path}")
+            self._wakeup.set()
+        return len(entries)
+
+    def _compact(self):
+        """
+        Esvazia o arquivo quando todos os registros já foram confirmados (na
+        thread de gravação: nenhuma linha gravada está fora de _pending)
+        """
+        with self._lock:
+            if self._pending or self._acked_lines < COMPACT_AFTER or not self._io.empty():
+                return
+            self._acked_lines = 0
+        try:
+            os.ftruncate(self._fd, 0)
+            os.fsync(self._fd)
+        except OSError as e:
+            print(f"Erro ao compactar spool {self.path}: {e}")
+
+    # --- Aplicação ---
+    def _run(self):
+        busy = 0  # tentativas seguidas com o banco ocupado
+        attempts = 0  # tentativas do registro atual com outras falhas
+        while True:
+            self._wakeup.wait()
+            self._wakeup.clear()
+
+            while True:
+                with self._lock:
+                    entry = self._pending[0] if self._pending else None
+                if entry is None:
+                    break
+
+                try:
+                    ok, msg = self._apply(entry)
+                    status = STATUS_APPLIED if ok else STATUS_REJECTED
+                    busy = attempts = 0
+                except Exception as e:
+                    if is_transient_error(e):
+                        # Banco ocupado: vale para todos os registros, manter a ordem
+                        busy += 1
+                        delay = RETRY_MIN_S * 2 ** (busy - 1)
+                    else:
+                        # Falha deste registro (ex: IntegrityError, esquema): tentativas limitadas
+                        attempts += 1
+                        if attempts < MAX_APPLY_ATTEMPTS:
+                            print(f"Erro ao aplicar registro do spool {entry['id']} "
+                                  f"(tentativa {attempts}/{MAX_APPLY_ATTEMPTS}): {e}")
+                        delay = RETRY_MIN_S * 2 ** (attempts - 1)
+                    if attempts < MAX_APPLY_ATTEMPTS:
+                        if self._stopping.is_set():
+                            return
+                        self._stopping.wait(min(RETRY_MAX_S, delay))
+                        continue
+                    ok, msg, status = False, f"{type(e).__name__}: {e}", STATUS_PARKED
+                    busy = attempts = 0
+
+                if not self._finish(entry, ok, msg, status):
+                    if self._stopping.is_set():
+                        return
+                    self._stopping.wait(RETRY_MAX_S)  # confirmação não gravada: disco indisponível
+
+            if self._stopping.is_set():
+                return
+
+    def _apply(self, entry):
+        """Aplica o registro; falhas de banco chegam como exceção (sqlite3.Error)"""
+        timestamp = datetime.datetime.fromisoformat(entry['timestamp'])
+        with session_scope(entry['user'], source='spool'):
+            return record_event(entry['emp_id'], entry['event_type'], timestamp,
+                                idempotency_key=entry['id'], raise_errors=True)
+
+    def _finish(self, entry, ok, msg, status):
+        """
+        Grava a confirmação e resolve o registro
+        Retorna: False se a confirmação não foi gravada (o registro continua pendente)
+        """
+        if status == STATUS_PARKED:
+            # Cópia do registro fora do spool, para ser aplicada depois por um administrador
+            try:
+                with open(self.parked_path, 'a', encoding='utf-8') as f:
+                    f.write(json.dumps(dict(entry, motivo=msg), ensure_ascii=False) + '\n')
+                    f.flush()
+                    os.fsync(f.fileno())
+            except OSError as e:
+                print(f"Erro ao estacionar registro do spool {entry['id']}: {e}")
+                return False
+            log_action(entry['user'], f"Registro do spool estacionado - ID {entry['emp_id']}: {entry['event_type']}",
+                       "evento",
+                       detalhes=f"Chave: {entry['id']}, Horário original: {entry['timestamp']}, "
+                                f"Aceito em: {entry['accepted_at']}, Tentativas: {MAX_APPLY_ATTEMPTS}, "
+                                f"Erro: {msg}, Arquivo: {self.parked_path}",
+                       status='falha')
+            msg = f"Registro não aplicado ({msg}); guardado para revisão"
+        elif not ok:
+            log_action(entry['user'], f"Registro do spool recusado - ID {entry['emp_id']}: {entry['event_type']}",
+                       "evento",
+                       detalhes=f"Chave: {entry['id']}, Horário original: {entry['timestamp']}, "
+                                f"Aceito em: {entry['accepted_at']}, Motivo: {msg}",
+                       status='falha')
+
+        try:
+            self._write({'ack': entry['id'], 'status': status, 'message': msg}).result()
+        except SpoolClosedError:
+            return False  # spool fechado: o registro continua pendente no arquivo
+        except OSError as e:
+            print(f"Erro ao confirmar registro no spool {self.path}: {e}")
+            return False
+
+        with self._lock:
+            self._pending.pop(0)
+            self._acked_lines += 1
+        self._resolve(entry, ok, msg)
+        return True
+
+    def _resolve(self, entry, ok, msg):
+        with self._lock:
+            future = self._futures.pop(entry['id'], None)
+        if future is not None:
+            future.set_result((ok, msg))
+        if self._results is not None:
+            self._results.put((entry['emp_id'], entry['event_type'],
+                               datetime.datetime.fromisoformat(entry['timestamp']), ok, msg))
+
+
+_spools = {}
+_spools_lock = threading.Lock()
+
+
+def get_punch_spool(name='ponto', keep_results=True):
+    """
+    Spool compartilhado do processo para o nome informado (aberto na
+    primeira chamada, quando os pendentes da execução anterior são reaplicados)
+
+    O arquivo fica em SPOOL_DIR e inclui o nome da máquina: cada terminal
+    mantém o seu spool local, mesmo com o banco em uma pasta compartilhada.
+    Se o arquivo está em uso por outro processo da máquina, usa o próximo
+    livre (<nome>_<máquina>_2.jsonl, ...); os pendentes dos demais arquivos
+    livres são assumidos na abertura.
+    keep_results=False para quem não consome poll() (usa apenas os Futures).
+    """
+    with _spools_lock:
+        spool = _spools.get(name)
+        if spool is None:
+            spool = _spools[name] = _open_spool(name, keep_results)
+        return spool
+
+
+def _open_spool(name, keep_results):
+    prefix = f"{name}_{socket.gethostname()}"
+    for slot in range(1, MAX_SPOOL_FILES + 1):
+        filename = f"{prefix}.jsonl" if slot == 1 else f"{prefix}_{slot}.jsonl"
+        try:
+            spool = PunchSpool(os.path.join(SPOOL_DIR, filename), keep_results=keep_results)
+            break
+        except SpoolInUseError:
+            continue
+    else:
+        raise SpoolInUseError(f"Todos os {MAX_SPOOL_FILES} arquivos de spool {prefix} estão em uso")
+
+    # Arquivos de processos que terminaram com registros pendentes
+    pattern = re.compile(rf"{re.escape(prefix)}(_\d+)?\.jsonl")
+    for other in sorted(os.listdir(SPOOL_DIR)):
+        if pattern.fullmatch(other) and other != filename:
+            spool.adopt(os.path.join(SPOOL_DIR, other))
+    return spool
@@ -0,0 +1,169 @@
+"""
+Marc - Teste de Carga de Escrita Concorrente
+Simula vários terminais gravando no mesmo banco ao mesmo tempo (troca de
+turno) e mede a espera pelo bloqueio de escrita de connect_write()
+
+Uso:
+    python stress_db.py --processes 8 --ops 200
+    python stress_db.py --processes 16 --ops 100 --budget 5 --json stress_result.json
+"""
+
+import argparse
+import datetime
+import json
+import multiprocessing
+import os
+import random
+import time
+
+import db
+
+EVENT_TYPES = ['entrada', 'inicio_descanso', 'fim_descanso', 'saida']
+
+
+def terminal(index, args, start, results):
+    """Um terminal: grava registros de ponto, folgas e logs em sequência"""
+    db.DB_FILE = args.db
+    db.WRITE_LOCK_BUDGET = args.budget
+    rnd = random.Random(index)
+
+    # Datas no futuro e distintas por terminal evitam a validação de duplicidade
+    base = datetime.datetime(2100, 1, 1, 8, 0) + datetime.timedelta(days=index * args.ops)
+    failures = []
+    latencies = []
+
+    start.wait()
+    for op in range(args.ops):
+        emp_id = rnd.randint(1, args.employees)
+        t0 = time.perf_counter()
+        roll = rnd.random()
+        if roll < 0.7:
+            ts = base + datetime.timedelta(days=op, minutes=rnd.randint(0, 600))
+            ok, msg = db.record_event_db(emp_id, rnd.choice(EVENT_TYPES), ts, recorded_by=f"terminal{index}")
+        elif roll < 0.85:
+            ok = db.set_day_off_db(emp_id, (base + datetime.timedelta(days=op)).date(),
+                                   set_by=f"terminal{index}")
+            msg = "" if ok else "falha ao marcar folga"
+        else:
+            ok = db.log_action(f"terminal{index}", "Teste de carga", "sistema")
+            msg = "" if ok else "falha ao registrar log"
+        latencies.append((time.perf_counter() - t0) * 1000)
+        if not ok:
+            failures.append(msg)
+
+    results.put({
+        'terminal': index,
+        'failures': failures,
+        'latencies_ms': latencies,
+        'lock_stats': db.get_lock_stats()
+    })
+
+
+def _percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    k = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return round(ordered[k], 1)
+
+
+def prepare_db(path, employees):
+    """Cria um banco limpo com os funcionários do teste"""
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    db.DB_FILE = path
+    db.init_db()
+    conn = db.connect()
+    conn.executemany('INSERT INTO funcionarios (name) VALUES (?)',
+                     [(f"Funcionário {i:05d}",) for i in range(1, employees + 1)])
+    conn.commit()
+    conn.close()
+
+
+def run(args):
+    prepare_db(args.db, args.employees)
+
+    ctx = multiprocessing.get_context('spawn')
+    start = ctx.Event()
+    results = ctx.Queue()
+    processes = [ctx.Process(target=terminal, args=(i, args, start, results))
+                 for i in range(args.processes)]
+    for p in processes:
+        p.start()
+
+    t0 = time.perf_counter()
+    start.set()
+    reports = [results.get() for _ in processes]
+    elapsed = time.perf_counter() - t0
+    for p in processes:
+        p.join()
+
+    stats = db.LockWaitStats()
+    latencies = []
+    failures = []
+    for report in reports:
+        stats.merge(report['lock_stats'])
+        latencies.extend(report['latencies_ms'])
+        failures.extend(report['failures'])
+
+    return {
+        'processes': args.processes,
+        'operations': len(latencies),
+        'elapsed_s': round(elapsed, 2),
+        'ops_per_s': round(len(latencies) / elapsed, 1) if elapsed else None,
+        'failures': len(failures),
+        'failure_samples': sorted(set(failures))[:5],
+        'latency_ms': {'p50': _percentile(latencies, 50), 'p95': _percentile(latencies, 95),
+                       'p99': _percentile(latencies, 99), 'max': _percentile(latencies, 100)},
+        'lock_stats': stats.snapshot()
+    }
+
+
+def print_report(result):
+    lock = result['lock_stats']
+    print()
+    print("=" * 60)
+    print(f"Terminais: {result['processes']} | Operações: {result['operations']} | "
+          f"{result['elapsed_s']}s ({result['ops_per_s']} op/s)")
+    latency = result['latency_ms']
+    print(f"Latência (ms): p50 {latency['p50']} | p95 {latency['p95']} | "
+          f"p99 {latency['p99']} | máx {latency['max']}")
+    print(f"Bloqueios obtidos: {lock['acquired']} | esgotados: {lock['failed']} | "
+          f"novas tentativas: {lock['retries']}")
+    print(f"Espera pelo bloqueio (ms): média {lock['avg_ms']:.1f} | máx {lock['max_ms']:.1f}")
+    print("-" * 60)
+    peak = max((count for _, count in lock['histogram']), default=0) or 1
+    for label, count in lock['histogram']:
+        print(f"{label:>12} {count:>7} {'█' * round(40 * count / peak)}")
+    print("=" * 60)
+    if result['failures']:
+        print(f"✗ {result['failures']} operações falharam: {result['failure_samples']}")
+    else:
+        print("✓ Nenhuma operação falhou")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Teste de carga de escrita concorrente do Marc")
+    parser.add_argument('--processes', type=int, default=8, help='número de terminais simulados')
+    parser.add_argument('--ops', type=int, default=200, help='operações por terminal')
+    parser.add_argument('--employees', type=int, default=200, help='funcionários no banco de teste')
+    parser.add_argument('--budget', type=float, default=db.WRITE_LOCK_BUDGET,
+                        help='tempo máximo (s) para obter o bloqueio de escrita')
+    parser.add_argument('--db', default='stress_ponto.db', help='banco de teste (recriado a cada execução)')
+    parser.add_argument('--json', help='arquivo para salvar os resultados em JSON')
+    args = parser.parse_args()
+
+    result = run(args)
+    print_report(result)
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(result, f, indent=2, ensure_ascii=False)
+        print(f"✓ Resultados salvos em {args.json}")
+
+    raise SystemExit(1 if result['failures'] else 0)
+
+
+if __name__ == "__main__":
+    main()
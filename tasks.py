@@ -0,0 +1,209 @@
+"""
+Marc - Execução de Tarefas em Segundo Plano
+Executa consultas ao banco, bcrypt e cópias de arquivos fora da thread do Tk
+e entrega os resultados de volta à interface através de after()
+"""
+
+import contextvars
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+class Task:
+    """Tarefa submetida ao TaskExecutor"""
+
+    def __init__(self, key, fn, args, kwargs):
+        self.key = key
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.cancel_event = threading.Event()
+        self.future = None
+        self.done = False
+
+    @property
+    def cancelled(self):
+        return self.cancel_event.is_set()
+
+    def cancel(self):
+        """
+        Cancela a tarefa: se ainda não começou, não será executada; se já está
+        em execução, o resultado é descartado (funções que recebem cancel_event
+        podem interromper o trabalho mais cedo)
+        """
+        self.cancel_event.set()
+        if self.future is not None:
+            self.future.cancel()
+
+
+class TaskExecutor:
+    """
+    Executor de tarefas para a interface Tk
+
+    - submit() roda a função em um pool de threads e chama on_success/on_error
+      na thread do Tk (via after)
+    - Requisições com a mesma chave são coalescidas: uma repetição idêntica
+      enquanto a anterior está em andamento é ignorada; com argumentos
+      diferentes, a anterior é cancelada e a mais recente prevalece. Use
+      chaves apenas para leituras: gravações são submetidas com key=None
+      (nunca coalescidas nem canceladas) e o botão em busy
+    - Widgets informados em busy ficam desabilitados durante a execução e
+      on_busy_change recebe o número de tarefas em andamento
+    """
+
+    def __init__(self, root, max_workers=2, poll_ms=50, on_busy_change=None, on_error=None):
+        """
+        Parâmetros:
+        - root: janela Tk que recebe os callbacks
+        - max_workers: número de threads do pool
+        - poll_ms: intervalo de verificação de resultados prontos
+        - on_busy_change: callback(int) chamado quando o número de tarefas muda
+        - on_error: tratador padrão de exceções callback(Task, Exception)
+        """
+        self.root = root
+        self.poll_ms = poll_ms
+        self.on_busy_change = on_busy_change
+        self.on_error = on_error
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="marc-task")
+        self._results = queue.Queue()
+        self._active = {}  # chave -> Task
+        self._callbacks = {}  # Task -> (on_success, on_error, busy)
+        self._polling = False
+        self._closed = False
+
+    @property
+    def busy_count(self):
+        return len(self._callbacks)
+
+    def is_busy(self, key):
+        return key in self._active
+
+    def submit(self, key, fn, *args, on_success=None, on_error=None, busy=None,
+               pass_cancel=False, **kwargs):
+        """
+        Submete uma tarefa (deve ser chamado na thread do Tk)
+
+        Parâmetros:
+        - key: identificador usado para coalescer leituras duplicadas; None
+          para gravações (a tarefa é independente de todas as outras)
+        - fn, args, kwargs: função executada no pool de threads
+        - on_success: callback(resultado) executado na thread do Tk
+        - on_error: callback(exceção) executado na thread do Tk
+        - busy: widgets desabilitados enquanto a tarefa executa
+        - pass_cancel: se True, fn recebe cancel_event=threading.Event
+
+        Retorna: Task
+        """
+        if self._closed:
+            return None
+
+        current = self._active.get(key) if key is not None else None
+        if current is not None and not current.cancelled:
+            if current.fn is fn and current.args == args and current.kwargs == kwargs:
+                return current
+            current.cancel()
+
+        task = Task(key, fn, args, kwargs)
+        if key is None:
+            key = task.key = task  # chave própria: nenhuma outra submissão a alcança
+        busy = list(busy or [])
+        self._active[key] = task
+        self._callbacks[task] = (on_success, on_error, busy)
+        self._set_widgets_state(busy, "disabled")
+        self._notify_busy()
+
+        if pass_cancel:
+            kwargs = dict(kwargs, cancel_event=task.cancel_event)
+
+        # A tarefa roda com a sessão (operador) de quem a submeteu
+        context = contextvars.copy_context()
+
+        def run():
+            if task.cancelled:
+                self._results.put((task, None, None))
+                return
+            try:
+                result = context.run(fn, *args, **kwargs)
+            except Exception as e:
+                self._results.put((task, None, e))
+            else:
+                self._results.put((task, result, None))
+
+        def on_future_done(future):
+            # Tarefa cancelada antes de iniciar nunca chega à fila de resultados
+            if future.cancelled():
+                self._results.put((task, None, None))
+
+        task.future = self._pool.submit(run)
+        task.future.add_done_callback(on_future_done)
+        self._schedule_poll()
+        return task
+
+    def cancel(self, key):
+        """Cancela a tarefa em andamento com a chave informada"""
+        task = self._active.get(key)
+        if task is not None:
+            task.cancel()
+
+    def shutdown(self):
+        """Cancela as tarefas pendentes e encerra o pool sem bloquear a interface"""
+        self._closed = True
+        for task in list(self._active.values()):
+            task.cancel()
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+    # --- Entrega de resultados na thread do Tk ---
+    def _schedule_poll(self):
+        if not self._polling and not self._closed:
+            self._polling = True
+            self.root.after(self.poll_ms, self._drain)
+
+    def _drain(self):
+        self._polling = False
+        if self._closed:
+            return
+
+        while True:
+            try:
+                task, result, error = self._results.get_nowait()
+            except queue.Empty:
+                break
+            self._finish(task, result, error)
+
+        if self._callbacks:
+            self._schedule_poll()
+
+    def _finish(self, task, result, error):
+        if task.done:
+            return
+        task.done = True
+
+        on_success, on_error, busy = self._callbacks.pop(task, (None, None, []))
+        if self._active.get(task.key) is task:
+            del self._active[task.key]
+        # Reabilitar apenas widgets que nenhuma outra tarefa mantém ocupados
+        still_busy = [w for cb in self._callbacks.values() for w in cb[2]]
+        self._set_widgets_state([w for w in busy if w not in still_busy], "normal")
+        self._notify_busy()
+
+        if task.cancelled:
+            return
+
+        if error is not None:
+            handler = on_error or (lambda e: self.on_error and self.on_error(task, e))
+            handler(error)
+        elif on_success is not None:
+            on_success(result)
+
+    def _notify_busy(self):
+        if self.on_busy_change:
+            self.on_busy_change(self.busy_count)
+
+    @staticmethod
+    def _set_widgets_state(widgets, state):
+        for widget in widgets:
+            try:
+                widget.configure(state=state)
+            except Exception:
+                pass
@@ -0,0 +1,87 @@
+"""
+Marc - Tabela da Folha de Ponto
+Atualiza as linhas do Treeview no lugar, apenas onde o dia mudou
+"""
+
+from core_db import EVENT_TYPES, format_timedelta
+
+# Estilos fixos: configurados uma vez, compartilhados por todas as linhas
+ROW_STYLES = {
+    'feriado': "#FFEBEE",
+    'folga': "#E3F2FD"
+}
+
+
+class TimesheetTable:
+    """
+    Exibe os dias de get_timesheet em um ttk.Treeview
+
+    As linhas são identificadas pela posição do dia no mês e reaproveitadas
+    entre consultas: trocar de funcionário ou mês altera apenas as células
+    que mudaram, inserindo ou removendo linhas só quando o número de dias
+    do mês é diferente. A duração vem pronta em day['duration'].
+    """
+
+    def __init__(self, tree):
+        self.tree = tree
+        self._rows = []  # (iid, valores, tags) exibidos por posição
+
+        for tag, background in ROW_STYLES.items():
+            self.tree.tag_configure(tag, background=background)
+
+    @staticmethod
+    def day_row(day):
+        """Valores e tags de uma linha da folha"""
+        flags = []
+        tags = ()
+
+        if day['holiday']:
+            flags.append("🎉 FERIADO")
+            tags = ('feriado',)
+        if day['off']:
+            flags.append("🏖️ FOLGA")
+            tags = ('folga',)
+
+        ev_map = {k: '-' for k in EVENT_TYPES}
+        for e in day['events']:
+            ev_map[e['type']] = e['ts'].strftime('%H:%M')
+
+        values = (
+            day['date'].strftime('%d/%m/%Y'),
+            ev_map['entrada'],
+            ev_map['inicio_descanso'],
+            ev_map['fim_descanso'],
+            ev_map['saida'],
+            format_timedelta(day['duration']) or '-',
+            ", ".join(flags) if flags else "-"
+        )
+        return values, tags
+
+    def update(self, days):
+        """Aplica os dias informados; retorna o número de linhas alteradas"""
+        changed = 0
+
+        for index, day in enumerate(days):
+            values, tags = self.day_row(day)
+
+            if index < len(self._rows):
+                iid, old_values, old_tags = self._rows[index]
+                if old_values == values and old_tags == tags:
+                    continue
+                self.tree.item(iid, values=values, tags=tags)
+            else:
+                iid = self.tree.insert("", "end", values=values, tags=tags)
+
+            self._rows[index:index + 1] = [(iid, values, tags)]
+            changed += 1
+
+        # Mês com menos dias que o exibido anteriormente
+        if len(self._rows) > len(days):
+            self.tree.delete(*[iid for iid, _, _ in self._rows[len(days):]])
+            changed += len(self._rows) - len(days)
+            del self._rows[len(days):]
+
+        return changed
+
+    def clear(self):
+        self.update([])
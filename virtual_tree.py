@@ -0,0 +1,227 @@
+"""
+Marc - Lista Virtual
+Treeview que busca páginas do banco conforme a rolagem e mantém no Tk
+apenas as linhas visíveis
+"""
+
+from collections import OrderedDict
+from tkinter import ttk
+
+
+class VirtualTreeview:
+    """
+    Lista virtual sobre um ttk.Treeview
+
+    - O Treeview tem um número fixo de linhas (height), reaproveitadas a cada
+      rolagem; a barra de rolagem representa o total de registros da consulta
+    - As páginas são buscadas em segundo plano pelo TaskExecutor e mantidas
+      em um cache limitado (max_pages), então a memória não cresce com o total
+    - Estilos de linha usam tags compartilhadas configuradas uma única vez
+    - Ordenação e filtro são responsabilidade da função de busca (no banco);
+      com row_key, a página vizinha de uma já carregada é buscada por chave
+      (after/before) em vez de offset, que só fica para saltos da barra
+    - A seleção acompanha o registro (row_id), não a linha reaproveitada
+    """
+
+    def __init__(self, parent, tasks, key, columns, fetch_page, fetch_count,
+                 format_row, row_tags=None, page_size=200, max_pages=8, height=20,
+                 on_sort=None, row_id=None, row_key=None):
+        """
+        Parâmetros:
+        - parent: widget onde o Treeview e a barra de rolagem são criados
+        - tasks: TaskExecutor usado nas consultas
+        - key: prefixo das chaves de tarefa (coalescência)
+        - columns: títulos das colunas
+        - fetch_page: fetch_page(offset, limit, **query) -> lista de registros;
+          com row_key, também fetch_page(..., after=chave) e (..., before=chave)
+        - fetch_count: fetch_count(**query) -> total de registros
+        - format_row: registro -> valores das colunas
+        - row_tags: registro -> tupla de tags (configuradas com tag_configure)
+        - page_size, max_pages: tamanho de página e páginas mantidas em cache
+        - height: linhas visíveis
+        - on_sort: callback(índice da coluna) ao clicar no cabeçalho
+        - row_id: registro -> identificador único (seleção)
+        - row_key: (registro, query) -> chave da ordenação atual, única
+          (ex: (valor da coluna, id)), para a paginação por chave
+        """
+        self.tasks = tasks
+        self.key = key
+        self.fetch_page = fetch_page
+        self.fetch_count = fetch_count
+        self.format_row = format_row
+        self.row_tags = row_tags or (lambda row: ())
+        self.page_size = page_size
+        self.max_pages = max_pages
+        self.height = height
+        self.row_id = row_id
+        self.row_key = row_key
+
+        self.query = {}
+        self.total = 0
+        self.top = 0
+        self.selected_id = None
+        self._pages = OrderedDict()  # índice da página -> registros
+        self._empty = [''] * len(columns)
+
+        self.tree = ttk.Treeview(parent, columns=columns, show="headings", height=height,
+                                 selectmode="browse")
+        self.scrollbar = ttk.Scrollbar(parent, orient="vertical", command=self._on_scrollbar)
+
+        for index, col in enumerate(columns):
+            self.tree.heading(col, text=col,
+                              command=(lambda i=index: on_sort(i)) if on_sort else None)
+
+        # Linhas fixas, reaproveitadas a cada rolagem
+        self._rows = [self.tree.insert("", "end", iid=f"row{i}", values=self._empty)
+                      for i in range(height)]
+
+        for sequence in ("<MouseWheel>", "<Button-4>", "<Button-5>"):
+            self.tree.bind(sequence, self._on_wheel)
+        self.tree.bind("<Prior>", lambda e: self.scroll(-self.height))
+        self.tree.bind("<Next>", lambda e: self.scroll(self.height))
+        self.tree.bind("<<TreeviewSelect>>", self._on_select)
+
+    def pack(self, **kwargs):
+        self.tree.pack(side="left", **kwargs)
+        self.scrollbar.pack(side="right", fill="y")
+
+    # --- Consulta ---
+    def set_query(self, **query):
+        """Define filtros/ordenação e recarrega a partir do início"""
+        self.query = query
+        self.reload(keep_position=False)
+
+    def reload(self, keep_position=True):
+        """Descarta o cache e busca novamente o total e as páginas visíveis"""
+        self._pages.clear()
+        if not keep_position:
+            self.top = 0
+        query = self.query
+        self.tasks.submit(f'{self.key}_count', self.fetch_count, **query,
+                          on_success=lambda total: self._count_loaded(query, total))
+
+    def _count_loaded(self, query, total):
+        # Resultados de uma consulta anterior (filtro trocado) são descartados
+        if query != self.query:
+            return
+        self.total = total
+        self.top = max(0, min(self.top, total - self.height))
+        self._render()
+
+    def _request_page(self, page):
+        query = self.query
+        cursor = {}
+        if self.row_key is not None:
+            # Continuar de uma página vizinha em cache (sem percorrer offset linhas)
+            previous, following = self._pages.get(page - 1), self._pages.get(page + 1)
+            if previous and len(previous) == self.page_size:
+                cursor['after'] = self.row_key(previous[-1], query)
+            elif following:
+                cursor['before'] = self.row_key(following[0], query)
+        self.tasks.submit(f'{self.key}_page_{page}', self.fetch_page,
+                          page * self.page_size, self.page_size, **query, **cursor,
+                          on_success=lambda rows: self._page_loaded(query, page, rows))
+
+    def _page_loaded(self, query, page, rows):
+        if query != self.query:
+            return
+        self._pages[page] = rows
+        self._pages.move_to_end(page)
+        while len(self._pages) > self.max_pages:
+            self._pages.popitem(last=False)
+        self._render()
+
+    def row_at(self, index):
+        """Registro na posição informada, se a página estiver em cache"""
+        page, offset = divmod(index, self.page_size)
+        rows = self._pages.get(page)
+        if rows is None or offset >= len(rows):
+            return None
+        return rows[offset]
+
+    def visible_rows(self):
+        """Registros atualmente exibidos"""
+        rows = (self.row_at(i) for i in range(self.top, min(self.top + self.height, self.total)))
+        return [row for row in rows if row is not None]
+
+    def selected_row(self):
+        """Registro selecionado, se estiver visível"""
+        if self.row_id is None or self.selected_id is None:
+            return None
+        return next((row for row in self.visible_rows() if self.row_id(row) == self.selected_id), None)
+
+    def _on_select(self, event=None):
+        # Seleção vazia vem do próprio _render (registro fora da janela): mantém selected_id
+        selection = self.tree.selection()
+        if not selection or self.row_id is None:
+            return
+        row = self.row_at(self.top + self._rows.index(selection[0]))
+        if row is not None:
+            self.selected_id = self.row_id(row)
+
+    # --- Rolagem e exibição ---
+    def scroll(self, delta):
+        self.scroll_to(self.top + delta)
+
+    def scroll_to(self, index):
+        top = max(0, min(int(index), self.total - self.height))
+        if top != self.top:
+            self.top = top
+            self._render()
+
+    def _on_scrollbar(self, action, value, unit=None):
+        if action == "moveto":
+            self.scroll_to(float(value) * self.total)
+        elif action == "scroll":
+            step = self.height if unit == "pages" else 1
+            self.scroll(int(value) * step)
+
+    def _on_wheel(self, event):
+        if event.num == 4 or getattr(event, 'delta', 0) > 0:
+            self.scroll(-3)
+        else:
+            self.scroll(3)
+        return "break"
+
+    def _render(self):
+        missing = set()
+        selected = None
+        for i, iid in enumerate(self._rows):
+            index = self.top + i
+            if index >= self.total:
+                self.tree.item(iid, values=self._empty, tags=())
+                continue
+            row = self.row_at(index)
+            if row is None:
+                missing.add(index // self.page_size)
+                self.tree.item(iid, values=["…"] + self._empty[1:], tags=())
+            else:
+                self.tree.item(iid, values=self.format_row(row), tags=self.row_tags(row))
+                if self.row_id is not None and self.selected_id is not None \
+                        and self.row_id(row) == self.selected_id:
+                    selected = iid
+
+        # A seleção segue o registro para a linha onde ele aparece agora
+        if self.row_id is not None:
+            current = self.tree.selection()
+            if selected is not None:
+                if tuple(current) != (selected,):
+                    self.tree.selection_set(selected)
+            elif current:
+                self.tree.selection_remove(*current)
+
+        # Antecipar a próxima página quando a janela se aproxima do fim da atual
+        last = min(self.top + 2 * self.height, self.total) - 1
+        if last >= 0 and self.row_at(last) is None:
+            missing.add(last // self.page_size)
+
+        for page in missing:
+            self._request_page(page)
+        for page in range(self.top // self.page_size, (self.top + self.height) // self.page_size + 1):
+            if page in self._pages:
+                self._pages.move_to_end(page)
+
+        if self.total:
+            self.scrollbar.set(self.top / self.total, min(1.0, (self.top + self.height) / self.total))
+        else:
+            self.scrollbar.set(0.0, 1.0)